@@ -0,0 +1,221 @@
+"""Controle de admissão: recusa rápida (503 + Retry-After) em sobrecarga.
+
+Cada processo conta as requisições em andamento e acompanha a latência
+recente (média móvel exponencial, que decai quando não há amostras) e,
+se ADMISSAO_X_REQUEST_START=1 e o proxy informa X-Request-Start, o tempo
+que a requisição esperou na fila antes de chegar ao worker. As requisições
+são classificadas em:
+
+- essencial: health checks e /metrics, sempre atendidas;
+- fluxo: os streams de /events, fora da contagem: cada um fica aberto por
+  minutos e ocuparia uma vaga o tempo todo; o limite deles é o do Difusor
+  (EVENTOS_MAX_CONEXOES, ver eventos.py);
+- barata: GETs que não dependem de trabalho pesado, como o card do clima
+  em cache. Revalidações com If-None-Match não entram aqui: o cabeçalho é
+  do cliente e só se sabe se vira 304 depois de ler a versão no banco, o
+  que já é o trabalho que a recusa quer evitar;
+- leitura: os demais GET/HEAD;
+- custosa: escritas, exportação/importação e /debug-db.
+
+Uma requisição é recusada quando as em andamento já ocupam o limite da sua
+classe (custosas têm uma fração menor, para sobrar espaço às leituras, e
+baratas podem usar uma das threads de reserva) ou
+quando a latência/espera recente passou do orçamento, caso em que só
+essenciais e baratas entram. As threads acima de ADMISSAO_MAX_CONCORRENTES
+ficam livres para health checks e para as próprias recusas, que não tocam
+no banco.
+"""
+import os
+import time
+import math
+import logging
+import threading
+
+from flask import Blueprint, Response, g, jsonify, request
+
+logger = logging.getLogger(__name__)
+
+admissao = Blueprint('admissao', __name__)
+
+_THREADS = int(os.environ.get('GUNICORN_THREADS', 16))
+# Requisições em andamento por processo; o padrão deixa duas threads de reserva
+ADMISSAO_MAX_CONCORRENTES = int(os.environ.get('ADMISSAO_MAX_CONCORRENTES', max(_THREADS - 2, 1)))
+# Fração do limite que escritas e rotas caras podem ocupar
+ADMISSAO_FRACAO_CUSTOSAS = float(os.environ.get('ADMISSAO_FRACAO_CUSTOSAS', 0.75))
+# Orçamento de latência (segundos) para a média recente e para a espera na fila
+ADMISSAO_LATENCIA_MAXIMA = float(os.environ.get('ADMISSAO_LATENCIA_MAXIMA', 1.0))
+ADMISSAO_RETRY_AFTER = int(os.environ.get('ADMISSAO_RETRY_AFTER', 2))
+ADMISSAO_ATIVA = os.environ.get('ADMISSAO_ATIVA', '1') != '0'
+# Só vale com um proxy que define o cabeçalho (senão o cliente escolhe o valor)
+ADMISSAO_X_REQUEST_START = os.environ.get('ADMISSAO_X_REQUEST_START', '0') == '1'
+
+ROTAS_ESSENCIAIS = ('/health', '/health/live', '/health/ready', '/metrics')
+ROTAS_FLUXO = ('/events',)
+ROTAS_BARATAS = ('/clima',)
+PREFIXOS_CUSTOSOS = ('/export', '/import', '/debug-db')
+
+# Peso da última amostra na média móvel de latência
+ALFA_LATENCIA = 0.1
+# Constante de tempo (s) do decaimento das médias: recusando tudo, não
+# chegam amostras novas e o servidor voltaria a admitir só com isso
+DECAIMENTO_LATENCIA = 2.0
+
+
+def classificar(metodo, caminho):
+    """Classe de prioridade da requisição: essencial, fluxo, barata, leitura ou custosa"""
+    if caminho in ROTAS_ESSENCIAIS:
+        return 'essencial'
+    if caminho in ROTAS_FLUXO:
+        return 'fluxo'
+    if metodo not in ('GET', 'HEAD') or caminho.startswith(PREFIXOS_CUSTOSOS):
+        return 'custosa'
+    if caminho in ROTAS_BARATAS:
+        return 'barata'
+    return 'leitura'
+
+
+def espera_na_fila(cabecalho, agora=None):
+    """Segundos desde X-Request-Start ("t=<epoch>" em s, ms ou µs), ou None"""
+    if not cabecalho:
+        return None
+    valor = cabecalho.strip()
+    if valor.startswith('t='):
+        valor = valor[2:]
+    try:
+        inicio = float(valor)
+    except ValueError:
+        return None
+    # Proxies mandam em segundos, milissegundos ou microssegundos
+    while inicio > 1e11:
+        inicio /= 1000
+    espera = (agora or time.time()) - inicio
+    return espera if espera >= 0 else 0.0
+
+
+class ControleDeAdmissao:
+    def __init__(self, max_concorrentes=ADMISSAO_MAX_CONCORRENTES, fracao_custosas=ADMISSAO_FRACAO_CUSTOSAS,
+                 latencia_maxima=ADMISSAO_LATENCIA_MAXIMA):
+        self.max_concorrentes = max_concorrentes
+        self.limites = {
+            'custosa': max(1, math.floor(max_concorrentes * fracao_custosas)),
+            'leitura': max_concorrentes,
+            'barata': max_concorrentes + 1,
+        }
+        self.latencia_maxima = latencia_maxima
+        self._lock = threading.Lock()
+        self._em_andamento = 0
+        self._latencia_media = 0.0
+        self._espera_media = 0.0
+        self._atualizado_em = time.monotonic()
+        self.admitidas = 0
+        self.recusadas = {}
+
+    def _decair(self):
+        agora = time.monotonic()
+        fator = math.exp(-(agora - self._atualizado_em) / DECAIMENTO_LATENCIA)
+        self._latencia_media *= fator
+        self._espera_media *= fator
+        self._atualizado_em = agora
+
+    @property
+    def sobrecarregado(self):
+        return (self._latencia_media > self.latencia_maxima
+                or self._espera_media > self.latencia_maxima)
+
+    def admitir(self, classe, espera=None):
+        """Reserva uma vaga; retorna None se admitida ou o motivo da recusa"""
+        with self._lock:
+            self._decair()
+            if espera is not None:
+                # Limitada para um valor absurdo não dominar a média
+                amostra = min(espera, 10 * self.latencia_maxima)
+                self._espera_media += ALFA_LATENCIA * (amostra - self._espera_media)
+            motivo = None
+            if classe == 'essencial':
+                pass
+            elif espera is not None and espera > self.latencia_maxima and classe != 'barata':
+                # O cliente já esperou demais: responder agora só desperdiça trabalho
+                motivo = 'queue_wait'
+            elif self._em_andamento >= self.limites[classe]:
+                motivo = 'concurrency'
+            elif classe != 'barata' and self.sobrecarregado:
+                motivo = 'latency'
+
+            if motivo is not None:
+                chave = f'{classe}_{motivo}'
+                self.recusadas[chave] = self.recusadas.get(chave, 0) + 1
+                return motivo
+            self._em_andamento += 1
+            self.admitidas += 1
+            return None
+
+    def registrar_latencia(self, duracao):
+        with self._lock:
+            self._decair()
+            self._latencia_media += ALFA_LATENCIA * (duracao - self._latencia_media)
+
+    def liberar(self):
+        with self._lock:
+            self._em_andamento -= 1
+
+    def stats(self):
+        with self._lock:
+            self._decair()
+            return {
+                'in_flight': self._em_andamento,
+                'max_in_flight': self.max_concorrentes,
+                'max_in_flight_costly': self.limites['custosa'],
+                'latency_ewma_ms': round(self._latencia_media * 1000, 2),
+                'queue_wait_ewma_ms': round(self._espera_media * 1000, 2),
+                'overloaded': self.sobrecarregado,
+                'admitted': self.admitidas,
+                'rejected': dict(self.recusadas),
+            }
+
+
+controle = ControleDeAdmissao()
+
+
+def _recusar(motivo):
+    retry_after = str(ADMISSAO_RETRY_AFTER)
+    mensagem = 'servidor sobrecarregado, tente novamente em instantes'
+    if request.path.startswith('/api/'):
+        response = jsonify({'error': mensagem, 'reason': motivo})
+        response.status_code = 503
+    else:
+        response = Response(mensagem + '\n', status=503, mimetype='text/plain')
+    response.headers['Retry-After'] = retry_after
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@admissao.before_app_request
+def _admitir():
+    if not ADMISSAO_ATIVA:
+        return None
+    classe = classificar(request.method, request.path)
+    if classe == 'fluxo':
+        return None
+    espera = espera_na_fila(request.headers.get('X-Request-Start')) if ADMISSAO_X_REQUEST_START else None
+    motivo = controle.admitir(classe, espera)
+    if motivo is not None:
+        logger.warning(f"🚦 Requisição recusada ({classe}, {motivo}): {request.method} {request.path}")
+        return _recusar(motivo)
+    g._admissao_inicio = time.perf_counter()
+    return None
+
+
+@admissao.after_app_request
+def _medir(response):
+    inicio = g.get('_admissao_inicio')
+    if inicio is not None:
+        # Até a resposta estar pronta: em streams (SSE) não inclui o tempo aberto
+        controle.registrar_latencia(time.perf_counter() - inicio)
+    return response
+
+
+@admissao.teardown_app_request
+def _liberar(exc):
+    # Roda mesmo com exceção; em streams, só quando o stream termina
+    if g.pop('_admissao_inicio', None) is not None:
+        controle.liberar()
@@ -0,0 +1,302 @@
+"""API JSON versionada (/api/v1) para listar e alterar tarefas.
+
+O usuário é o mesmo das páginas: cookie user_id ou, para integrações, o
+cabeçalho X-User-Id. As rotas de lote recebem listas de ids ou de tarefas e
+executam cada operação como um único comando SQL, em uma transação, com o
+resultado de cada item na resposta.
+"""
+import logging
+
+from flask import Blueprint, request, jsonify
+from psycopg2.extras import execute_values
+
+from db import db_connection
+from notificacoes import notificar
+from leituras import registrar_commit
+from tarefas import (COLUNAS, FILTROS, CATEGORIAS, PRIORIDADES, consultar_pagina, consultar_busca,
+                     tamanho_pagina, cursor_pagina, cursor_da_linha, numero_pagina, prazo_informado,
+                     invalidar_caches, tarefa_json, TODAS, restaurar_arquivadas, excluir_arquivadas)
+
+logger = logging.getLogger(__name__)
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+MAX_ITENS_LOTE = 1000
+CAMPOS_ALTERAVEIS = ('descricao', 'categoria', 'prioridade', 'prazo', 'concluida')
+
+
+class ErroValidacao(ValueError):
+    pass
+
+
+class BancoIndisponivel(Exception):
+    pass
+
+
+def _erro(mensagem, status):
+    return jsonify({'error': mensagem}), status
+
+
+def _user_id():
+    return request.headers.get('X-User-Id') or request.cookies.get('user_id')
+
+
+def _validar_campos(dados, parcial=False):
+    """Valida e normaliza os campos de uma tarefa recebida em JSON"""
+    if not isinstance(dados, dict):
+        raise ErroValidacao('cada tarefa deve ser um objeto JSON')
+    desconhecidos = set(dados) - set(CAMPOS_ALTERAVEIS)
+    if desconhecidos:
+        raise ErroValidacao(f"campos desconhecidos: {', '.join(sorted(desconhecidos))}")
+
+    campos = {}
+    if 'descricao' in dados or not parcial:
+        descricao = dados.get('descricao')
+        if not isinstance(descricao, str) or not descricao.strip():
+            raise ErroValidacao('descricao é obrigatória')
+        campos['descricao'] = descricao.strip()
+    if 'categoria' in dados or not parcial:
+        categoria = dados.get('categoria', 'Geral')
+        if categoria not in CATEGORIAS:
+            raise ErroValidacao(f"categoria inválida: {categoria!r}")
+        campos['categoria'] = categoria
+    if 'prioridade' in dados or not parcial:
+        prioridade = dados.get('prioridade', 'Média')
+        if prioridade not in PRIORIDADES:
+            raise ErroValidacao(f"prioridade inválida: {prioridade!r}")
+        campos['prioridade'] = prioridade
+    if 'prazo' in dados or not parcial:
+        prazo = dados.get('prazo')
+        if prazo is not None and not isinstance(prazo, str):
+            raise ErroValidacao('prazo deve ser texto (AAAA-MM-DD) ou null')
+        try:
+            campos['prazo'] = prazo_informado(prazo)
+        except ValueError:
+            raise ErroValidacao(f"prazo inválido (use AAAA-MM-DD): {prazo!r}")
+    if 'concluida' in dados or not parcial:
+        concluida = dados.get('concluida', False)
+        if not isinstance(concluida, bool):
+            raise ErroValidacao('concluida deve ser booleano')
+        campos['concluida'] = concluida
+    return campos
+
+
+def _lista_de_ids(valor):
+    if not isinstance(valor, list) or not valor:
+        raise ErroValidacao('ids deve ser uma lista não vazia')
+    if len(valor) > MAX_ITENS_LOTE:
+        raise ErroValidacao(f'no máximo {MAX_ITENS_LOTE} itens por lote')
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in valor):
+        raise ErroValidacao('ids deve conter apenas inteiros')
+    return list(dict.fromkeys(valor))
+
+
+@api.before_request
+def _exigir_usuario():
+    if not _user_id():
+        return _erro('usuário não identificado (cookie user_id ou cabeçalho X-User-Id)', 401)
+
+
+@api.errorhandler(ErroValidacao)
+def _validacao_falhou(e):
+    return _erro(str(e), 400)
+
+
+@api.errorhandler(BancoIndisponivel)
+def _banco_indisponivel(e):
+    return _erro('banco de dados indisponível', 503)
+
+
+@api.route('/tasks', methods=['GET'])
+def listar():
+    user_id = _user_id()
+    filtro = request.args.get('filter', 'all')
+    if filtro not in FILTROS:
+        raise ErroValidacao(f"filtro inválido: {filtro!r}")
+    limite = tamanho_pagina(request.args.get('limit'))
+    antes_de = cursor_pagina(request.args.get('before'), filtro)
+
+    termo = request.args.get('q', '').strip()
+    pagina = numero_pagina(request.args.get('page'))
+
+    with db_connection() as conn:
+        if conn is None:
+            raise BancoIndisponivel()
+        if termo:
+            rows, tem_proxima = consultar_busca(conn, user_id, termo, filtro, pagina, limite)
+        else:
+            rows, tem_proxima = consultar_pagina(conn, user_id, filtro, antes_de, limite)
+
+    tarefas = [tarefa_json(row) for row in rows]
+    if termo:
+        # Resultados por relevância paginam por número de página (?page=)
+        return jsonify({'tasks': tarefas, 'next_page': pagina + 1 if tem_proxima else None})
+    return jsonify({
+        'tasks': tarefas,
+        'next_cursor': cursor_da_linha(rows[-1], filtro) if tem_proxima else None,
+    })
+
+
+@api.route('/tasks/<int:task_id>', methods=['GET'])
+def obter(task_id):
+    with db_connection() as conn:
+        if conn is None:
+            raise BancoIndisponivel()
+        with conn.cursor() as cur:
+            cur.execute(f'SELECT {COLUNAS} FROM {TODAS} WHERE id = %s AND user_id = %s',
+                        (task_id, _user_id()))
+            row = cur.fetchone()
+    if row is None:
+        return _erro('tarefa não encontrada', 404)
+    return jsonify(tarefa_json(row))
+
+
+@api.route('/tasks', methods=['POST'])
+def criar():
+    resultado, status = _criar_lote([request.get_json(silent=True)])
+    item = resultado['results'][0]
+    if 'error' in item:
+        return _erro(item['error'], 400)
+    return jsonify(item['task']), 201
+
+
+@api.route('/tasks/<int:task_id>', methods=['PATCH'])
+def alterar(task_id):
+    campos = _validar_campos(request.get_json(silent=True), parcial=True)
+    if not campos:
+        raise ErroValidacao('nenhum campo para alterar')
+    resultado, status = _alterar_lote([task_id], campos)
+    if resultado['results'][0]['status'] == 'not_found':
+        return _erro('tarefa não encontrada', 404)
+    return jsonify(resultado['results'][0]['task'])
+
+
+@api.route('/tasks/<int:task_id>', methods=['DELETE'])
+def excluir(task_id):
+    resultado, status = _excluir_lote([task_id])
+    if resultado['results'][0]['status'] == 'not_found':
+        return _erro('tarefa não encontrada', 404)
+    return '', 204
+
+
+@api.route('/tasks/batch', methods=['POST'])
+def criar_lote():
+    dados = request.get_json(silent=True) or {}
+    itens = dados.get('tasks')
+    if not isinstance(itens, list) or not itens:
+        raise ErroValidacao('tasks deve ser uma lista não vazia')
+    if len(itens) > MAX_ITENS_LOTE:
+        raise ErroValidacao(f'no máximo {MAX_ITENS_LOTE} itens por lote')
+    resultado, status = _criar_lote(itens)
+    return jsonify(resultado), status
+
+
+@api.route('/tasks/batch', methods=['PATCH'])
+def alterar_lote():
+    dados = request.get_json(silent=True) or {}
+    ids = _lista_de_ids(dados.get('ids'))
+    campos = _validar_campos(dados.get('changes'), parcial=True)
+    if not campos:
+        raise ErroValidacao('nenhum campo para alterar')
+    resultado, status = _alterar_lote(ids, campos)
+    return jsonify(resultado), status
+
+
+@api.route('/tasks/batch', methods=['DELETE'])
+def excluir_lote():
+    dados = request.get_json(silent=True) or {}
+    resultado, status = _excluir_lote(_lista_de_ids(dados.get('ids')))
+    return jsonify(resultado), status
+
+
+def _criar_lote(itens):
+    """Insere as tarefas válidas com um único INSERT multi-linha"""
+    user_id = _user_id()
+    resultados = [None] * len(itens)
+    validas = []
+    for posicao, item in enumerate(itens):
+        try:
+            campos = _validar_campos(item)
+        except ErroValidacao as e:
+            resultados[posicao] = {'index': posicao, 'status': 'invalid', 'error': str(e)}
+            continue
+        validas.append((posicao, campos))
+
+    if validas:
+        with db_connection() as conn:
+            if conn is None:
+                raise BancoIndisponivel()
+            with conn.cursor() as cur:
+                rows = execute_values(
+                    cur,
+                    'INSERT INTO tarefas (user_id, descricao, categoria, prioridade, prazo, concluida) '
+                    f'VALUES %s RETURNING {COLUNAS}',
+                    [(user_id, c['descricao'], c['categoria'], c['prioridade'], c['prazo'], c['concluida'])
+                     for _, c in validas],
+                    page_size=len(validas),
+                    fetch=True,
+                )
+                notificar(cur, user_id, acao='alterada', ids=[row[0] for row in rows])
+                conn.commit()
+            registrar_commit(conn)
+        invalidar_caches(user_id)
+        for (posicao, _), row in zip(validas, rows):
+            resultados[posicao] = {'index': posicao, 'status': 'created', 'task': tarefa_json(row)}
+
+    logger.info("📦 API: %d de %d tarefas criadas para user_id %s", len(validas), len(itens), user_id[:8])
+    return {'results': resultados}, (201 if len(validas) == len(itens) else 207)
+
+
+def _alterar_lote(ids, campos):
+    """Aplica as mesmas alterações a todas as tarefas do usuário em `ids`"""
+    user_id = _user_id()
+    atribuicoes = ', '.join(f'{campo} = %s' for campo in campos)
+    with db_connection() as conn:
+        if conn is None:
+            raise BancoIndisponivel()
+        with conn.cursor() as cur:
+            # Arquivadas voltam para tarefas antes de serem alteradas
+            restaurar_arquivadas(cur, user_id, ids)
+            cur.execute(
+                f'UPDATE tarefas SET {atribuicoes} WHERE user_id = %s AND id = ANY(%s) RETURNING {COLUNAS}',
+                (*campos.values(), user_id, ids)
+            )
+            alteradas = {row[0]: row for row in cur.fetchall()}
+            if alteradas:
+                notificar(cur, user_id, acao='alterada', ids=list(alteradas))
+            conn.commit()
+        if alteradas:
+            registrar_commit(conn)
+    if alteradas:
+        invalidar_caches(user_id)
+
+    resultados = [
+        {'id': i, 'status': 'updated', 'task': tarefa_json(alteradas[i])} if i in alteradas
+        else {'id': i, 'status': 'not_found'}
+        for i in ids
+    ]
+    return {'results': resultados}, (200 if len(alteradas) == len(ids) else 207)
+
+
+def _excluir_lote(ids):
+    """Exclui todas as tarefas do usuário em `ids` com um único DELETE"""
+    user_id = _user_id()
+    with db_connection() as conn:
+        if conn is None:
+            raise BancoIndisponivel()
+        with conn.cursor() as cur:
+            cur.execute('DELETE FROM tarefas WHERE user_id = %s AND id = ANY(%s) RETURNING id',
+                        (user_id, ids))
+            excluidas = {row[0] for row in cur.fetchall()}
+            if len(excluidas) < len(ids):
+                excluidas.update(excluir_arquivadas(cur, user_id, [i for i in ids if i not in excluidas]))
+            if excluidas:
+                notificar(cur, user_id, acao='removida', ids=list(excluidas))
+            conn.commit()
+        if excluidas:
+            registrar_commit(conn)
+    if excluidas:
+        invalidar_caches(user_id)
+
+    resultados = [{'id': i, 'status': 'deleted' if i in excluidas else 'not_found'} for i in ids]
+    return {'results': resultados}, (200 if len(excluidas) == len(ids) else 207)
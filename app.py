@@ -1,103 +1,85 @@
 import os
-import psycopg2
-from flask import Flask, render_template, request, redirect, url_for, jsonify, make_response
-import requests
-from datetime import datetime
+from flask import Flask, g, render_template, request, redirect, url_for, jsonify, make_response
+from datetime import date, datetime
 import logging
 import uuid
 
-# Configuração de logging mais detalhada
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from db import db_connection, pool_stats
+from leituras import leituras, db_leitura, estado as estado_replica
+from clima import obter_clima, clima_stats
+from tarefas import (COLUNAS, FILTROS, listar_tarefas, buscar_tarefas, tamanho_pagina, cursor_pagina,
+                     numero_pagina, prazo_informado, invalidar_caches, tarefa_json, consultar_tarefas_por_id,
+                     inserir_tarefa, definir_conclusao, excluir_tarefa, excluir_concluidas, LOTE_LIMPEZA)
+from estatisticas import obter_estatisticas, MEMO_TTL as ESTATISTICAS_MEMO_TTL
+from notificacoes import ouvinte
+from cache_tarefas import cache as cache_tarefas
+from api import api
+from exportacao import exportacao
+from metricas import metricas, medir_fase, registrar_coletor
+from saude import saude, verificar_banco, diagnostico_banco
+from eventos import eventos, difusor, renderizar_tarefa
+from versoes import versao_conteudo, etag_pagina, etag_em_cache
+from compressao import compressao
+from admissao import admissao, controle as controle_admissao
+from escritas import executar_escrita, EscritaIndisponivel, commit_em_grupo
+from arquivamento import arquivamento, arquivador
+from migracoes import migrar
+from consultas import stats as consultas_stats
+from logs import logs, configurar as configurar_logs, stats as logs_stats
+
+# Logs em JSON, escritos por uma thread fora da requisição (ver logs.py)
+configurar_logs()
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-key-please-change-in-production')
+# Primeiro: o request_id já existe nos logs dos hooks dos outros blueprints
+app.register_blueprint(logs)
+app.register_blueprint(api)
+app.register_blueprint(exportacao)
+app.register_blueprint(metricas)
+# Logo depois de metricas: as recusas (503) também entram nas métricas
+app.register_blueprint(admissao)
+app.register_blueprint(saude)
+app.register_blueprint(eventos)
+app.register_blueprint(leituras)
+app.register_blueprint(arquivamento)
+# Depois de metricas: os hooks after_request rodam na ordem inversa e o
+# tempo de compressão entra na fase 'compress' da requisição
+app.register_blueprint(compressao)
 
-# Configuração do Banco - Fly.io com PostgreSQL
-def get_db_connection():
-    try:
-        database_url = os.environ.get('DATABASE_URL')
-        
-        if not database_url:
-            logger.error("DATABASE_URL não encontrada")
-            return None
-            
-        # Ajusta a URL se necessário
-        if database_url.startswith("postgres://"):
-            database_url = database_url.replace("postgres://", "postgresql://", 1)
-            
-        conn = psycopg2.connect(database_url)
-        return conn
-    except Exception as e:
-        logger.error(f"❌ Erro ao conectar com o banco: {e}")
-        return None
+registrar_coletor('db_pool', pool_stats)
+registrar_coletor('weather_cache', clima_stats)
+registrar_coletor('task_list_cache', cache_tarefas.stats)
+registrar_coletor('change_listener', ouvinte.stats)
+registrar_coletor('live_events', difusor.stats)
+registrar_coletor('admission', controle_admissao.stats)
+registrar_coletor('group_commit', commit_em_grupo.stats)
+registrar_coletor('read_replica', estado_replica.stats)
+registrar_coletor('archive', arquivador.stats)
+registrar_coletor('prepared_statements', consultas_stats)
+registrar_coletor('logging', logs_stats)
 
 def init_db():
-    """Inicializa o banco de dados - cria a tabela se não existir, SEM apagar dados"""
+    """Aplica as migrações pendentes do esquema - SEM apagar dados"""
     logger.info("🔄 Verificando estrutura do banco de dados...")
-    conn = get_db_connection()
-    if conn is None:
-        logger.error("Não foi possível conectar ao banco para inicialização")
-        return False
-        
-    try:
-        with conn.cursor() as cur:
-            # Criar tabela apenas se não existir 
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS tarefas (
-                    id SERIAL PRIMARY KEY,
-                    user_id TEXT NOT NULL,
-                    descricao TEXT NOT NULL,
-                    categoria TEXT DEFAULT 'Geral',
-                    prioridade TEXT DEFAULT 'Média',
-                    prazo TEXT,
-                    concluida BOOLEAN DEFAULT FALSE,
-                    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Verificar se todas as colunas existem
-            colunas_necessarias = ['user_id', 'categoria', 'prioridade', 'prazo']
-            for coluna in colunas_necessarias:
-                cur.execute("""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name = 'tarefas' AND column_name = %s
-                """, (coluna,))
-                if not cur.fetchone():
-                    logger.info(f"Adicionando coluna faltante: {coluna}")
-                    if coluna == 'user_id':
-                        cur.execute("ALTER TABLE tarefas ADD COLUMN user_id TEXT NOT NULL DEFAULT 'default'")
-                    elif coluna == 'categoria':
-                        cur.execute("ALTER TABLE tarefas ADD COLUMN categoria TEXT DEFAULT 'Geral'")
-                    elif coluna == 'prioridade':
-                        cur.execute("ALTER TABLE tarefas ADD COLUMN prioridade TEXT DEFAULT 'Média'")
-                    elif coluna == 'prazo':
-                        cur.execute("ALTER TABLE tarefas ADD COLUMN prazo TEXT")
-            
-            conn.commit()
-            
-            # Verificar quantas tarefas existem
-            cur.execute("SELECT COUNT(*) FROM tarefas")
-            count = cur.fetchone()[0]
-            logger.info(f"✅ Estrutura do banco verificada. Tarefas totais: {count}")
-            
+    with db_connection() as conn:
+        if conn is None:
+            logger.error("Não foi possível conectar ao banco para inicialização")
+            return False
+        try:
+            migrar(conn)
             return True
-            
-    except Exception as e:
-        logger.error(f"❌ Erro ao verificar estrutura do banco: {e}")
-        conn.rollback()
-        return False
-    finally:
-        if conn:
-            conn.close()
+        except Exception as e:
+            logger.error(f"❌ Erro ao verificar estrutura do banco: {e}")
+            return False
 
 def get_user_id():
     """Obtém o user_id do cookie ou gera um novo"""
     user_id = request.cookies.get('user_id')
     if not user_id:
         user_id = str(uuid.uuid4())
-        logger.info(f"🎉 Novo usuário criado: {user_id}")
+        logger.info("🎉 Novo usuário criado: %s", user_id)
     return user_id
 
 def set_user_cookie(response, user_id):
@@ -105,198 +87,129 @@ def set_user_cookie(response, user_id):
     response.set_cookie('user_id', user_id, max_age=60*60*24*365)  # 1 ano
     return response
 
-def obter_clima(cidade='São Paulo'):
-    """Obtém dados do clima da API OpenWeather - VERSÃO MELHORADA"""
-    try:
-        api_key = os.environ.get('OPENWEATHER_API_KEY')
-        
-        # Log para debug
-        logger.info(f"🌤️ Tentando obter clima para {cidade}")
-        
-        if not api_key:
-            logger.warning("⚠️ OPENWEATHER_API_KEY não encontrada nas variáveis de ambiente")
-            return {
-                'cidade': cidade,
-                'temperatura': '--',
-                'descricao': 'Dados indisponíveis',
-                'icone': '01d',
-                'sensacao': '--',
-                'humidade': '--',
-                'vento': '--',
-                'erro': 'Chave da API não configurada'
-            }
-        
-        # CODIFICAÇÃO DE API
-        
-        if api_key == '00242a4366f2f684e8f901da0d365d44':
-            logger.warning("⚠️ Usando chave da API padrão - pode não funcionar")
-        
-        url = f"http://api.openweathermap.org/data/2.5/weather?q={cidade}&appid={api_key}&units=metric&lang=pt_br"
-        logger.info(f"🌐 Chamando API do clima")
-        
-        response = requests.get(url, timeout=10)
-        logger.info(f"📡 Status da resposta: {response.status_code}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            clima_data = {
-                'cidade': data['name'],
-                'temperatura': round(data['main']['temp']),
-                'descricao': data['weather'][0]['description'].title(),
-                'icone': data['weather'][0]['icon'],
-                'sensacao': round(data['main']['feels_like']),
-                'humidade': data['main']['humidity'],
-                'vento': round(data['wind']['speed'] * 3.6)  # Convertendo m/s para km/h
-            }
-            logger.info(f"✅ Clima obtido: {clima_data['temperatura']}°C em {clima_data['cidade']}")
-            return clima_data
+# Com o memo de estatísticas ligado, a página pode sair com contagens de
+# antes da versão atual; um ETag a manteria no navegador, então fica desligado
+ETAG_ATIVO = os.environ.get('ETAG_ATIVO', '1') != '0' and ESTATISTICAS_MEMO_TTL <= 0
+
+def _versao_da_pagina(user_id):
+    """Versão de conteúdo do usuário para o ETag, ou None se não se aplica.
+
+    Usuários sem cookie acabaram de ganhar um user_id: não há o que revalidar.
+    """
+    if not ETAG_ATIVO or not request.cookies.get('user_id'):
+        return None
+    with db_leitura() as conn:
+        if conn is None:
+            return None
+        return versao_conteudo(conn, user_id)
+
+def _com_etag(response, etag):
+    """ETag forte e revalidação a cada visita (a página muda com as tarefas)"""
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _voltar(user_id, status=204, fragmento=''):
+    """Redirect para a lista ou, nas ações feitas via fetch() pela página,
+    só o status e o fragmento da tarefa alterada (a lista não é recarregada)"""
+    if request.headers.get('X-Requested-With') == 'fetch':
+        response = make_response(fragmento, status)
+    else:
+        response = redirect(url_for('index'))
+    return set_user_cookie(response, user_id)
+
+def _carregar_pagina(user_id, filter_type, antes_de, limite, termo, pagina_busca, hoje):
+    """Busca no banco uma página de tarefas e as estatísticas do usuário.
+
+    Com termo de busca, proximo_cursor é o número da próxima página de
+    resultados; sem ele, é o cursor usado no keyset (?before=).
+    """
+    with db_leitura() as conn:
+        if conn is None:
+            return None
+        if termo:
+            tarefas, tem_proxima = buscar_tarefas(conn, user_id, termo, filter_type,
+                                                  pagina=pagina_busca, limite=limite, hoje=hoje)
+            proximo_cursor = pagina_busca + 1 if tem_proxima else None
         else:
-            logger.error(f"❌ Erro na API do clima: {response.status_code}")
-            return {
-                'cidade': cidade,
-                'temperatura': '--',
-                'descricao': 'Erro na API',
-                'icone': '01d',
-                'sensacao': '--',
-                'humidade': '--',
-                'vento': '--',
-                'erro': f"HTTP {response.status_code}"
-            }
-            
-    except requests.exceptions.Timeout:
-        logger.error("⏰ Timeout ao obter dados do clima")
-        return {
-            'cidade': cidade,
-            'temperatura': '--',
-            'descricao': 'Timeout',
-            'icone': '01d',
-            'sensacao': '--',
-            'humidade': '--',
-            'vento': '--',
-            'erro': 'Timeout'
-        }
-    except requests.exceptions.ConnectionError:
-        logger.error("🔌 Erro de conexão ao obter dados do clima")
-        return {
-            'cidade': cidade,
-            'temperatura': '--',
-            'descricao': 'Sem conexão',
-            'icone': '01d',
-            'sensacao': '--',
-            'humidade': '--',
-            'vento': '--',
-            'erro': 'Connection error'
-        }
-    except Exception as e:
-        logger.error(f"❌ Erro inesperado ao obter clima: {e}")
-        return {
-            'cidade': cidade,
-            'temperatura': '--',
-            'descricao': 'Erro',
-            'icone': '01d',
-            'sensacao': '--',
-            'humidade': '--',
-            'vento': '--',
-            'erro': str(e)
-        }
+            tarefas, proximo_cursor = listar_tarefas(conn, user_id, filter_type,
+                                                     antes_de=antes_de, limite=limite, hoje=hoje)
+        logger.info("📊 Página com %d tarefas para o usuário %s", len(tarefas), user_id[:8])
+        estatisticas = obter_estatisticas(conn, user_id)
+    return tarefas, proximo_cursor, estatisticas
 
 # Rota principal
 @app.route('/')
 def index():
     try:
         filter_type = request.args.get('filter', 'all')
+        if filter_type not in FILTROS:
+            filter_type = 'all'
+        limite = tamanho_pagina(request.args.get('limit'))
+        antes_de = cursor_pagina(request.args.get('before'), filter_type)
+        termo = request.args.get('q', '').strip()
+        pagina_busca = numero_pagina(request.args.get('page'))
         user_id = get_user_id()
         
-        logger.info(f"📱 Usuário {user_id[:8]} acessando a página com filtro: {filter_type}")
-        
-        conn = get_db_connection()
-        if conn is None:
-            logger.error("❌ Falha na conexão com o banco")
-            response = make_response(render_template('index.html', 
-                                 tarefas=[], 
-                                 clima=None,
-                                 total=0, concluidas=0, pendentes=0,
-                                 filter_type=filter_type,
-                                 error="Erro de conexão com o banco de dados",
-                                 user_id=user_id))
-            return set_user_cookie(response, user_id)
-        
-        with conn.cursor() as cur:
-            # Aplicar filtros com user_id
-            if filter_type == 'active':
-                cur.execute('SELECT * FROM tarefas WHERE user_id = %s AND concluida = FALSE ORDER BY id DESC', (user_id,))
-            elif filter_type == 'completed':
-                cur.execute('SELECT * FROM tarefas WHERE user_id = %s AND concluida = TRUE ORDER BY id DESC', (user_id,))
-            else:
-                cur.execute('SELECT * FROM tarefas WHERE user_id = %s ORDER BY id DESC', (user_id,))
-            
-            tarefas_data = cur.fetchall()
-            col_names = [desc[0] for desc in cur.description]  # Obter nomes das colunas
-            logger.info(f"📊 Encontradas {len(tarefas_data)} tarefas para o usuário {user_id[:8]}")
-        
-        # Converter usando mapeamento por nome de coluna
-        tarefas = []
-        for tarefa_row in tarefas_data:
-            # Criar dicionário mapeando nome da coluna para valor
-            tarefa_dict = {}
-            for i, col_name in enumerate(col_names):
-                tarefa_dict[col_name] = tarefa_row[i]
-            
-            # Formatar data_criacao
-            data_criacao = tarefa_dict.get('data_criacao')
-            data_formatada = None
-            
-            if data_criacao:
-                if isinstance(data_criacao, str):
-                    try:
-                        data_obj = datetime.fromisoformat(data_criacao.replace('Z', '+00:00'))
-                        data_formatada = data_obj.strftime('%d/%m/%Y %H:%M')
-                    except (ValueError, AttributeError):
-                        data_formatada = data_criacao
-                else:
-                    data_formatada = data_criacao.strftime('%d/%m/%Y %H:%M')
-            
-            # Mapeamento dos campos
-            tarefa = {
-                'id': tarefa_dict.get('id'),
-                'descricao': tarefa_dict.get('descricao'),
-                'categoria': tarefa_dict.get('categoria', 'Geral'),
-                'prioridade': tarefa_dict.get('prioridade', 'Média'),
-                'prazo': tarefa_dict.get('prazo'),
-                'concluida': bool(tarefa_dict.get('concluida', False)),  # Garantir que é booleano
-                'data_criacao': data_formatada
-            }
-            
-            tarefas.append(tarefa)
-        
-        # Estatísticas
-        total = len(tarefas)
-        concluidas = len([t for t in tarefas if t['concluida']])
-        pendentes = total - concluidas
-        
-        logger.info(f"📈 Estatísticas - Total: {total}, Concluídas: {concluidas}, Pendentes: {pendentes}")
-        
-        # Dados do clima
-        clima = obter_clima()
-        if clima and 'erro' in clima:
-            logger.warning(f"⚠️ Clima com erro: {clima['erro']}")
-        
+        logger.info("📱 Usuário %s acessando a página com filtro: %s", user_id[:8], filter_type)
+        
+        # A data entra na chave: os filtros de prazo e o destaque de atrasadas mudam à meia-noite
+        hoje = date.today()
+        # Versão lida antes das tarefas: se mudar no meio, o ETag só fica velho demais
+        versao_pagina = _versao_da_pagina(user_id)
+        etag = etag_pagina(user_id, versao_pagina, hoje) if versao_pagina is not None else None
+        em_cache = etag_em_cache(etag) if etag else None
+        if em_cache:
+            return set_user_cookie(_com_etag(make_response('', 304), em_cache), user_id)
+        
+        # Com a versão na chave, um aviso de alteração ainda a caminho não faz
+        # o cache entregar a página anterior sob o ETag novo
+        chave_cache = (filter_type, antes_de, limite, termo, pagina_busca, hoje, versao_pagina)
+        pagina = cache_tarefas.obter(user_id, chave_cache)
+        if pagina is None:
+            versao_cache = cache_tarefas.versao(user_id)
+            pagina = _carregar_pagina(user_id, filter_type, antes_de, limite, termo, pagina_busca, hoje)
+            if pagina is None:
+                logger.error("❌ Falha na conexão com o banco")
+                response = make_response(render_template('index.html', 
+                                     tarefas=[], 
+                                     total=0, concluidas=0, pendentes=0,
+                                     filter_type=filter_type,
+                                     error="Erro de conexão com o banco de dados",
+                                     user_id=user_id))
+                return set_user_cookie(response, user_id)
+            # A réplica pode não ter reproduzido a escrita que invalidou o
+            # cache: a página serve a esta resposta, mas não entra nele
+            cache_tarefas.guardar(user_id, chave_cache, versao_cache, pagina,
+                                  da_replica=g.get('leitura_na_replica', False))
+        
+        tarefas, proximo_cursor, estatisticas = pagina
+        total = estatisticas['total']
+        concluidas = estatisticas['concluidas']
+        pendentes = estatisticas['pendentes']
+        
+        logger.info("📈 Estatísticas - Total: %d, Concluídas: %d, Pendentes: %d", total, concluidas, pendentes)
+        
+        # O clima não entra aqui: o index.html busca /clima depois de carregar
         response = make_response(render_template('index.html', 
                              tarefas=tarefas,
-                             clima=clima,
                              total=total,
                              concluidas=concluidas,
                              pendentes=pendentes,
                              filter_type=filter_type,
+                             proximo_cursor=proximo_cursor,
+                             pagina_inicial=antes_de is None and pagina_busca == 1,
+                             limite=limite,
+                             termo=termo,
                              user_id=user_id))
-        return set_user_cookie(response, user_id)
+        return set_user_cookie(_com_etag(response, etag), user_id)
     
     except Exception as e:
         logger.error(f"❌ Erro na rota principal: {e}")
         user_id = get_user_id()
         response = make_response(render_template('index.html', 
                              tarefas=[], 
-                             clima=None,
                              total=0, concluidas=0, pendentes=0,
                              filter_type='all',
                              error=f"Erro interno: {str(e)}",
@@ -309,29 +222,27 @@ def add_task():
         descricao = request.form.get('descricao', '').strip()
         categoria = request.form.get('categoria', 'Geral')
         prioridade = request.form.get('prioridade', 'Média')
-        prazo = request.form.get('prazo', '')
         user_id = get_user_id()
-        
-        logger.info(f"➕ Adicionando tarefa para user_id {user_id[:8]}: {descricao}")
+        try:
+            prazo = prazo_informado(request.form.get('prazo'))
+        except ValueError:
+            logger.warning("Prazo inválido ignorado: %r", request.form.get('prazo'))
+            prazo = None
         
         if not descricao:
             logger.warning("Tentativa de adicionar tarefa sem descrição")
             response = redirect(url_for('index'))
             return set_user_cookie(response, user_id)
         
-        conn = get_db_connection()
-        if conn is None:
+        try:
+            task_id = executar_escrita(inserir_tarefa, user_id, descricao, categoria, prioridade, prazo)
+        except EscritaIndisponivel:
             logger.error("❌ Falha na conexão com o banco ao adicionar tarefa")
             response = redirect(url_for('index'))
             return set_user_cookie(response, user_id)
-        
-        with conn.cursor() as cur:
-            cur.execute(
-                'INSERT INTO tarefas (user_id, descricao, categoria, prioridade, prazo) VALUES (%s, %s, %s, %s, %s)',
-                (user_id, descricao, categoria, prioridade, prazo)
-            )
-            conn.commit()
-            logger.info(f"✅ Tarefa '{descricao}' adicionada com sucesso para user_id {user_id[:8]}!")
+        # Sem a descrição: é conteúdo do usuário e só aumentaria a linha
+        logger.info("➕ Tarefa %s adicionada para user_id %s", task_id, user_id[:8])
+        invalidar_caches(user_id)
         
         response = redirect(url_for('index'))
         return set_user_cookie(response, user_id)
@@ -342,265 +253,228 @@ def add_task():
         response = redirect(url_for('index'))
         return set_user_cookie(response, user_id)
 
+def _alterar_conclusao(user_id, task_id, concluida):
+    """Marca a tarefa como concluída ou pendente; via fetch() responde o fragmento dela"""
+    try:
+        if not executar_escrita(definir_conclusao, user_id, task_id, concluida):
+            return _voltar(user_id, 404)
+    except EscritaIndisponivel:
+        return _voltar(user_id, 503)
+    invalidar_caches(user_id)
+    with db_connection() as conn:
+        if conn is None:
+            # Já gravou; a página recebe a tarefa pelo SSE ou ao recarregar
+            return _voltar(user_id)
+        tarefas = consultar_tarefas_por_id(conn, user_id, [task_id])
+        conn.rollback()
+    if not tarefas:
+        return _voltar(user_id, 404)
+    return _voltar(user_id, 200, renderizar_tarefa(tarefas[0]))
+
 @app.route('/complete/<int:task_id>')
 def complete_task(task_id):
     try:
         user_id = get_user_id()
-        logger.info(f"✅ Completando tarefa {task_id} para user_id {user_id[:8]}")
-        
-        conn = get_db_connection()
-        if conn is None:
-            response = redirect(url_for('index'))
-            return set_user_cookie(response, user_id)
-        
-        with conn.cursor() as cur:
-            cur.execute('UPDATE tarefas SET concluida = TRUE WHERE id = %s AND user_id = %s', (task_id, user_id))
-            conn.commit()
-            logger.info(f"🎯 Tarefa {task_id} marcada como concluída")
-        
-        response = redirect(url_for('index'))
-        return set_user_cookie(response, user_id)
+        response = _alterar_conclusao(user_id, task_id, True)
+        if response.status_code < 400:
+            logger.info("🎯 Tarefa %s marcada como concluída para user_id %s", task_id, user_id[:8])
+        return response
     except Exception as e:
         logger.error(f"Erro ao concluir tarefa: {e}")
-        user_id = get_user_id()
-        response = redirect(url_for('index'))
-        return set_user_cookie(response, user_id)
+        return _voltar(get_user_id(), 500)
 
 @app.route('/reopen/<int:task_id>')
 def reopen_task(task_id):
     try:
         user_id = get_user_id()
-        logger.info(f"🔄 Reabrindo tarefa {task_id} para user_id {user_id[:8]}")
-        
-        conn = get_db_connection()
-        if conn is None:
-            response = redirect(url_for('index'))
-            return set_user_cookie(response, user_id)
-        
-        with conn.cursor() as cur:
-            cur.execute('UPDATE tarefas SET concluida = FALSE WHERE id = %s AND user_id = %s', (task_id, user_id))
-            conn.commit()
-        response = redirect(url_for('index'))
-        return set_user_cookie(response, user_id)
+        logger.info("🔄 Reabrindo tarefa %s para user_id %s", task_id, user_id[:8])
+        return _alterar_conclusao(user_id, task_id, False)
     except Exception as e:
         logger.error(f"Erro ao reabrir tarefa: {e}")
-        user_id = get_user_id()
-        response = redirect(url_for('index'))
-        return set_user_cookie(response, user_id)
+        return _voltar(get_user_id(), 500)
 
 @app.route('/delete/<int:task_id>')
 def delete_task(task_id):
     try:
         user_id = get_user_id()
-        logger.info(f"🗑️ Excluindo tarefa {task_id} para user_id {user_id[:8]}")
-        
-        conn = get_db_connection()
-        if conn is None:
-            response = redirect(url_for('index'))
-            return set_user_cookie(response, user_id)
-        
-        with conn.cursor() as cur:
-            cur.execute('DELETE FROM tarefas WHERE id = %s AND user_id = %s', (task_id, user_id))
-            conn.commit()
-        response = redirect(url_for('index'))
-        return set_user_cookie(response, user_id)
+        logger.info("🗑️ Excluindo tarefa %s para user_id %s", task_id, user_id[:8])
+        
+        try:
+            executar_escrita(excluir_tarefa, user_id, task_id)
+        except EscritaIndisponivel:
+            return _voltar(user_id, 503)
+        invalidar_caches(user_id)
+        return _voltar(user_id)
     except Exception as e:
         logger.error(f"Erro ao excluir tarefa: {e}")
-        user_id = get_user_id()
-        response = redirect(url_for('index'))
-        return set_user_cookie(response, user_id)
+        return _voltar(get_user_id(), 500)
 
 @app.route('/clear_completed')
 def clear_completed():
     try:
         user_id = get_user_id()
-        logger.info(f"🧹 Limpando tarefas concluídas para user_id {user_id[:8]}")
-        
-        conn = get_db_connection()
-        if conn is None:
-            response = redirect(url_for('index'))
-            return set_user_cookie(response, user_id)
-        
-        with conn.cursor() as cur:
-            cur.execute('DELETE FROM tarefas WHERE concluida = TRUE AND user_id = %s', (user_id,))
-            conn.commit()
-        response = redirect(url_for('index'))
-        return set_user_cookie(response, user_id)
+        logger.info("🧹 Limpando tarefas concluídas para user_id %s", user_id[:8])
+        
+        # Em lotes, cada um na sua transação (ver excluir_concluidas)
+        try:
+            while executar_escrita(excluir_concluidas, user_id, LOTE_LIMPEZA) == LOTE_LIMPEZA:
+                pass
+        except EscritaIndisponivel:
+            return _voltar(user_id, 503)
+        invalidar_caches(user_id)
+        return _voltar(user_id)
     except Exception as e:
         logger.error(f"Erro ao limpar concluídas: {e}")
-        user_id = get_user_id()
-        response = redirect(url_for('index'))
-        return set_user_cookie(response, user_id)
+        return _voltar(get_user_id(), 500)
 
 @app.route('/debug-db')
 def debug_db():
     """Página de diagnóstico do banco de dados - MELHORADA"""
     user_id = get_user_id()
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Não foi possível conectar ao banco'}), 500
+    with db_leitura() as conn:
+        if not conn:
+            return jsonify({'error': 'Não foi possível conectar ao banco'}), 500
     
-    try:
-        with conn.cursor() as cur:
-            # Verificar estrutura detalhada da tabela
-            cur.execute("""
-                SELECT 
-                    column_name, 
-                    data_type, 
-                    is_nullable,
-                    column_default,
-                    ordinal_position
-                FROM information_schema.columns 
-                WHERE table_name = 'tarefas'
-                ORDER BY ordinal_position
-            """)
-            columns = cur.fetchall()
-            
-            # Verificar constraints e índices
-            cur.execute("""
-                SELECT 
-                    conname, 
-                    contype,
-                    pg_get_constraintdef(oid) 
-                FROM pg_constraint 
-                WHERE conrelid = 'tarefas'::regclass
-            """)
-            constraints = cur.fetchall()
-            
-            # Contar tarefas do usuário
-            cur.execute("SELECT COUNT(*) FROM tarefas WHERE user_id = %s", (user_id,))
-            user_count = cur.fetchone()[0]
+        try:
+            # Contagens do usuário em uma única consulta
+            estatisticas = obter_estatisticas(conn, user_id)
             
-            # Contar tarefas totais
-            cur.execute("SELECT COUNT(*) FROM tarefas")
-            total_count = cur.fetchone()[0]
-            
-            # Contar tarefas concluídas vs pendentes
-            cur.execute("SELECT COUNT(*) FROM tarefas WHERE user_id = %s AND concluida = TRUE", (user_id,))
-            user_concluidas = cur.fetchone()[0]
-            
-            cur.execute("SELECT COUNT(*) FROM tarefas WHERE user_id = %s AND concluida = FALSE", (user_id,))
-            user_pendentes = cur.fetchone()[0]
-            
-            # Listar tarefas recentes do usuário
-            cur.execute("SELECT * FROM tarefas WHERE user_id = %s ORDER BY id DESC LIMIT 10", (user_id,))
-            recent_tasks = cur.fetchall()
-            col_names = [desc[0] for desc in cur.description]  # Pegar nomes das colunas
+            with conn.cursor() as cur:
+                # Listar tarefas recentes do usuário
+                cur.execute(f"SELECT {COLUNAS} FROM tarefas WHERE user_id = %s ORDER BY id DESC LIMIT 10", (user_id,))
+                recent_tasks = [tarefa_json(row) for row in cur.fetchall()]
             
-        # Mostrar estrutura real das tarefas
-        tasks_formatted = []
-        for task in recent_tasks:
-            task_dict = {}
-            for i, col_name in enumerate(col_names):
-                value = task[i]
-                # Formatar datas
-                if col_name == 'data_criacao' and value:
-                    if isinstance(value, str):
-                        try:
-                            value = datetime.fromisoformat(value.replace('Z', '+00:00')).isoformat()
-                        except (ValueError, AttributeError):
-                            pass
-                    else:
-                        value = value.isoformat()
-                task_dict[col_name] = value
-            tasks_formatted.append(task_dict)
+            # Estrutura da tabela, índices e tamanho estimado vêm do diagnóstico em cache
+            diagnostico, idade = diagnostico_banco()
+            diagnostico = diagnostico or {}
             
-        response = jsonify({
-            'user_id': user_id,
-            'database_connected': True,
-            'table_structure': {
-                'columns': [{
-                    'name': col[0], 
-                    'type': col[1], 
-                    'nullable': col[2],
-                    'default': col[3],
-                    'position': col[4]
-                } for col in columns],
-                'constraints': [{
-                    'name': con[0],
-                    'type': con[1],
-                    'definition': con[2]
-                } for con in constraints]
-            },
-            'statistics': {
-                'user_tasks_count': user_count,
-                'user_completed_tasks': user_concluidas,
-                'user_pending_tasks': user_pendentes,
-                'total_tasks_count': total_count
-            },
-            'recent_tasks_raw_structure': {
-                'column_names': col_names,
-                'tasks': tasks_formatted
-            }
-        })
-        return set_user_cookie(response, user_id)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
+            response = jsonify({
+                'user_id': user_id,
+                'database_connected': True,
+                'table_structure': {
+                    'columns': diagnostico.get('columns'),
+                    'constraints': diagnostico.get('constraints'),
+                    'indexes': diagnostico.get('indexes'),
+                    'total_size_bytes': diagnostico.get('total_size_bytes'),
+                },
+                'schema_version': diagnostico.get('schema_version'),
+                'diagnostics_age_s': round(idade, 1) if idade is not None else None,
+                'statistics': {
+                    'user_tasks_count': estatisticas['total'],
+                    'user_completed_tasks': estatisticas['concluidas'],
+                    'user_pending_tasks': estatisticas['pendentes'],
+                    'user_tasks_by_category': estatisticas['por_categoria'],
+                    'user_tasks_by_priority': estatisticas['por_prioridade'],
+                    # Estimativa de pg_class.reltuples, sem COUNT(*) na tabela toda
+                    'total_tasks_estimate': diagnostico.get('estimated_rows')
+                },
+                'recent_tasks_raw_structure': {
+                    'column_names': COLUNAS.split(', '),
+                    'tasks': recent_tasks
+                },
+                'connection_pool': pool_stats(),
+                'read_replica': estado_replica.stats(),
+                'prepared_statements': consultas_stats(),
+                'weather_cache': clima_stats(),
+                'task_list_cache': cache_tarefas.stats(),
+                'change_listener': ouvinte.stats()
+            })
+            return set_user_cookie(response, user_id)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
 
 @app.route('/meu-perfil')
 def meu_perfil():
     user_id = get_user_id()
-    conn = get_db_connection()
-    if not conn:
-        response = make_response(render_template('perfil.html', 
-                              user_id=user_id,
-                              tarefas_count=0,
-                              error="Erro de conexão com o banco"))
-        return set_user_cookie(response, user_id)
+    versao = _versao_da_pagina(user_id)
+    etag = etag_pagina(user_id, versao) if versao is not None else None
+    em_cache = etag_em_cache(etag) if etag else None
+    if em_cache:
+        return set_user_cookie(_com_etag(make_response('', 304), em_cache), user_id)
+    with db_leitura() as conn:
+        if not conn:
+            response = make_response(render_template('perfil.html', 
+                                  user_id=user_id,
+                                  tarefas_count=0,
+                                  error="Erro de conexão com o banco"))
+            return set_user_cookie(response, user_id)
     
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM tarefas WHERE user_id = %s", (user_id,))
-            total = cur.fetchone()[0]
-            
-            cur.execute("SELECT COUNT(*) FROM tarefas WHERE user_id = %s AND concluida = TRUE", (user_id,))
-            concluidas = cur.fetchone()[0]
-            
-            cur.execute("SELECT COUNT(*) FROM tarefas WHERE user_id = %s AND concluida = FALSE", (user_id,))
-            pendentes = cur.fetchone()[0]
-        
-        response = make_response(render_template('perfil.html',
-                              user_id=user_id,
-                              tarefas_count=total,
-                              concluidas=concluidas,
-                              pendentes=pendentes))
-        return set_user_cookie(response, user_id)
-    except Exception as e:
-        response = make_response(render_template('perfil.html',
-                              user_id=user_id,
-                              tarefas_count=0,
-                              error=str(e)))
-        return set_user_cookie(response, user_id)
+        try:
+            estatisticas = obter_estatisticas(conn, user_id)
+        
+            response = make_response(render_template('perfil.html',
+                                  user_id=user_id,
+                                  tarefas_count=estatisticas['total'],
+                                  concluidas=estatisticas['concluidas'],
+                                  pendentes=estatisticas['pendentes'],
+                                  por_categoria=estatisticas['por_categoria'],
+                                  por_prioridade=estatisticas['por_prioridade']))
+            return set_user_cookie(_com_etag(response, etag), user_id)
+        except Exception as e:
+            response = make_response(render_template('perfil.html',
+                                  user_id=user_id,
+                                  tarefas_count=0,
+                                  error=str(e)))
+            return set_user_cookie(response, user_id)
+
+@app.route('/clima')
+def clima():
+    """Card do clima (HTML) ou, com ?format=json, os dados em JSON.
+
+    Fica fora do index() para que a página não espere pela API do clima.
+    """
+    with medir_fase('weather'):
+        dados = obter_clima()
+    if 'erro' in dados:
+        logger.warning(f"⚠️ Clima com erro: {dados['erro']}")
+    if request.args.get('format') == 'json':
+        response = jsonify(dados)
+    else:
+        response = make_response(render_template('_clima.html', clima=dados))
+    # Dado igual para todos os usuários; o navegador pode reaproveitar por um minuto
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response
+
+def _resumo_replica():
+    """Estado da réplica de leitura que este processo já conhece (sem consultar)"""
+    replica = estado_replica.stats()
+    if not replica['configured']:
+        return None
+    return {'available': replica['down_for_s'] == 0, 'replay_lag_s': replica['replay_lag_s']}
 
 @app.route('/health')
 def health():
-    try:
-        conn = get_db_connection()
-        if conn:
-            with conn.cursor() as cur:
-                cur.execute('SELECT COUNT(*) FROM tarefas')
-                count = cur.fetchone()[0]
-            conn.close()
-            return jsonify({
-                'status': 'healthy',
-                'database': 'connected',
-                'tarefas_count': count,
-                'timestamp': datetime.now().isoformat()
-            }), 200
-        else:
-            return jsonify({
-                'status': 'unhealthy',
-                'database': 'disconnected',
-                'timestamp': datetime.now().isoformat()
-            }), 500
-    except Exception as e:
+    """Readiness com SELECT 1 (ver saude.py) e o tamanho estimado da tabela.
+
+    /health/live não toca no banco; o fly.toml checa /health/ready. A
+    réplica de leitura só é informada: sem ela as leituras vão ao primário.
+    """
+    banco = verificar_banco()
+    if not banco['ok']:
         return jsonify({
-            'status': 'error',
-            'error': str(e),
+            'status': 'unhealthy',
+            'database': 'disconnected',
+            'error': banco.get('error'),
             'timestamp': datetime.now().isoformat()
-        }), 500
+        }), 503
+    diagnostico, _ = diagnostico_banco()
+    return jsonify({
+        'status': 'healthy',
+        'database': 'connected',
+        'db_latency_ms': banco['latency_ms'],
+        'tarefas_estimadas': diagnostico['estimated_rows'] if diagnostico else None,
+        'replica': _resumo_replica(),
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
+def precompilar_templates():
+    """Compila todos os templates agora, em vez de na primeira requisição.
+
+    Com preload_app (gunicorn.conf.py) isso roda uma vez no mestre e os
+    workers já nascem com os templates compilados.
+    """
+    for nome in app.jinja_env.list_templates():
+        app.jinja_env.get_template(nome)
 
 # Inicialização
 if __name__ == '__main__':
@@ -609,4 +483,8 @@ if __name__ == '__main__':
     app.run(host='0.0.0.0', port=port, debug=False)
 else:
     logger.info("🚀 Iniciando aplicação com Gunicorn...")
-    init_db()
\ No newline at end of file
+    # Em máquinas que escalam a zero as migrações rodam no release_command
+    # (fly.toml) e MIGRAR_NA_PARTIDA=0 tira essa ida ao banco da partida
+    if os.environ.get('MIGRAR_NA_PARTIDA', '1') != '0':
+        init_db()
+    precompilar_templates()
\ No newline at end of file
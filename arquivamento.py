@@ -0,0 +1,189 @@
+"""Arquivamento das tarefas concluídas antigas (armazenamento quente/frio).
+
+Concluídas há mais de ARQUIVO_IDADE_DIAS dias (pelo concluida_em mantido
+pelo gatilho da migração 7; as anteriores a ela, pela data de criação) saem
+de `tarefas` e vão para `tarefas_arquivadas`, particionada por hash do
+user_id. Assim a tabela quente, seus índices e o caminho de filter=active
+ficam do tamanho das tarefas em uso.
+
+Cada lote é uma transação curta: um único comando move até ARQUIVO_LOTE
+linhas (FOR UPDATE SKIP LOCKED, sem esperar quem está editando uma delas) e
+soma as contagens em contagem_arquivadas, usadas pelas estatísticas. Para
+o usuário nada muda: os filtros all/completed, a busca e a exportação leem
+a view tarefas_todas, e as estatísticas somam o arquivo. Por isso o
+arquivamento não incrementa versões nem avisa os workers.
+
+Cada processo tem uma thread que roda a cada ARQUIVO_INTERVALO segundos;
+um advisory lock por lote faz com que só um processo arquive por vez.
+Uso manual (uma rodada completa): python arquivamento.py
+"""
+import os
+import time
+import random
+import logging
+import threading
+
+from flask import Blueprint
+
+from db import db_connection, get_database_url
+from tarefas import COLUNAS_ARQUIVO
+
+logger = logging.getLogger(__name__)
+
+arquivamento = Blueprint('arquivamento', __name__)
+
+ARQUIVO_ATIVO = os.environ.get('ARQUIVO_ATIVO', '1') != '0'
+ARQUIVO_IDADE_DIAS = float(os.environ.get('ARQUIVO_IDADE_DIAS', 30))
+ARQUIVO_LOTE = int(os.environ.get('ARQUIVO_LOTE', 500))
+ARQUIVO_INTERVALO = float(os.environ.get('ARQUIVO_INTERVALO', 600))
+# Pausa entre lotes, para o arquivamento não competir com as requisições
+ARQUIVO_PAUSA_ENTRE_LOTES = float(os.environ.get('ARQUIVO_PAUSA_ENTRE_LOTES', 0.05))
+
+# Chave do pg_try_advisory_xact_lock de cada lote (a das migrações é 7432001)
+LOCK_ARQUIVAMENTO = 7432002
+
+SQL_ARQUIVAR = f'''
+    WITH movidas AS (
+        DELETE FROM tarefas WHERE id IN (
+            SELECT id FROM tarefas
+            WHERE concluida = TRUE
+              AND coalesce(concluida_em, data_criacao) < CURRENT_TIMESTAMP - %(idade)s * INTERVAL '1 day'
+            ORDER BY coalesce(concluida_em, data_criacao)
+            LIMIT %(lote)s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING {COLUNAS_ARQUIVO}
+    ), arquivadas AS (
+        INSERT INTO tarefas_arquivadas ({COLUNAS_ARQUIVO})
+        SELECT {COLUNAS_ARQUIVO} FROM movidas
+    ), contadas AS (
+        INSERT INTO contagem_arquivadas (user_id, categoria, prioridade, total)
+        SELECT user_id, coalesce(categoria, 'Geral'), coalesce(prioridade, 'Média'), count(*)
+        FROM movidas
+        GROUP BY 1, 2, 3
+        ON CONFLICT (user_id, categoria, prioridade)
+        DO UPDATE SET total = contagem_arquivadas.total + EXCLUDED.total
+    )
+    SELECT count(*) FROM movidas
+'''
+
+
+class Arquivador:
+    """Thread deste processo que arquiva as concluídas antigas em lotes"""
+
+    def __init__(self, idade_dias=ARQUIVO_IDADE_DIAS, lote=ARQUIVO_LOTE, intervalo=ARQUIVO_INTERVALO,
+                 pausa=ARQUIVO_PAUSA_ENTRE_LOTES):
+        self.idade_dias = idade_dias
+        self.lote = max(1, lote)
+        self.intervalo = intervalo
+        self.pausa = pausa
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._parar = threading.Event()
+        self.rodadas = 0
+        self.lotes = 0
+        self.arquivadas = 0
+        self.lote_mais_longo = 0.0
+        self.ocupado = 0
+        self.ultima_rodada = None
+        self.ultimo_erro = None
+
+    def iniciar(self):
+        """Inicia a thread deste processo, se ainda não estiver rodando"""
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == pid and self._thread is not None:
+                return
+            if not ARQUIVO_ATIVO or not get_database_url():
+                return
+            self._parar.clear()
+            self._pid = pid
+            self._thread = threading.Thread(target=self._executar, name='arquivamento', daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+
+    def _executar(self):
+        # Workers que sobem juntos não começam todos no mesmo instante
+        if self._parar.wait(random.uniform(0, min(self.intervalo, 60))):
+            return
+        while not self._parar.is_set():
+            try:
+                self.rodada()
+            except Exception as e:
+                self.ultimo_erro = str(e).strip()
+                logger.error(f"❌ Erro no arquivamento de tarefas: {e}")
+            self._parar.wait(self.intervalo)
+
+    def arquivar_lote(self):
+        """Move um lote; retorna quantas tarefas, ou None se outro processo está arquivando"""
+        inicio = time.perf_counter()
+        with db_connection() as conn:
+            if conn is None:
+                raise RuntimeError('sem conexão com o banco')
+            with conn.cursor() as cur:
+                cur.execute('SELECT pg_try_advisory_xact_lock(%s)', (LOCK_ARQUIVAMENTO,))
+                if not cur.fetchone()[0]:
+                    conn.rollback()
+                    with self._lock:
+                        self.ocupado += 1
+                    return None
+                cur.execute(SQL_ARQUIVAR, {'idade': self.idade_dias, 'lote': self.lote})
+                movidas = cur.fetchone()[0]
+            conn.commit()
+        duracao = time.perf_counter() - inicio
+        with self._lock:
+            self.lotes += 1
+            self.arquivadas += movidas
+            self.lote_mais_longo = max(self.lote_mais_longo, duracao)
+        return movidas
+
+    def rodada(self):
+        """Arquiva lotes até não sobrar candidata; retorna quantas tarefas moveu"""
+        total = 0
+        while not self._parar.is_set():
+            movidas = self.arquivar_lote()
+            if movidas is None:
+                break
+            total += movidas
+            if movidas < self.lote:
+                break
+            time.sleep(self.pausa)
+        with self._lock:
+            self.rodadas += 1
+            self.ultima_rodada = time.time()
+        if total:
+            logger.info(f"🗄️ {total} tarefas concluídas arquivadas")
+        return total
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': ARQUIVO_ATIVO,
+                'age_days': self.idade_dias,
+                'batch_size': self.lote,
+                'runs': self.rodadas,
+                'batches': self.lotes,
+                'archived': self.arquivadas,
+                'longest_batch_ms': round(self.lote_mais_longo * 1000, 2),
+                'skipped_locked': self.ocupado,
+                'last_run_s_ago': round(time.time() - self.ultima_rodada, 1) if self.ultima_rodada else None,
+                'last_error': self.ultimo_erro,
+            }
+
+
+arquivador = Arquivador()
+
+
+@arquivamento.before_app_request
+def _iniciar_arquivador():
+    arquivador.iniciar()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    print(f'{arquivador.rodada()} tarefas arquivadas')
@@ -0,0 +1,171 @@
+"""Arquivamento das concluídas antigas e limpeza em lotes (ver arquivamento.py).
+
+Cria --usuarios usuários com --tarefas tarefas cada, das quais a fração
+--concluidas está concluída há --idade-dias dias, e mede as consultas das
+páginas direto no banco (sem os caches da aplicação):
+- filter=active, filter=completed (que passa a ler a view tarefas_todas) e
+  as estatísticas, antes e depois de uma rodada do Arquivador (seguida de
+  VACUUM, como faria o autovacuum);
+- a limpeza de --limpeza concluídas de um usuário num único DELETE (como
+  era o /clear_completed) e em lotes de LOTE_LIMPEZA, com a transação mais
+  longa de cada um.
+
+A rodada arquiva todas as concluídas antigas do banco, não só as criadas
+aqui: use um Postgres de teste em DATABASE_URL.
+    python benchmarks/bench_arquivamento.py --usuarios 20 --tarefas 5000
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_carga import percentil, popular, limpar  # noqa: E402
+
+
+def envelhecer(prefixo, idade_dias):
+    """Recua o concluida_em das concluídas criadas pelo benchmark"""
+    from db import db_connection
+
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute('''
+                UPDATE tarefas SET concluida_em = CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+                WHERE user_id LIKE %s AND concluida
+            ''', (idade_dias, prefixo + '%'))
+        conn.commit()
+    manutencao('ANALYZE tarefas')
+
+
+def manutencao(sql):
+    from db import db_connection
+
+    with db_connection() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+        finally:
+            conn.autocommit = False
+
+
+def resumir(tempos):
+    tempos.sort()
+    return {'p50_ms': round(statistics.median(tempos) * 1000, 3),
+            'p95_ms': round(percentil(tempos, 95) * 1000, 3)}
+
+
+def medir_leituras(usuarios, repeticoes, semente):
+    from db import db_connection
+    from tarefas import consultar_pagina, COLUNAS_TAREFA
+    from estatisticas import calcular_estatisticas
+
+    aleatorio = random.Random(semente)
+    consultas = {
+        'active_page': lambda conn, u: consultar_pagina(conn, u, 'active', colunas=COLUNAS_TAREFA),
+        'completed_page': lambda conn, u: consultar_pagina(conn, u, 'completed', colunas=COLUNAS_TAREFA),
+        'stats': calcular_estatisticas,
+    }
+    tempos = {nome: [] for nome in consultas}
+    with db_connection() as conn:
+        for _ in range(repeticoes):
+            user_id = aleatorio.choice(usuarios)
+            for nome, consulta in consultas.items():
+                inicio = time.perf_counter()
+                consulta(conn, user_id)
+                tempos[nome].append(time.perf_counter() - inicio)
+            conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_relation_size('tarefas'), (SELECT count(*) FROM tarefas)")
+            tamanho, linhas = cur.fetchone()
+        conn.rollback()
+    resultado = {nome: resumir(amostras) for nome, amostras in tempos.items()}
+    resultado['hot_table'] = {'rows': linhas, 'mb': round(tamanho / 1024 / 1024, 1)}
+    return resultado
+
+
+def medir_limpeza(prefixo, tarefas):
+    """Mesma limpeza de `tarefas` concluídas: um DELETE x lotes de LOTE_LIMPEZA"""
+    from db import db_connection
+    from escritas import _executar_direto
+    from tarefas import excluir_concluidas, LOTE_LIMPEZA
+
+    resultado = {}
+    for modo in ('single_delete', 'batched'):
+        user_id = f'{prefixo}limpeza-{modo}'
+        popular(user_id, 1, tarefas, 1.0)
+        transacoes = []
+        inicio = time.perf_counter()
+        if modo == 'single_delete':
+            with db_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute('DELETE FROM tarefas WHERE user_id = %s AND concluida = TRUE', (user_id + '1',))
+                conn.commit()
+            transacoes.append(time.perf_counter() - inicio)
+        else:
+            while True:
+                comeco = time.perf_counter()
+                excluidas, _ = _executar_direto(excluir_concluidas, user_id + '1', LOTE_LIMPEZA)
+                transacoes.append(time.perf_counter() - comeco)
+                if excluidas < LOTE_LIMPEZA:
+                    break
+        resultado[modo] = {
+            'total_ms': round((time.perf_counter() - inicio) * 1000, 1),
+            'transactions': len(transacoes),
+            'longest_transaction_ms': round(max(transacoes) * 1000, 1),
+        }
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--usuarios', type=int, default=20)
+    parser.add_argument('--tarefas', type=int, default=5000)
+    parser.add_argument('--concluidas', type=float, default=0.8)
+    parser.add_argument('--idade-dias', type=float, default=60)
+    parser.add_argument('--lote', type=int, default=500, help='tamanho do lote do Arquivador')
+    parser.add_argument('--repeticoes', type=int, default=200)
+    parser.add_argument('--limpeza', type=int, default=20000, help='concluídas do usuário da limpeza')
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', help='arquivo para gravar o JSON do resultado')
+    args = parser.parse_args()
+
+    from app import init_db
+    from arquivamento import Arquivador
+    init_db()
+
+    prefixo = f'bench-arquivo-{uuid.uuid4().hex[:8]}-'
+    resultado = {'users': args.usuarios, 'tasks_per_user': args.tarefas, 'completed': args.concluidas}
+    try:
+        usuarios = list(popular(prefixo, args.usuarios, args.tarefas, args.concluidas))
+        envelhecer(prefixo, args.idade_dias)
+        resultado['before'] = medir_leituras(usuarios, args.repeticoes, args.semente)
+
+        arquivador = Arquivador(idade_dias=min(args.idade_dias / 2, 30), lote=args.lote, pausa=0)
+        inicio = time.perf_counter()
+        arquivador.rodada()
+        resultado['archival'] = {'elapsed_s': round(time.perf_counter() - inicio, 2),
+                                 **{chave: valor for chave, valor in arquivador.stats().items()
+                                    if chave in ('batch_size', 'batches', 'archived', 'longest_batch_ms')}}
+        manutencao('VACUUM ANALYZE tarefas')
+        manutencao('ANALYZE tarefas_arquivadas')
+        resultado['after'] = medir_leituras(usuarios, args.repeticoes, args.semente)
+
+        resultado['clear_completed'] = medir_limpeza(prefixo, args.limpeza)
+    finally:
+        limpar(prefixo)
+
+    saida = json.dumps(resultado, indent=2)
+    print(saida)
+    if args.saida:
+        with open(args.saida, 'w') as arquivo:
+            arquivo.write(saida + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark da busca textual (websearch_to_tsquery + GIN) em tarefas.
+
+Gera --linhas tarefas sintéticas (padrão 1.000.000) distribuídas entre
+--usuarios usuários, com descrições montadas a partir de um vocabulário em
+português, e mede a latência de buscar_tarefas() para termos comuns e raros,
+com e sem filtro de status. Imprime p50/p95/p99 em milissegundos.
+
+Uso (precisa de um Postgres de teste em DATABASE_URL):
+    python benchmarks/bench_busca.py --linhas 1000000 --usuarios 1000
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import init_db  # noqa: E402
+from db import db_connection  # noqa: E402
+from tarefas import buscar_tarefas  # noqa: E402
+
+VERBOS = ['comprar', 'estudar', 'pagar', 'revisar', 'ligar', 'enviar', 'organizar', 'limpar',
+          'agendar', 'preparar', 'consertar', 'ler', 'escrever', 'visitar', 'treinar', 'planejar']
+OBJETOS = ['relatório', 'contas', 'mercado', 'prova', 'médico', 'carro', 'apresentação', 'garagem',
+           'reunião', 'livro', 'projeto', 'viagem', 'orçamento', 'academia', 'dentista', 'cozinha',
+           'documentos', 'presentes', 'jardim', 'contrato']
+COMPLEMENTOS = ['hoje', 'amanhã', 'semana que vem', 'com a equipe', 'do cliente', 'da escola',
+                'urgente', 'antes do feriado', 'no centro', 'pelo aplicativo']
+
+CONSULTAS = {
+    'comum': ['comprar', 'relatório', 'reunião equipe', 'pagar contas'],
+    'frase': ['"apresentação do cliente"', '"consertar carro"'],
+    'raro': ['xilofone', 'orçamento -viagem'],
+}
+
+
+def popular(prefixo, linhas, usuarios):
+    """Insere as tarefas sintéticas no próprio Postgres (generate_series)"""
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute('''
+                INSERT INTO tarefas (user_id, descricao, categoria, concluida)
+                SELECT %(prefixo)s || (n %% %(usuarios)s),
+                       initcap((%(verbos)s::text[])[1 + floor(random() * cardinality(%(verbos)s))::int]) || ' ' ||
+                       (%(objetos)s::text[])[1 + floor(random() * cardinality(%(objetos)s))::int] || ' ' ||
+                       (%(complementos)s::text[])[1 + floor(random() * cardinality(%(complementos)s))::int] ||
+                       CASE WHEN n %% 50000 = 0 THEN ' xilofone' ELSE '' END,
+                       (ARRAY['Trabalho','Estudo','Casa','Saúde','Lazer','Geral'])[1 + n %% 6],
+                       n %% 3 = 0
+                FROM generate_series(1, %(linhas)s) n
+            ''', {'prefixo': prefixo, 'usuarios': usuarios, 'linhas': linhas,
+                  'verbos': VERBOS, 'objetos': OBJETOS, 'complementos': COMPLEMENTOS})
+        conn.commit()
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('ANALYZE tarefas')
+        finally:
+            conn.autocommit = False
+
+
+def percentil(amostras, p):
+    ordenadas = sorted(amostras)
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, default=1000000)
+    parser.add_argument('--usuarios', type=int, default=1000)
+    parser.add_argument('--repeticoes', type=int, default=200,
+                        help='buscas por tipo de consulta')
+    args = parser.parse_args()
+
+    init_db()
+    prefixo = f'bench-busca-{uuid.uuid4()}-'
+    inicio = time.perf_counter()
+    popular(prefixo, args.linhas, args.usuarios)
+    t_carga = time.perf_counter() - inicio
+
+    resultados = {}
+    try:
+        with db_connection() as conn:
+            for tipo, termos in CONSULTAS.items():
+                for filtro in ('all', 'active'):
+                    amostras = []
+                    encontrados = 0
+                    for _ in range(args.repeticoes):
+                        user_id = prefixo + str(random.randrange(args.usuarios))
+                        termo = random.choice(termos)
+                        t0 = time.perf_counter()
+                        tarefas, _ = buscar_tarefas(conn, user_id, termo, filtro)
+                        amostras.append((time.perf_counter() - t0) * 1000)
+                        encontrados += len(tarefas)
+                    conn.rollback()
+                    resultados[f'{tipo}/{filtro}'] = {
+                        'p50_ms': round(statistics.median(amostras), 2),
+                        'p95_ms': round(percentil(amostras, 95), 2),
+                        'p99_ms': round(percentil(amostras, 99), 2),
+                        'media_resultados': round(encontrados / args.repeticoes, 1),
+                    }
+    finally:
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute('DELETE FROM tarefas WHERE user_id LIKE %s', (prefixo + '%',))
+            conn.commit()
+
+    print(json.dumps({
+        'rows': args.linhas,
+        'users': args.usuarios,
+        'seed_seconds': round(t_carga, 1),
+        'queries': resultados,
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,373 @@
+"""Teste de carga local cobrindo as rotas da aplicação.
+
+Popula o Postgres de DATABASE_URL com --usuarios x --tarefas (com a fração
+--concluidas já concluída), sobe um servidor falso da OpenWeather com
+latência configurável e dispara --concorrencia clientes contra /, /add,
+/complete/<id>, /delete/<id>, /clear_completed, /meu-perfil e /health
+durante --duracao segundos, na proporção de --mix. O resultado (vazão e
+p50/p95/p99 por rota) sai em JSON, para comparar execuções.
+
+Por padrão a aplicação roda no gunicorn, como no Dockerfile, com o tipo
+de worker e as threads de --worker-class/--threads; com
+--servidor werkzeug ela roda neste processo (mais simples, mas disputa o
+GIL com os clientes). Com --url a carga vai para um servidor já rodando e
+o falso clima não é usado. Respostas 503 do controle de admissão
+(admissao.py) contam como "shed", separadas dos erros; com
+--respeitar-retry-after o cliente espera o Retry-After antes de continuar,
+como um navegador ou cliente da API bem-comportado.
+
+Uso (precisa de um Postgres de teste em DATABASE_URL):
+    python benchmarks/bench_carga.py --usuarios 100 --tarefas 500 --duracao 30
+    python benchmarks/bench_carga.py --latencia-clima 0.3 --clima-ttl 0 --saida antes.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import argparse
+import threading
+import subprocess
+import statistics
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, RAIZ)
+
+MIX_PADRAO = 'index=50,add=12,complete=12,delete=8,clear_completed=2,perfil=10,health=6'
+
+
+class _ClimaFalso(BaseHTTPRequestHandler):
+    latencia = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latencia)
+        corpo = json.dumps({
+            'name': 'São Paulo',
+            'main': {'temp': 24.3, 'feels_like': 25.1, 'humidity': 60},
+            'weather': [{'description': 'céu limpo', 'icon': '01d'}],
+            'wind': {'speed': 3.2},
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar_clima_falso(latencia):
+    _ClimaFalso.latencia = latencia
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), _ClimaFalso)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f'http://127.0.0.1:{servidor.server_address[1]}/data/2.5/weather'
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def popular(prefixo, usuarios, tarefas, concluidas):
+    """Cria os dados no próprio Postgres e retorna {user_id: [ids]}"""
+    from db import db_connection
+
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute('''
+                INSERT INTO tarefas (user_id, descricao, categoria, prioridade, prazo, concluida)
+                SELECT %(prefixo)s || u,
+                       'Tarefa de carga ' || t,
+                       (ARRAY['Trabalho','Estudo','Casa','Saúde','Lazer','Geral'])[1 + t %% 6],
+                       (ARRAY['Baixa','Média','Alta','Urgente'])[1 + t %% 4],
+                       CASE WHEN t %% 3 = 0 THEN CURRENT_DATE + (t %% 21 - 7) END,
+                       random() < %(concluidas)s
+                FROM generate_series(1, %(usuarios)s) u, generate_series(1, %(tarefas)s) t
+            ''', {'prefixo': prefixo, 'usuarios': usuarios, 'tarefas': tarefas, 'concluidas': concluidas})
+            cur.execute('SELECT user_id, id FROM tarefas WHERE user_id LIKE %s', (prefixo + '%',))
+            ids = defaultdict(list)
+            for user_id, id_ in cur.fetchall():
+                ids[user_id].append(id_)
+        conn.commit()
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('ANALYZE tarefas')
+        finally:
+            conn.autocommit = False
+    return dict(ids)
+
+
+def limpar(prefixo):
+    """Remove os usuários do prefixo, inclusive o que o arquivador moveu e a versão do conteúdo"""
+    from db import db_connection
+
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            for tabela in ('tarefas', 'tarefas_arquivadas', 'contagem_arquivadas', 'versoes_conteudo'):
+                cur.execute(f'DELETE FROM {tabela} WHERE user_id LIKE %s', (prefixo + '%',))
+        conn.commit()
+
+
+def iniciar_servidor(tipo, workers, threads, worker_class='gthread'):
+    """Sobe a aplicação e retorna (url base, função para encerrar)"""
+    porta = porta_livre()
+    if tipo == 'werkzeug':
+        from werkzeug.serving import make_server
+        from app import app
+
+        servidor = make_server('127.0.0.1', porta, app, threaded=True)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        return f'http://127.0.0.1:{porta}', servidor.shutdown
+
+    if worker_class != 'gthread':
+        threads = 1
+    # Mesmo arquivo de configuração do Dockerfile; os limites da aplicação
+    # (admissão, SSE) seguem GUNICORN_THREADS
+    env = {**os.environ, 'GUNICORN_WORKER_CLASS': worker_class, 'GUNICORN_THREADS': str(threads)}
+    processo = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{porta}',
+         '--workers', str(workers), '--log-level', 'warning', 'app:app'],
+        cwd=RAIZ, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f'http://127.0.0.1:{porta}'
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError('gunicorn terminou antes de ficar pronto')
+        try:
+            if requests.get(f'{url}/health', timeout=1).status_code < 500:
+                break
+        except requests.RequestException:
+            time.sleep(0.2)
+    else:
+        processo.kill()
+        raise RuntimeError('gunicorn não respondeu em 30s')
+
+    def encerrar():
+        processo.terminate()
+        processo.wait(timeout=10)
+    return url, encerrar
+
+
+def ler_mix(texto):
+    mix = {}
+    for parte in texto.split(','):
+        rota, _, peso = parte.partition('=')
+        mix[rota.strip()] = float(peso)
+    desconhecidas = set(mix) - {'index', 'add', 'complete', 'delete', 'clear_completed', 'perfil', 'health'}
+    if desconhecidas:
+        raise SystemExit(f"rotas desconhecidas em --mix: {', '.join(sorted(desconhecidas))}")
+    return mix
+
+
+class Cliente(threading.Thread):
+    """Um usuário virtual: escolhe rota e usuário ao acaso e mede cada requisição"""
+
+    def __init__(self, url, ids, mix, inicio_medicao, fim, semente, respeitar_retry_after=False):
+        super().__init__(daemon=True)
+        self.respeitar_retry_after = respeitar_retry_after
+        self.url = url
+        self.ids = ids
+        self.usuarios = list(ids)
+        self.rotas = list(mix)
+        self.pesos = list(mix.values())
+        self.inicio_medicao = inicio_medicao
+        self.fim = fim
+        self.aleatorio = random.Random(semente)
+        self.amostras = defaultdict(list)
+        self.erros = defaultdict(int)
+        self.recusas = defaultdict(int)
+
+    def requisicao(self, rota, user_id):
+        ids = self.ids[user_id]
+        if rota == 'index':
+            return 'GET', '/'
+        if rota == 'add':
+            return 'POST', '/add'
+        if rota == 'complete':
+            return 'GET', f'/complete/{self.aleatorio.choice(ids)}' if ids else '/complete/0'
+        if rota == 'delete':
+            # Cada exclusão tira o id da lista, para não repetir ids já apagados
+            return 'GET', f'/delete/{ids.pop(self.aleatorio.randrange(len(ids)))}' if ids else '/delete/0'
+        if rota == 'clear_completed':
+            return 'GET', '/clear_completed'
+        if rota == 'perfil':
+            return 'GET', '/meu-perfil'
+        return 'GET', '/health'
+
+    def run(self):
+        sessao = requests.Session()
+        while True:
+            agora = time.monotonic()
+            if agora >= self.fim:
+                break
+            rota = self.aleatorio.choices(self.rotas, self.pesos)[0]
+            user_id = self.aleatorio.choice(self.usuarios)
+            metodo, caminho = self.requisicao(rota, user_id)
+            dados = {'descricao': f'Nova tarefa {self.aleatorio.random():.6f}', 'categoria': 'Trabalho',
+                     'prioridade': 'Alta'} if metodo == 'POST' else None
+            inicio = time.perf_counter()
+            try:
+                resposta = sessao.request(metodo, self.url + caminho, data=dados, cookies={'user_id': user_id},
+                                          allow_redirects=False, timeout=30)
+                recusada = resposta.status_code == 503 and 'Retry-After' in resposta.headers
+                falhou = resposta.status_code >= 500 and not recusada
+            except requests.RequestException:
+                recusada, falhou = False, True
+            duracao = time.perf_counter() - inicio
+            if recusada and self.respeitar_retry_after:
+                time.sleep(min(float(resposta.headers['Retry-After']), max(self.fim - time.monotonic(), 0)))
+            if agora < self.inicio_medicao:
+                continue
+            self.amostras[rota].append(duracao)
+            if falhou:
+                self.erros[rota] += 1
+            if recusada:
+                self.recusas[rota] += 1
+
+
+def percentil(ordenadas, p):
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p / 100))]
+
+
+def resumir(amostras, erros, recusas, duracao):
+    rotas = {}
+    for rota in sorted(amostras):
+        tempos = sorted(amostras[rota])
+        rotas[rota] = {
+            'requests': len(tempos),
+            'errors': erros.get(rota, 0),
+            'shed': recusas.get(rota, 0),
+            'rps': round(len(tempos) / duracao, 1),
+            'mean_ms': round(statistics.fmean(tempos) * 1000, 2),
+            'p50_ms': round(percentil(tempos, 50) * 1000, 2),
+            'p95_ms': round(percentil(tempos, 95) * 1000, 2),
+            'p99_ms': round(percentil(tempos, 99) * 1000, 2),
+            'max_ms': round(tempos[-1] * 1000, 2),
+        }
+    total = sum(r['requests'] for r in rotas.values())
+    return {
+        'total_requests': total,
+        'total_errors': sum(r['errors'] for r in rotas.values()),
+        'total_shed': sum(r['shed'] for r in rotas.values()),
+        'rps': round(total / duracao, 1),
+        'routes': rotas,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--usuarios', type=int, default=50)
+    parser.add_argument('--tarefas', type=int, default=200, help='tarefas por usuário')
+    parser.add_argument('--concluidas', type=float, default=0.3, help='fração já concluída (0 a 1)')
+    parser.add_argument('--concorrencia', type=int, default=16, help='clientes simultâneos')
+    parser.add_argument('--duracao', type=float, default=20.0, help='segundos medidos')
+    parser.add_argument('--aquecimento', type=float, default=3.0, help='segundos descartados no início')
+    parser.add_argument('--mix', default=MIX_PADRAO, help='pesos por rota (padrão: %(default)s)')
+    parser.add_argument('--latencia-clima', type=float, default=0.05, help='latência do falso OpenWeather (s)')
+    parser.add_argument('--clima-ttl', type=float, default=None, help='CLIMA_TTL da aplicação (0 = sem cache)')
+    parser.add_argument('--servidor', choices=('gunicorn', 'werkzeug'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2, help='workers do gunicorn')
+    parser.add_argument('--worker-class', choices=('gthread', 'sync'), default='gthread',
+                        help='tipo de worker do gunicorn')
+    parser.add_argument('--threads', type=int, default=16, help='threads por worker (gthread)')
+    parser.add_argument('--url', help='servidor já rodando (não sobe aplicação nem clima falso)')
+    parser.add_argument('--respeitar-retry-after', action='store_true',
+                        help='clientes esperam o Retry-After das respostas 503')
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', help='grava o JSON também neste arquivo')
+    args = parser.parse_args()
+    mix = ler_mix(args.mix)
+
+    # O clima e o cache do clima são configurados por ambiente, antes de importar a aplicação
+    clima_servidor = None
+    if not args.url:
+        clima_servidor, clima_url = iniciar_clima_falso(args.latencia_clima)
+        os.environ['OPENWEATHER_URL'] = clima_url
+        os.environ['OPENWEATHER_API_KEY'] = 'bench'
+        if args.clima_ttl is not None:
+            os.environ['CLIMA_TTL'] = str(args.clima_ttl)
+
+    from app import init_db
+    init_db()
+
+    prefixo = f'bench-carga-{uuid.uuid4()}-'
+    inicio = time.perf_counter()
+    ids = popular(prefixo, args.usuarios, args.tarefas, args.concluidas)
+    t_carga = time.perf_counter() - inicio
+
+    encerrar = None
+    try:
+        if args.url:
+            url = args.url.rstrip('/')
+        else:
+            url, encerrar = iniciar_servidor(args.servidor, args.workers, args.threads, args.worker_class)
+
+        agora = time.monotonic()
+        inicio_medicao = agora + args.aquecimento
+        fim = inicio_medicao + args.duracao
+        # Cada cliente cuida de uma fatia dos usuários, para que os ids apagados não se repitam
+        usuarios = sorted(ids)
+        clientes = []
+        for n in range(args.concorrencia):
+            fatia = {u: ids[u] for u in usuarios[n::args.concorrencia]} or {u: ids[u] for u in usuarios}
+            clientes.append(Cliente(url, fatia, mix, inicio_medicao, fim, args.semente + n,
+                                    args.respeitar_retry_after))
+        for cliente in clientes:
+            cliente.start()
+        for cliente in clientes:
+            cliente.join()
+    finally:
+        if encerrar:
+            encerrar()
+        if clima_servidor:
+            clima_servidor.shutdown()
+        limpar(prefixo)
+
+    amostras, erros, recusas = defaultdict(list), defaultdict(int), defaultdict(int)
+    for cliente in clientes:
+        for rota, tempos in cliente.amostras.items():
+            amostras[rota].extend(tempos)
+        for rota, quantidade in cliente.erros.items():
+            erros[rota] += quantidade
+        for rota, quantidade in cliente.recusas.items():
+            recusas[rota] += quantidade
+
+    resultado = {
+        'config': {
+            'users': args.usuarios,
+            'tasks_per_user': args.tarefas,
+            'completed_ratio': args.concluidas,
+            'concurrency': args.concorrencia,
+            'honor_retry_after': args.respeitar_retry_after,
+            'duration_s': args.duracao,
+            'mix': mix,
+            'server': 'external' if args.url else args.servidor,
+            'workers': args.workers if args.servidor == 'gunicorn' and not args.url else None,
+            'worker_class': args.worker_class if args.servidor == 'gunicorn' and not args.url else None,
+            'threads': args.threads if args.servidor == 'gunicorn' and not args.url else None,
+            'weather_latency_s': None if args.url else args.latencia_clima,
+            'weather_ttl_s': args.clima_ttl,
+            'seed_seconds': round(t_carga, 2),
+        },
+        **resumir(amostras, erros, recusas, args.duracao),
+    }
+    saida = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(saida + '\n')
+    print(saida)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Benchmark de escritas: um COMMIT por requisição x commit em grupo.
+
+--threads threads, como as de um worker gthread, repetem durante
+--duracao segundos o ciclo adicionar -> concluir -> reabrir -> excluir
+(e, de tempos em tempos, limpar concluídas) para usuários sorteados entre
+--usuarios, chamando as mesmas funções de tarefas.py que as rotas usam.
+Cada modo roda com o mesmo pool de conexões (DB_POOL_MAX):
+- direto: executar_escrita() sem COMMIT_EM_GRUPO, como é o padrão;
+- grupo: escritas enfileiradas num CommitEmGrupo com --intervalo-ms e
+  --max-operacoes.
+
+Imprime escritas/s, p50/p99 por escrita e o tamanho médio dos grupos. O
+ganho depende de quanto custa o flush do WAL no disco do banco.
+
+Uso (precisa de um Postgres de teste em DATABASE_URL):
+    DB_POOL_MAX=16 python benchmarks/bench_commit_grupo.py --threads 16 --duracao 10
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_carga import percentil  # noqa: E402
+
+
+def rodar(executar, usuarios, threads, duracao, semente):
+    from tarefas import inserir_tarefa, definir_conclusao, excluir_tarefa, excluir_concluidas
+
+    tempos, erros = [], []
+    lock = threading.Lock()
+    fim = time.monotonic() + duracao
+
+    def trabalhar(n):
+        aleatorio = random.Random(semente + n)
+        meus_tempos, meus_erros = [], 0
+        while time.monotonic() < fim:
+            user_id = aleatorio.choice(usuarios)
+            passos = [
+                lambda: executar(inserir_tarefa, user_id, f'Escrita {n}', 'Geral', 'Média', None),
+                lambda id_: executar(definir_conclusao, user_id, id_, True),
+                lambda id_: executar(definir_conclusao, user_id, id_, False),
+                lambda id_: executar(excluir_tarefa, user_id, id_),
+            ]
+            if aleatorio.random() < 0.05:
+                passos.append(lambda _: executar(excluir_concluidas, user_id))
+            id_ = None
+            for passo in passos:
+                inicio = time.perf_counter()
+                try:
+                    resultado = passo() if id_ is None else passo(id_)
+                except Exception:
+                    meus_erros += 1
+                    break
+                meus_tempos.append(time.perf_counter() - inicio)
+                if id_ is None:
+                    # Os dois caminhos retornam (resultado, LSN do COMMIT)
+                    id_ = resultado[0]
+        with lock:
+            tempos.extend(meus_tempos)
+            erros.append(meus_erros)
+
+    trabalhadores = [threading.Thread(target=trabalhar, args=(n,)) for n in range(threads)]
+    inicio = time.perf_counter()
+    for trabalhador in trabalhadores:
+        trabalhador.start()
+    for trabalhador in trabalhadores:
+        trabalhador.join()
+    decorrido = time.perf_counter() - inicio
+    tempos.sort()
+    return {
+        'writes': len(tempos),
+        'errors': sum(erros),
+        'writes_per_s': round(len(tempos) / decorrido, 1),
+        'p50_ms': round(percentil(tempos, 50) * 1000, 2) if tempos else None,
+        'p99_ms': round(percentil(tempos, 99) * 1000, 2) if tempos else None,
+    }
+
+
+def limpar(prefixo):
+    from db import db_connection
+
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute('DELETE FROM tarefas WHERE user_id LIKE %s', (prefixo + '%',))
+            cur.execute('DELETE FROM versoes_conteudo WHERE user_id LIKE %s', (prefixo + '%',))
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--usuarios', type=int, default=50)
+    parser.add_argument('--duracao', type=float, default=10)
+    parser.add_argument('--intervalo-ms', type=float, default=2)
+    parser.add_argument('--max-operacoes', type=int, default=64)
+    parser.add_argument('--modos', default='direto,grupo')
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', help='arquivo para gravar o JSON do resultado')
+    args = parser.parse_args()
+
+    from app import init_db
+    from escritas import CommitEmGrupo, _executar_direto
+    from db import pool_stats
+    init_db()
+
+    prefixo = f'bench-grupo-{uuid.uuid4().hex[:8]}-'
+    usuarios = [f'{prefixo}{n}' for n in range(args.usuarios)]
+    resultado = {'threads': args.threads, 'users': args.usuarios, 'duration_s': args.duracao,
+                 'pool_max': pool_stats()['max_size'], 'modes': {}}
+    try:
+        for modo in args.modos.split(','):
+            if modo == 'direto':
+                resultado['modes'][modo] = rodar(_executar_direto, usuarios, args.threads, args.duracao, args.semente)
+            elif modo == 'grupo':
+                grupo = CommitEmGrupo(args.intervalo_ms / 1000, args.max_operacoes)
+                medido = rodar(grupo.executar, usuarios, args.threads, args.duracao, args.semente)
+                estatisticas = grupo.stats()
+                medido.update({'interval_ms': args.intervalo_ms, 'groups': estatisticas['groups'],
+                               'avg_group_size': estatisticas['avg_group_size'],
+                               'max_group_size': estatisticas['max_group_size']})
+                resultado['modes'][modo] = medido
+            else:
+                parser.error(f'modo desconhecido: {modo}')
+    finally:
+        limpar(prefixo)
+
+    base = resultado['modes'].get('direto')
+    if base and base['writes_per_s']:
+        for medido in resultado['modes'].values():
+            medido['speedup'] = round(medido['writes_per_s'] / base['writes_per_s'], 2)
+
+    saida = json.dumps(resultado, indent=2)
+    print(saida)
+    if args.saida:
+        with open(args.saida, 'w') as arquivo:
+            arquivo.write(saida + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Benchmark de GET condicional (ETag/304) e compressão gzip das páginas.
+
+Cria um usuário com --tarefas tarefas e mede, para /, /?filter=active e
+/meu-perfil, três formas de pedir a mesma página:
+- identidade: sem gzip e sem If-None-Match (como era antes);
+- gzip: Accept-Encoding: gzip, página renderizada e comprimida;
+- revalidacao: gzip + If-None-Match com o ETag recebido, que deve dar 304.
+
+Para cada uma imprime os bytes trafegados (linha de status, cabeçalhos e
+corpo, como chegam no socket) e a latência p50/p95 em milissegundos.
+
+Uso (precisa de um Postgres de teste em DATABASE_URL):
+    python benchmarks/bench_condicional.py --tarefas 50 --requisicoes 300
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import statistics
+import http.client
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_carga import iniciar_servidor, popular, limpar  # noqa: E402
+
+ROTAS = ['/', '/?filter=active', '/meu-perfil']
+
+
+def pedir(conexao, rota, cabecalhos):
+    """Faz o GET e retorna (status, bytes no fio, ETag, segundos)"""
+    inicio = time.perf_counter()
+    conexao.request('GET', rota, headers=cabecalhos)
+    resposta = conexao.getresponse()
+    corpo = resposta.read()
+    duracao = time.perf_counter() - inicio
+    linha_status = len(f'HTTP/1.1 {resposta.status} {resposta.reason}\r\n')
+    tamanho_cabecalhos = sum(len(f'{nome}: {valor}\r\n') for nome, valor in resposta.getheaders()) + 2
+    return resposta.status, linha_status + tamanho_cabecalhos + len(corpo), resposta.getheader('ETag'), duracao
+
+
+def medir(conexao, rota, cabecalhos, requisicoes):
+    tempos, status, tamanho = [], None, None
+    for _ in range(requisicoes):
+        status, tamanho, _, duracao = pedir(conexao, rota, cabecalhos)
+        tempos.append(duracao)
+    tempos.sort()
+    return {
+        'status': status,
+        'bytes': tamanho,
+        'p50_ms': round(statistics.median(tempos) * 1000, 2),
+        'p95_ms': round(tempos[int(len(tempos) * 0.95) - 1] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tarefas', type=int, default=50)
+    parser.add_argument('--requisicoes', type=int, default=300)
+    parser.add_argument('--servidor', choices=['gunicorn', 'werkzeug'], default='gunicorn')
+    parser.add_argument('--saida', help='arquivo para gravar o JSON do resultado')
+    args = parser.parse_args()
+
+    from app import init_db
+    init_db()
+
+    prefixo = f'bench-condicional-{uuid.uuid4().hex[:8]}-'
+    ids = popular(prefixo, 1, args.tarefas, 0.3)
+    user_id = next(iter(ids))
+    url, encerrar = iniciar_servidor(args.servidor, workers=1, threads=4)
+    try:
+        partes = urlsplit(url)
+        conexao = http.client.HTTPConnection(partes.hostname, partes.port, timeout=10)
+        cookie = {'Cookie': f'user_id={user_id}'}
+        resultado = {'tasks': args.tarefas, 'requests_per_case': args.requisicoes, 'routes': {}}
+        for rota in ROTAS:
+            identidade = {**cookie, 'Accept-Encoding': 'identity'}
+            comprimida = {**cookie, 'Accept-Encoding': 'gzip'}
+            # Aquecimento e ETag da representação comprimida
+            _, _, etag, _ = pedir(conexao, rota, comprimida)
+            casos = {
+                'identidade': medir(conexao, rota, identidade, args.requisicoes),
+                'gzip': medir(conexao, rota, comprimida, args.requisicoes),
+                'revalidacao': medir(conexao, rota, {**comprimida, 'If-None-Match': etag or '""'},
+                                     args.requisicoes),
+            }
+            base = casos['identidade']
+            for caso in casos.values():
+                caso['bytes_vs_identidade'] = round(caso['bytes'] / base['bytes'], 3)
+            resultado['routes'][rota] = casos
+        conexao.close()
+    finally:
+        encerrar()
+        limpar(prefixo)
+
+    saida = json.dumps(resultado, indent=2)
+    print(saida)
+    if args.saida:
+        with open(args.saida, 'w') as arquivo:
+            arquivo.write(saida + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Consultas preparadas x texto puro nas leituras da página (ver consultas.py).
+
+--threads threads, cada uma com uma conexão do pool, repetem durante
+--duracao segundos as consultas de um GET / sem cache: versão do conteúdo,
+página de filter=active, página de filter=all e estatísticas, para usuários
+sorteados entre --usuarios (com --tarefas tarefas cada). Roda duas vezes,
+com CONSULTAS_PREPARADAS desligado (texto puro, o Postgres analisa e planeja
+cada comando) e ligado (EXECUTE dos comandos preparados em cada conexão).
+
+Imprime requisições/s e p50/p99 por requisição de cada modo e, para cada
+comando, o "Planning Time" do EXPLAIN ANALYZE como texto e via EXECUTE: a
+parte do custo que a preparação tira de cada requisição.
+
+Uso (precisa de um Postgres de teste em DATABASE_URL):
+    python benchmarks/bench_consultas.py --threads 8 --duracao 10
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_carga import percentil, popular, limpar  # noqa: E402
+
+
+def requisicao(conn, user_id):
+    from versoes import versao_conteudo
+    from tarefas import consultar_pagina, COLUNAS_TAREFA
+    from estatisticas import calcular_estatisticas
+
+    versao_conteudo(conn, user_id)
+    consultar_pagina(conn, user_id, 'active', colunas=COLUNAS_TAREFA)
+    consultar_pagina(conn, user_id, 'all', colunas=COLUNAS_TAREFA)
+    calcular_estatisticas(conn, user_id)
+    conn.rollback()
+
+
+def rodar(usuarios, threads, duracao, semente):
+    from db import db_connection
+
+    tempos, lock = [], threading.Lock()
+    fim = time.monotonic() + duracao
+
+    def trabalhar(n):
+        aleatorio = random.Random(semente + n)
+        meus_tempos = []
+        with db_connection() as conn:
+            # Aquece: passa do CONSULTAS_PREPARAR_APOS antes de medir
+            for _ in range(5):
+                requisicao(conn, aleatorio.choice(usuarios))
+            while time.monotonic() < fim:
+                inicio = time.perf_counter()
+                requisicao(conn, aleatorio.choice(usuarios))
+                meus_tempos.append(time.perf_counter() - inicio)
+        with lock:
+            tempos.extend(meus_tempos)
+
+    trabalhadores = [threading.Thread(target=trabalhar, args=(n,)) for n in range(threads)]
+    inicio = time.perf_counter()
+    for trabalhador in trabalhadores:
+        trabalhador.start()
+    for trabalhador in trabalhadores:
+        trabalhador.join()
+    decorrido = time.perf_counter() - inicio
+    tempos.sort()
+    return {
+        'requests': len(tempos),
+        'requests_per_s': round(len(tempos) / decorrido, 1),
+        'p50_ms': round(percentil(tempos, 50) * 1000, 3),
+        'p99_ms': round(percentil(tempos, 99) * 1000, 3),
+    }
+
+
+def planejamento(user_id, repeticoes):
+    """Mediana do Planning Time (ms) de cada comando, como texto e via EXECUTE"""
+    from datetime import date
+    from db import db_connection
+    from tarefas import CONSULTAS_PAGINA, COLUNAS_TAREFA
+    from estatisticas import ESTATISTICAS
+    from versoes import VERSAO_CONTEUDO
+
+    hoje = date.today()
+    comandos = [
+        (VERSAO_CONTEUDO, (user_id,)),
+        (CONSULTAS_PAGINA[('active', False, COLUNAS_TAREFA)], {'user_id': user_id, 'hoje': hoje, 'limite': 51}),
+        (CONSULTAS_PAGINA[('all', False, COLUNAS_TAREFA)], {'user_id': user_id, 'hoje': hoje, 'limite': 51}),
+        (ESTATISTICAS, {'user_id': user_id}),
+    ]
+
+    def medir(cur, sql, params):
+        amostras = []
+        for _ in range(repeticoes):
+            cur.execute(f'EXPLAIN (ANALYZE, SUMMARY) {sql}', params)
+            plano = '\n'.join(linha[0] for linha in cur.fetchall())
+            amostras.append(float(re.search(r'Planning Time: ([\d.]+) ms', plano).group(1)))
+        return round(statistics.median(amostras), 4)
+
+    resultado = {}
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            for consulta, params in comandos:
+                # Nomes próprios, para não colidir com o que a conexão já preparou
+                cur.execute(consulta.prepare.replace(f'PREPARE {consulta.nome} ', f'PREPARE bench_{consulta.nome} ', 1))
+                execute = consulta.execute.replace(f'EXECUTE {consulta.nome}', f'EXECUTE bench_{consulta.nome}', 1)
+                resultado[consulta.nome] = {'plain_planning_ms': medir(cur, consulta.sql, params),
+                                            'prepared_planning_ms': medir(cur, execute, params)}
+                cur.execute(f'DEALLOCATE bench_{consulta.nome}')
+        conn.rollback()
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--usuarios', type=int, default=200)
+    parser.add_argument('--tarefas', type=int, default=100)
+    parser.add_argument('--duracao', type=float, default=10)
+    parser.add_argument('--repeticoes', type=int, default=50, help='EXPLAIN ANALYZE por comando e modo')
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', help='arquivo para gravar o JSON do resultado')
+    args = parser.parse_args()
+
+    # Uma conexão por thread
+    os.environ.setdefault('DB_POOL_MAX', str(args.threads))
+
+    import consultas
+    from app import init_db
+    init_db()
+
+    prefixo = f'bench-consultas-{uuid.uuid4().hex[:8]}-'
+    resultado = {'threads': args.threads, 'users': args.usuarios, 'tasks_per_user': args.tarefas,
+                 'duration_s': args.duracao, 'modes': {}}
+    try:
+        usuarios = list(popular(prefixo, args.usuarios, args.tarefas, 0.3))
+        for modo, ligado in (('plain', False), ('prepared', True)):
+            consultas.CONSULTAS_PREPARADAS = ligado
+            resultado['modes'][modo] = rodar(usuarios, args.threads, args.duracao, args.semente)
+        resultado['planning'] = planejamento(usuarios[0], args.repeticoes)
+    finally:
+        limpar(prefixo)
+
+    base = resultado['modes']['plain']['requests_per_s']
+    if base:
+        resultado['speedup'] = round(resultado['modes']['prepared']['requests_per_s'] / base, 2)
+
+    saida = json.dumps(resultado, indent=2)
+    print(saida)
+    if args.saida:
+        with open(args.saida, 'w') as arquivo:
+            arquivo.write(saida + '\n')
+
+
+if __name__ == '__main__':
+    main()
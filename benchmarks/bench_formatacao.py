@@ -0,0 +1,165 @@
+"""Microbenchmark do mapeamento de linhas da listagem de tarefas.
+
+Insere --linhas tarefas (padrão 10.000) para um usuário de teste e compara,
+sobre a mesma página com todas elas:
+- anterior: SELECT das colunas cruas e, por linha, um dicionário montado a
+  partir de cur.description, outro dicionário de saída e strftime das datas
+  (o formatar_tarefa() de antes);
+- registro: SELECT com COLUNAS_TAREFA (datas formatadas por to_char) e
+  Tarefa._make por linha, como em listar_tarefas().
+
+Mede separadamente só o mapeamento em Python (sobre linhas já buscadas) e a
+consulta mais o mapeamento. Imprime mediana e p95 em milissegundos.
+
+Uso (precisa de um Postgres de teste em DATABASE_URL):
+    python benchmarks/bench_formatacao.py --linhas 10000 --repeticoes 50
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import statistics
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import init_db  # noqa: E402
+from db import db_connection  # noqa: E402
+from tarefas import COLUNAS, COLUNAS_TAREFA, Tarefa, consultar_pagina  # noqa: E402
+
+
+def formatar_anterior(tarefa_row, col_names):
+    """Cópia do formatar_tarefa() anterior, usada como referência"""
+    tarefa_dict = {}
+    for i, col_name in enumerate(col_names):
+        tarefa_dict[col_name] = tarefa_row[i]
+
+    data_criacao = tarefa_dict.get('data_criacao')
+    data_formatada = None
+    if data_criacao:
+        if isinstance(data_criacao, str):
+            try:
+                data_obj = datetime.fromisoformat(data_criacao.replace('Z', '+00:00'))
+                data_formatada = data_obj.strftime('%d/%m/%Y %H:%M')
+            except (ValueError, AttributeError):
+                data_formatada = data_criacao
+        else:
+            data_formatada = data_criacao.strftime('%d/%m/%Y %H:%M')
+
+    prazo = tarefa_dict.get('prazo')
+    concluida = bool(tarefa_dict.get('concluida', False))
+    return {
+        'id': tarefa_dict.get('id'),
+        'descricao': tarefa_dict.get('descricao'),
+        'categoria': tarefa_dict.get('categoria', 'Geral'),
+        'prioridade': tarefa_dict.get('prioridade', 'Média'),
+        'prazo': prazo.strftime('%d/%m/%Y') if prazo else None,
+        'atrasada': bool(prazo) and not concluida and prazo < date.today(),
+        'concluida': concluida,
+        'data_criacao': data_formatada
+    }
+
+
+def popular(user_id, linhas):
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute('''
+                INSERT INTO tarefas (user_id, descricao, categoria, prioridade, prazo, concluida)
+                SELECT %(user_id)s, 'Tarefa de teste número ' || n,
+                       (ARRAY['Trabalho','Estudo','Casa','Saúde','Lazer','Geral'])[1 + n %% 6],
+                       (ARRAY['Baixa','Média','Alta','Urgente'])[1 + n %% 4],
+                       CASE WHEN n %% 3 = 0 THEN NULL ELSE CURRENT_DATE + (n %% 30 - 10) END,
+                       n %% 4 = 0
+                FROM generate_series(1, %(linhas)s) n
+            ''', {'user_id': user_id, 'linhas': linhas})
+        conn.commit()
+
+
+def limpar(user_id):
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute('DELETE FROM tarefas WHERE user_id = %s', (user_id,))
+        conn.commit()
+
+
+def buscar(conn, user_id, linhas, colunas):
+    rows, _ = consultar_pagina(conn, user_id, limite=linhas, colunas=colunas)
+    return rows
+
+
+def anterior(conn, user_id, linhas):
+    with conn.cursor() as cur:
+        cur.execute(f'SELECT {COLUNAS} FROM tarefas WHERE user_id = %s ORDER BY id DESC LIMIT %s',
+                    (user_id, linhas))
+        rows = cur.fetchall()
+        col_names = [desc[0] for desc in cur.description]
+    return [formatar_anterior(row, col_names) for row in rows]
+
+
+def registro(conn, user_id, linhas):
+    return list(map(Tarefa._make, buscar(conn, user_id, linhas, COLUNAS_TAREFA)))
+
+
+def resumo(tempos):
+    tempos = sorted(tempos)
+    return {
+        'median_ms': round(statistics.median(tempos) * 1000, 3),
+        'p95_ms': round(tempos[int(len(tempos) * 0.95) - 1] * 1000, 3),
+    }
+
+
+def cronometrar(funcao, repeticoes):
+    funcao()  # aquecimento
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return resumo(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, default=10000)
+    parser.add_argument('--repeticoes', type=int, default=50)
+    args = parser.parse_args()
+
+    init_db()
+    user_id = f'bench-formatacao-{uuid.uuid4()}'
+    popular(user_id, args.linhas)
+    try:
+        with db_connection() as conn:
+            rows_cruas = buscar(conn, user_id, args.linhas, COLUNAS)
+            rows_formatadas = buscar(conn, user_id, args.linhas, COLUNAS_TAREFA)
+            conn.rollback()
+            col_names = COLUNAS.split(', ')
+
+            # Confere que os dois caminhos produzem o mesmo conteúdo
+            esperado = [formatar_anterior(row, col_names) for row in rows_cruas]
+            obtido = [Tarefa._make(row) for row in rows_formatadas]
+            for dicionario, tarefa in zip(esperado, obtido):
+                assert all(dicionario[campo] == getattr(tarefa, campo) for campo in dicionario), (dicionario, tarefa)
+
+            resultado = {
+                'rows': len(rows_cruas),
+                'mapping_only': {
+                    'anterior': cronometrar(lambda: [formatar_anterior(r, col_names) for r in rows_cruas],
+                                            args.repeticoes),
+                    'registro': cronometrar(lambda: list(map(Tarefa._make, rows_formatadas)), args.repeticoes),
+                },
+                'query_and_mapping': {
+                    'anterior': cronometrar(lambda: anterior(conn, user_id, args.linhas), args.repeticoes),
+                    'registro': cronometrar(lambda: registro(conn, user_id, args.linhas), args.repeticoes),
+                },
+            }
+            conn.rollback()
+    finally:
+        limpar(user_id)
+
+    print(json.dumps(resultado, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Benchmark de importação (COPY) e exportação (streaming) de tarefas.
+
+Gera um CSV sintético, envia para /import e depois lê tudo de volta por
+/export, medindo linhas/s (e, com --memoria, o pico de memória Python) de
+cada etapa.
+
+Uso (precisa de um Postgres de teste em DATABASE_URL):
+    python benchmarks/bench_importacao.py --linhas 100000
+"""
+import os
+import io
+import sys
+import csv
+import json
+import time
+import uuid
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import app  # noqa: E402
+from db import db_connection  # noqa: E402
+from tarefas import CATEGORIAS, PRIORIDADES  # noqa: E402
+
+
+def gerar_csv(linhas):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(('descricao', 'categoria', 'prioridade', 'prazo', 'concluida'))
+    for i in range(linhas):
+        escritor.writerow((
+            f'Tarefa importada número {i}',
+            random.choice(CATEGORIAS),
+            random.choice(PRIORIDADES),
+            f'2026-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}' if i % 3 else '',
+            'true' if i % 4 == 0 else 'false',
+        ))
+    return buffer.getvalue().encode('utf-8')
+
+
+def medir(funcao, memoria):
+    # tracemalloc deixa o Python bem mais lento; só liga quando pedido
+    if memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = funcao()
+    duracao = time.perf_counter() - inicio
+    pico = None
+    if memoria:
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return resultado, duracao, pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, default=100000)
+    parser.add_argument('--formato', choices=('csv', 'ndjson'), default='ndjson',
+                        help='formato da exportação')
+    parser.add_argument('--memoria', action='store_true',
+                        help='mede o pico de memória Python (mais lento)')
+    args = parser.parse_args()
+
+    user_id = f'bench-{uuid.uuid4()}'
+    cliente = app.test_client()
+    cliente.set_cookie('user_id', user_id)
+    dados = gerar_csv(args.linhas)
+
+    try:
+        resposta, t_import, pico_import = medir(
+            lambda: cliente.post('/import', data=dados, content_type='text/csv'), args.memoria)
+        assert resposta.status_code == 200, resposta.data
+        importadas = resposta.get_json()['imported']
+
+        def exportar():
+            resposta = cliente.get(f'/export?format={args.formato}', buffered=False)
+            total = sum(len(pedaco) for pedaco in resposta.response)
+            resposta.close()
+            return total
+        bytes_exportados, t_export, pico_export = medir(exportar, args.memoria)
+    finally:
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute('DELETE FROM tarefas WHERE user_id = %s', (user_id,))
+            conn.commit()
+
+    print(json.dumps({
+        'rows': args.linhas,
+        'import': {
+            'rows_imported': importadas,
+            'seconds': round(t_import, 3),
+            'rows_per_s': round(importadas / t_import),
+            'upload_bytes': len(dados),
+            'peak_python_mem_bytes': pico_import,
+        },
+        'export': {
+            'format': args.formato,
+            'seconds': round(t_export, 3),
+            'rows_per_s': round(importadas / t_export),
+            'bytes': bytes_exportados,
+            'peak_python_mem_bytes': pico_export,
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
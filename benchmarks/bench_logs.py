@@ -0,0 +1,158 @@
+"""Custo dos logs por requisição: escrita síncrona x fila (ver logs.py).
+
+--threads threads fazem, pelo test client do Flask, o ciclo abrir a lista
+(filter=active) -> adicionar -> concluir durante --duracao segundos, com o
+logging configurado de cada um dos jeitos:
+- desligado: só WARNING e acima, a base para o custo dos logs;
+- sincrono: StreamHandler em texto na thread da requisição, como o
+  logging.basicConfig de antes;
+- fila: JSON pela fila e thread de escrita, sem amostragem nem limite;
+- fila_amostrada: fila com LOG_AMOSTRAGEM=--amostragem e
+  LOG_LIMITE_POR_SEGUNDO=--limite.
+
+Os logs vão para uma saída que descarta o texto e, com --atraso-escrita-ms,
+espera esse tempo a cada write, como um pipe cheio com o coletor de logs
+atrasado. Imprime requisições/s, p50/p99 por requisição, o custo dos logs
+por requisição (tempo médio acima do modo desligado) e as linhas escritas e
+descartadas em cada modo.
+
+Uso (precisa de um Postgres de teste em DATABASE_URL):
+    python benchmarks/bench_logs.py --threads 4 --duracao 5 --atraso-escrita-ms 0.2
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_carga import percentil, limpar  # noqa: E402
+
+
+class SaidaLenta:
+    """Stream que descarta o texto, esperando `atraso` segundos por write"""
+
+    def __init__(self, atraso):
+        self.atraso = atraso
+        self.writes = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def write(self, texto):
+        # Um pipe só aceita um escritor por vez
+        with self._lock:
+            if self.atraso:
+                time.sleep(self.atraso)
+            self.writes += 1
+            self.bytes += len(texto)
+
+    def flush(self):
+        pass
+
+
+def rodar(app, prefixo, threads, duracao):
+    tempos, lock = [], threading.Lock()
+    fim = time.monotonic() + duracao
+
+    def trabalhar(n):
+        cliente = app.test_client()
+        cliente.set_cookie('user_id', f'{prefixo}{n}')
+        meus_tempos = []
+        while time.monotonic() < fim:
+            inicio = time.perf_counter()
+            cliente.get('/?filter=active')
+            meus_tempos.append(time.perf_counter() - inicio)
+
+            inicio = time.perf_counter()
+            cliente.post('/add', data={'descricao': f'Log {n}'}, headers={'X-Requested-With': 'fetch'})
+            meus_tempos.append(time.perf_counter() - inicio)
+
+            inicio = time.perf_counter()
+            cliente.get('/api/v1/tasks?filter=active&limit=1')
+            meus_tempos.append(time.perf_counter() - inicio)
+        with lock:
+            tempos.extend(meus_tempos)
+
+    trabalhadores = [threading.Thread(target=trabalhar, args=(n,)) for n in range(threads)]
+    inicio = time.perf_counter()
+    for trabalhador in trabalhadores:
+        trabalhador.start()
+    for trabalhador in trabalhadores:
+        trabalhador.join()
+    decorrido = time.perf_counter() - inicio
+    tempos.sort()
+    return {
+        'requests': len(tempos),
+        'requests_per_s': round(len(tempos) / decorrido, 1),
+        'mean_ms': round(sum(tempos) / len(tempos) * 1000, 3),
+        'p50_ms': round(percentil(tempos, 50) * 1000, 3),
+        'p99_ms': round(percentil(tempos, 99) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--duracao', type=float, default=5)
+    parser.add_argument('--atraso-escrita-ms', type=float, default=0.2)
+    parser.add_argument('--amostragem', type=float, default=0.1)
+    parser.add_argument('--limite', type=float, default=50)
+    parser.add_argument('--modos', default='desligado,sincrono,fila,fila_amostrada')
+    parser.add_argument('--saida', help='arquivo para gravar o JSON do resultado')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DB_POOL_MAX', str(args.threads))
+
+    from app import app, init_db
+    import logs
+    init_db()
+
+    modos = {
+        'desligado': dict(nivel='WARNING', formato='texto', assincrono=False),
+        'sincrono': dict(formato='texto', assincrono=False, amostragem=1, limite_por_segundo=0),
+        'fila': dict(formato='json', assincrono=True, amostragem=1, limite_por_segundo=0),
+        'fila_amostrada': dict(formato='json', assincrono=True, amostragem=args.amostragem,
+                               limite_por_segundo=args.limite),
+    }
+    prefixo = f'bench-logs-{uuid.uuid4().hex[:8]}-'
+    resultado = {'threads': args.threads, 'duration_s': args.duracao,
+                 'write_delay_ms': args.atraso_escrita_ms, 'modes': {}}
+    try:
+        for modo in args.modos.split(','):
+            if modo not in modos:
+                parser.error(f'modo desconhecido: {modo}')
+            saida = SaidaLenta(args.atraso_escrita_ms / 1000)
+            logs.configurar(stream=saida, **modos[modo])
+            # Usuários novos a cada modo: as listas crescem com as tarefas adicionadas
+            medido = rodar(app, f'{prefixo}{modo}-', args.threads, args.duracao)
+            # Espera a fila esvaziar para contar o que foi escrito
+            logs.parar()
+            estatisticas = logs.stats()
+            medido.update({
+                'writes': saida.writes,
+                'log_kb': round(saida.bytes / 1024, 1),
+                'dropped': estatisticas.get('dropped_sampled', 0) + estatisticas.get('dropped_rate_limited', 0)
+                + estatisticas.get('dropped_queue_full', 0),
+            })
+            resultado['modes'][modo] = medido
+    finally:
+        logs.configurar()
+        limpar(prefixo)
+
+    base = resultado['modes'].get('desligado')
+    if base:
+        for medido in resultado['modes'].values():
+            medido['log_overhead_ms'] = round(medido['mean_ms'] - base['mean_ms'], 3)
+
+    saida = json.dumps(resultado, indent=2)
+    print(saida)
+    if args.saida:
+        with open(args.saida, 'w') as arquivo:
+            arquivo.write(saida + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Benchmark de partida a frio: do exec do gunicorn até o primeiro / com 200.
+
+Compara dois modos, alternando as execuções:
+- anterior: o comando antigo do Dockerfile (gunicorn --workers 2 app:app),
+  com cada worker importando o app e rodando init_db() na importação;
+- rapida: gunicorn.conf.py (preload no mestre, templates pré-compilados) e
+  MIGRAR_NA_PARTIDA=0, como no fly.toml.
+
+Uso (precisa de um Postgres de teste em DATABASE_URL):
+    python benchmarks/bench_partida.py --execucoes 10
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+import urllib.error
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def comando(modo, porta, config_vazia):
+    env = {**os.environ, 'PORT': str(porta), 'PYTHONUNBUFFERED': '1'}
+    if modo == 'anterior':
+        # Config vazia para o gunicorn não ler o gunicorn.conf.py do diretório
+        env['MIGRAR_NA_PARTIDA'] = '1'
+        args = ['-c', config_vazia, '--bind', f'127.0.0.1:{porta}', '--workers', '2', 'app:app']
+    else:
+        env['MIGRAR_NA_PARTIDA'] = '0'
+        args = ['-c', 'gunicorn.conf.py', 'app:app']
+    return [sys.executable, '-m', 'gunicorn', *args], env
+
+
+def medir(modo, config_vazia, limite=60.0):
+    """Segundos até o primeiro GET / responder 200"""
+    porta = porta_livre()
+    cmd, env = comando(modo, porta, config_vazia)
+    inicio = time.perf_counter()
+    processo = subprocess.Popen(cmd, cwd=RAIZ, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - inicio < limite:
+            if processo.poll() is not None:
+                raise RuntimeError(f'gunicorn ({modo}) terminou antes de responder')
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{porta}/', timeout=5) as resposta:
+                    if resposta.status == 200:
+                        return time.perf_counter() - inicio
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                time.sleep(0.005)
+        raise RuntimeError(f'gunicorn ({modo}) não respondeu em {limite:.0f}s')
+    finally:
+        processo.terminate()
+        try:
+            processo.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--execucoes', type=int, default=5, help='partidas por modo')
+    parser.add_argument('--modos', default='anterior,rapida')
+    args = parser.parse_args()
+    modos = [m.strip() for m in args.modos.split(',')]
+
+    # Garante o esquema em dia antes, para que nenhum modo pague migrações de verdade
+    subprocess.run([sys.executable, 'migracoes.py'], cwd=RAIZ, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    tempos = {modo: [] for modo in modos}
+    with tempfile.NamedTemporaryFile('w', suffix='.py') as config_vazia:
+        for _ in range(args.execucoes):
+            for modo in modos:
+                tempos[modo].append(medir(modo, config_vazia.name))
+
+    print(json.dumps({
+        'runs': args.execucoes,
+        'time_to_first_index_ms': {
+            modo: {
+                'median': round(statistics.median(valores) * 1000, 1),
+                'min': round(min(valores) * 1000, 1),
+                'max': round(max(valores) * 1000, 1),
+            }
+            for modo, valores in tempos.items()
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Leituras na réplica: roteamento e read-your-writes (ver leituras.py).
+
+Precisa de DATABASE_URL (primário) e DATABASE_READ_URL (réplica em
+streaming replication). Para testar localmente, com um primário em
+/tmp/pg (wal_level=replica, o padrão) e "local replication trust" no
+pg_hba.conf:
+    pg_basebackup -c fast -R -X stream -h /tmp/pg -D /tmp/pg-replica
+    pg_ctl -D /tmp/pg-replica -o "-p 5433 -k /tmp/pg-replica" start
+    export DATABASE_READ_URL='postgresql://postgres@/todo?host=/tmp/pg-replica&port=5433'
+
+Em cada uma de --iteracoes rodadas, o cliente adiciona uma tarefa e abre a
+lista logo em seguida, conferindo se a tarefa aparece. Roda duas vezes: com
+o cookie `lsn` (como o navegador) e descartando-o, para mostrar o que a
+réplica atrasada devolveria sem ele. Com --pausar-replay a reprodução na
+réplica fica pausada durante a rodada (pg_wal_replay_pause), simulando
+atraso. Imprime as leituras que ficaram na réplica ou foram ao primário (e
+por quê), as páginas sem a tarefa recém-criada e a latência p50/p95.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_carga import percentil, limpar  # noqa: E402
+
+
+def rodada(app, estado, prefixo, iteracoes, com_cookie):
+    from leituras import COOKIE_LSN
+
+    cliente = app.test_client()
+    cliente.set_cookie('user_id', f'{prefixo}{"cookie" if com_cookie else "sem-cookie"}')
+    antes = estado.stats()
+    tempos, ausentes = [], 0
+    for n in range(iteracoes):
+        descricao = f'Replica {uuid.uuid4().hex[:12]}'
+        cliente.post('/add', data={'descricao': descricao})
+        if not com_cookie:
+            cliente.delete_cookie(COOKIE_LSN)
+        inicio = time.perf_counter()
+        resposta = cliente.get('/?filter=active')
+        tempos.append(time.perf_counter() - inicio)
+        if descricao.encode() not in resposta.data:
+            ausentes += 1
+    depois = estado.stats()
+    tempos.sort()
+    return {
+        'iterations': iteracoes,
+        'missing_own_write': ausentes,
+        'replica_reads': depois['replica_reads'] - antes['replica_reads'],
+        'primary_reads': {motivo: total - antes['primary_reads'].get(motivo, 0)
+                          for motivo, total in depois['primary_reads'].items()
+                          if total - antes['primary_reads'].get(motivo, 0)},
+        'p50_ms': round(statistics.median(tempos) * 1000, 2),
+        'p95_ms': round(percentil(tempos, 95) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iteracoes', type=int, default=200)
+    parser.add_argument('--pausar-replay', action='store_true')
+    parser.add_argument('--saida', help='arquivo para gravar o JSON do resultado')
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_READ_URL'):
+        parser.error('defina DATABASE_READ_URL com a réplica')
+
+    from app import app, init_db
+    from db import db_connection
+    from leituras import estado
+    init_db()
+
+    def replay(funcao):
+        with db_connection(replica=True) as conn:
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(f'SELECT {funcao}()')
+            finally:
+                conn.autocommit = False
+
+    prefixo = f'bench-replica-{uuid.uuid4().hex[:8]}-'
+    resultado = {'paused_replay': args.pausar_replay, 'runs': {}}
+    try:
+        for com_cookie in (True, False):
+            if args.pausar_replay:
+                replay('pg_wal_replay_pause')
+            try:
+                resultado['runs']['lsn_cookie' if com_cookie else 'no_cookie'] = rodada(
+                    app, estado, prefixo, args.iteracoes, com_cookie)
+            finally:
+                if args.pausar_replay:
+                    replay('pg_wal_replay_resume')
+    finally:
+        limpar(prefixo)
+
+    saida = json.dumps(resultado, indent=2)
+    print(saida)
+    if args.saida:
+        with open(args.saida, 'w') as arquivo:
+            arquivo.write(saida + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Cache local (por processo) das páginas de tarefas já formatadas.
+
+Guarda, por (user_id, filtro, cursor, tamanho da página), a lista formatada
+e as estatísticas exibidas em index(). Cada usuário tem uma versão que é
+incrementada a cada alteração - local ou avisada por outro worker via
+LISTEN/NOTIFY - e que descarta as páginas desse usuário. Enquanto o ouvinte
+não está conectado o cache fica desligado, pois avisos podem se perder.
+
+Com DATABASE_READ_URL, as páginas lidas da réplica não são guardadas: a
+versão aqui é local e muda quando o aviso chega, mas a réplica pode ainda
+não ter reproduzido a escrita que o gerou, e a página antiga ficaria sob a
+versão nova. Como quase toda leitura vai para a réplica, na prática o cache
+só serve às leituras que caem no primário; a carga sai do primário para a
+réplica em vez de sair do banco (ver leituras.py); skipped_replica, em
+/metrics, conta as páginas que deixaram de ser guardadas por isso.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from notificacoes import ouvinte
+
+MAX_BYTES = int(os.environ.get('CACHE_TAREFAS_MAX_BYTES', 16 * 1024 * 1024))
+MAX_VERSOES = 100000
+
+
+def _tamanho_estimado(pagina):
+    tarefas = pagina[0]
+    return 512 + sum(256 + len(t.descricao or '') for t in tarefas)
+
+
+class TaskListCache:
+    """LRU limitado por memória estimada, com versão por usuário"""
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()
+        self._chaves_por_usuario = {}
+        self._versoes = {}
+        self._epoca = 0
+        self._bytes = 0
+        self._contadores = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0,
+                            'skipped_replica': 0}
+
+    def _ativo(self):
+        ouvinte.iniciar()
+        return self.max_bytes > 0 and ouvinte.conectado
+
+    def versao(self, user_id):
+        """Versão atual do usuário; None se o cache está desligado.
+
+        Deve ser lida ANTES de consultar o banco e repassada a guardar(),
+        para que uma alteração concorrente impeça guardar dados antigos.
+        """
+        if not self._ativo():
+            return None
+        with self._lock:
+            return (self._epoca, self._versoes.get(user_id, 0))
+
+    def obter(self, user_id, chave):
+        if not self._ativo():
+            return None
+        with self._lock:
+            item = self._entradas.get((user_id, chave))
+            if item is None:
+                self._contadores['misses'] += 1
+                return None
+            self._entradas.move_to_end((user_id, chave))
+            self._contadores['hits'] += 1
+            return item[0]
+
+    def guardar(self, user_id, chave, versao, pagina, da_replica=False):
+        """Guarda a página lida com `versao`; as lidas na réplica só são contadas"""
+        if versao is None:
+            return
+        if da_replica:
+            with self._lock:
+                self._contadores['skipped_replica'] += 1
+            return
+        tamanho = _tamanho_estimado(pagina)
+        if tamanho > self.max_bytes:
+            return
+        with self._lock:
+            if (self._epoca, self._versoes.get(user_id, 0)) != versao:
+                return
+            anterior = self._entradas.pop((user_id, chave), None)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            self._entradas[(user_id, chave)] = (pagina, tamanho)
+            self._chaves_por_usuario.setdefault(user_id, set()).add(chave)
+            self._bytes += tamanho
+            while self._bytes > self.max_bytes:
+                (antigo_user, antiga_chave), (_, antigo_tamanho) = self._entradas.popitem(last=False)
+                self._bytes -= antigo_tamanho
+                self._descartar_chave(antigo_user, antiga_chave)
+                self._contadores['evictions'] += 1
+
+    def _descartar_chave(self, user_id, chave):
+        chaves = self._chaves_por_usuario.get(user_id)
+        if chaves is not None:
+            chaves.discard(chave)
+            if not chaves:
+                del self._chaves_por_usuario[user_id]
+
+    def invalidar(self, user_id):
+        """Incrementa a versão do usuário e descarta todas as suas páginas"""
+        with self._lock:
+            if len(self._versoes) >= MAX_VERSOES:
+                self._limpar()
+            self._versoes[user_id] = self._versoes.get(user_id, 0) + 1
+            self._contadores['invalidations'] += 1
+            for chave in self._chaves_por_usuario.pop(user_id, ()):
+                _, tamanho = self._entradas.pop((user_id, chave))
+                self._bytes -= tamanho
+
+    def limpar(self):
+        """Descarta tudo; usado quando avisos de outros workers podem ter se perdido"""
+        with self._lock:
+            self._limpar()
+
+    def _limpar(self):
+        self._entradas.clear()
+        self._chaves_por_usuario.clear()
+        self._versoes.clear()
+        # Nova época: leituras iniciadas antes da limpeza não podem mais guardar
+        self._epoca += 1
+        self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._contadores,
+                'enabled': self.max_bytes > 0 and ouvinte.conectado,
+                'entries': len(self._entradas),
+                'users': len(self._chaves_por_usuario),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+cache = TaskListCache()
@@ -0,0 +1,344 @@
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Permite apontar para um servidor local (stub) em testes e benchmarks
+OPENWEATHER_URL = os.environ.get('OPENWEATHER_URL', 'http://api.openweathermap.org/data/2.5/weather')
+# (conexão, leitura) em segundos; a API costuma responder em bem menos de 1s
+CLIMA_TIMEOUT = (float(os.environ.get('CLIMA_TIMEOUT_CONEXAO', 2)), float(os.environ.get('CLIMA_TIMEOUT', 3)))
+
+def buscar_clima(cidade):
+    """Obtém dados do clima direto da API OpenWeather, sem cache"""
+    # Importado só aqui: é a única parte que usa, e o requests pesa na partida
+    import requests
+
+    try:
+        api_key = os.environ.get('OPENWEATHER_API_KEY')
+        
+        # Log para debug
+        logger.info("🌤️ Tentando obter clima para %s", cidade)
+        
+        if not api_key:
+            logger.warning("⚠️ OPENWEATHER_API_KEY não encontrada nas variáveis de ambiente")
+            return {
+                'cidade': cidade,
+                'temperatura': '--',
+                'descricao': 'Dados indisponíveis',
+                'icone': '01d',
+                'sensacao': '--',
+                'humidade': '--',
+                'vento': '--',
+                'erro': 'Chave da API não configurada'
+            }
+        
+        # CODIFICAÇÃO DE API
+        
+        if api_key == '00242a4366f2f684e8f901da0d365d44':
+            logger.warning("⚠️ Usando chave da API padrão - pode não funcionar")
+        
+        url = f"{OPENWEATHER_URL}?q={cidade}&appid={api_key}&units=metric&lang=pt_br"
+        logger.info("🌐 Chamando API do clima")
+        
+        response = requests.get(url, timeout=CLIMA_TIMEOUT)
+        logger.info("📡 Status da resposta: %s", response.status_code)
+        
+        if response.status_code == 200:
+            data = response.json()
+            clima_data = {
+                'cidade': data['name'],
+                'temperatura': round(data['main']['temp']),
+                'descricao': data['weather'][0]['description'].title(),
+                'icone': data['weather'][0]['icon'],
+                'sensacao': round(data['main']['feels_like']),
+                'humidade': data['main']['humidity'],
+                'vento': round(data['wind']['speed'] * 3.6)  # Convertendo m/s para km/h
+            }
+            logger.info("✅ Clima obtido: %s°C em %s", clima_data['temperatura'], clima_data['cidade'])
+            return clima_data
+        else:
+            logger.error(f"❌ Erro na API do clima: {response.status_code}")
+            return {
+                'cidade': cidade,
+                'temperatura': '--',
+                'descricao': 'Erro na API',
+                'icone': '01d',
+                'sensacao': '--',
+                'humidade': '--',
+                'vento': '--',
+                'erro': f"HTTP {response.status_code}"
+            }
+            
+    except requests.exceptions.Timeout:
+        logger.error("⏰ Timeout ao obter dados do clima")
+        return {
+            'cidade': cidade,
+            'temperatura': '--',
+            'descricao': 'Timeout',
+            'icone': '01d',
+            'sensacao': '--',
+            'humidade': '--',
+            'vento': '--',
+            'erro': 'Timeout'
+        }
+    except requests.exceptions.ConnectionError:
+        logger.error("🔌 Erro de conexão ao obter dados do clima")
+        return {
+            'cidade': cidade,
+            'temperatura': '--',
+            'descricao': 'Sem conexão',
+            'icone': '01d',
+            'sensacao': '--',
+            'humidade': '--',
+            'vento': '--',
+            'erro': 'Connection error'
+        }
+    except Exception as e:
+        logger.error(f"❌ Erro inesperado ao obter clima: {e}")
+        return {
+            'cidade': cidade,
+            'temperatura': '--',
+            'descricao': 'Erro',
+            'icone': '01d',
+            'sensacao': '--',
+            'humidade': '--',
+            'vento': '--',
+            'erro': str(e)
+        }
+
+
+class CircuitBreaker:
+    """Disjuntor para a API do clima.
+
+    - closed: as chamadas passam; `limite_falhas` falhas seguidas abrem o circuito.
+    - open: as chamadas falham na hora, sem tocar a rede, por `tempo_aberto`
+      segundos (dobrando a cada reabertura seguida, até `tempo_aberto_max`).
+    - half_open: passado esse tempo, uma única chamada de teste passa; se der
+      certo o circuito fecha, se falhar volta a abrir.
+    """
+
+    def __init__(self, limite_falhas=5, tempo_aberto=30.0, tempo_aberto_max=300.0):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self.tempo_aberto_max = tempo_aberto_max
+        self._lock = threading.Lock()
+        self._estado = 'closed'
+        self._falhas = 0
+        self._aberturas_seguidas = 0
+        self._reabre_em = 0.0
+        self._teste_em_andamento = False
+        self._contadores = {'opened': 0, 'short_circuited': 0, 'probes': 0}
+
+    def permitir(self):
+        """True se a chamada pode ir à API; no half_open só a chamada de teste passa"""
+        with self._lock:
+            if self._estado == 'closed':
+                return True
+            if self._estado == 'open' and time.monotonic() >= self._reabre_em:
+                self._estado = 'half_open'
+            if self._estado == 'half_open' and not self._teste_em_andamento:
+                self._teste_em_andamento = True
+                self._contadores['probes'] += 1
+                return True
+            self._contadores['short_circuited'] += 1
+            return False
+
+    def registrar(self, sucesso):
+        with self._lock:
+            self._teste_em_andamento = False
+            if sucesso:
+                if self._estado != 'closed':
+                    logger.info("✅ API do clima respondeu; circuito fechado")
+                self._estado = 'closed'
+                self._falhas = 0
+                self._aberturas_seguidas = 0
+                return
+            self._falhas += 1
+            if self._estado == 'half_open' or self._falhas >= self.limite_falhas:
+                espera = min(self.tempo_aberto * 2 ** self._aberturas_seguidas, self.tempo_aberto_max)
+                self._estado = 'open'
+                self._reabre_em = time.monotonic() + espera
+                self._aberturas_seguidas += 1
+                self._falhas = 0
+                self._contadores['opened'] += 1
+                logger.warning(f"⚡ API do clima falhando; circuito aberto por {espera:.0f}s")
+
+    def stats(self):
+        with self._lock:
+            return {'state': self._estado, **self._contadores}
+
+
+class _Entrada:
+    __slots__ = ('dados', 'expira_em', 'ok', 'falhas')
+
+    def __init__(self, dados, expira_em, ok, falhas=0):
+        self.dados = dados
+        self.expira_em = expira_em
+        self.ok = ok
+        self.falhas = falhas
+
+
+class _Voo:
+    """Busca em andamento para uma cidade (single-flight)"""
+    __slots__ = ('evento', 'resultado')
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+
+
+class WeatherCache:
+    """Cache por cidade com TTL, stale-while-revalidate e single-flight.
+
+    - Dentro do ttl a resposta vem direto do cache.
+    - Até stale_ttl segundos depois de expirar, o dado antigo é servido e
+      uma thread em segundo plano busca o novo.
+    - Sem dado utilizável, a requisição busca na API; buscas concorrentes da
+      mesma cidade esperam pela mesma chamada.
+    - Falhas ficam em cache por error_ttl, dobrando a cada falha seguida até
+      max_error_ttl. Se havia um dado bom, ele continua sendo servido.
+    """
+
+    def __init__(self, fetch, ttl=600.0, stale_ttl=1800.0, error_ttl=30.0,
+                 max_error_ttl=600.0, wait_timeout=15.0):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.error_ttl = error_ttl
+        self.max_error_ttl = max_error_ttl
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._entradas = {}
+        self._voos = {}
+        self._contadores = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'refreshes': 0,
+            'upstream_calls': 0,
+            'upstream_failures': 0,
+        }
+
+    def get(self, cidade):
+        agora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(cidade)
+            if entrada is not None and agora < entrada.expira_em:
+                self._contadores['hits'] += 1
+                return entrada.dados
+            if (entrada is not None and entrada.ok
+                    and agora < entrada.expira_em + self.stale_ttl):
+                self._contadores['stale_hits'] += 1
+                if cidade not in self._voos:
+                    self._voos[cidade] = _Voo()
+                    self._contadores['refreshes'] += 1
+                    threading.Thread(target=self._buscar, args=(cidade,),
+                                     name=f'clima-refresh-{cidade}', daemon=True).start()
+                return entrada.dados
+            self._contadores['misses'] += 1
+            voo = self._voos.get(cidade)
+            lider = voo is None
+            if lider:
+                voo = self._voos[cidade] = _Voo()
+            else:
+                self._contadores['coalesced'] += 1
+
+        if lider:
+            return self._buscar(cidade)
+        voo.evento.wait(self.wait_timeout)
+        if voo.resultado is not None:
+            return voo.resultado
+        return _clima_indisponivel(cidade, 'Timeout', 'Timeout')
+
+    def _buscar(self, cidade):
+        with self._lock:
+            voo = self._voos[cidade]
+            self._contadores['upstream_calls'] += 1
+        try:
+            dados = self.fetch(cidade)
+        except Exception as e:
+            dados = _clima_indisponivel(cidade, 'Erro', str(e))
+
+        agora = time.monotonic()
+        with self._lock:
+            anterior = self._entradas.get(cidade)
+            if 'erro' not in dados:
+                self._entradas[cidade] = _Entrada(dados, agora + self.ttl, ok=True)
+            else:
+                self._contadores['upstream_failures'] += 1
+                falhas = (anterior.falhas if anterior else 0) + 1
+                espera = min(self.error_ttl * 2 ** (falhas - 1), self.max_error_ttl)
+                if anterior is not None and anterior.ok:
+                    # Mantém o último dado bom enquanto a API se recupera
+                    self._entradas[cidade] = _Entrada(anterior.dados, agora + espera, ok=True, falhas=falhas)
+                    dados = anterior.dados
+                else:
+                    self._entradas[cidade] = _Entrada(dados, agora + espera, ok=False, falhas=falhas)
+            voo.resultado = dados
+            del self._voos[cidade]
+        voo.evento.set()
+        return dados
+
+    def invalidate(self, cidade=None):
+        with self._lock:
+            if cidade is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(cidade, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._contadores,
+                'cities': len(self._entradas),
+                'in_flight': len(self._voos),
+            }
+
+
+def _clima_indisponivel(cidade, descricao, erro):
+    return {
+        'cidade': cidade,
+        'temperatura': '--',
+        'descricao': descricao,
+        'icone': '01d',
+        'sensacao': '--',
+        'humidade': '--',
+        'vento': '--',
+        'erro': erro
+    }
+
+
+_circuito = CircuitBreaker(
+    limite_falhas=int(os.environ.get('CLIMA_CIRCUITO_FALHAS', 5)),
+    tempo_aberto=float(os.environ.get('CLIMA_CIRCUITO_ABERTO', 30)),
+    tempo_aberto_max=float(os.environ.get('CLIMA_CIRCUITO_ABERTO_MAX', 300)),
+)
+
+
+def _buscar_com_circuito(cidade):
+    if not _circuito.permitir():
+        return _clima_indisponivel(cidade, 'Serviço indisponível', 'API do clima fora do ar')
+    dados = buscar_clima(cidade)
+    _circuito.registrar('erro' not in dados)
+    return dados
+
+
+_cache = WeatherCache(
+    _buscar_com_circuito,
+    ttl=float(os.environ.get('CLIMA_TTL', 600)),
+    stale_ttl=float(os.environ.get('CLIMA_STALE_TTL', 1800)),
+    error_ttl=float(os.environ.get('CLIMA_ERRO_TTL', 30)),
+    max_error_ttl=float(os.environ.get('CLIMA_ERRO_TTL_MAX', 600)),
+)
+
+
+def obter_clima(cidade='São Paulo'):
+    """Obtém dados do clima, servidos pelo cache sempre que possível"""
+    return _cache.get(cidade)
+
+
+def clima_stats():
+    return {**_cache.stats(), 'circuit': _circuito.stats()}
@@ -0,0 +1,52 @@
+"""Compressão gzip das respostas de texto.
+
+Respostas 200 de HTML, JSON, texto, CSS e JavaScript com pelo menos
+COMPRESSAO_MINIMO bytes são comprimidas quando o navegador aceita gzip.
+Streams (o SSE de /events) e respostas já codificadas ficam como estão. O
+ETag forte da representação comprimida ganha o sufixo -gzip, como faz o
+mod_deflate; versoes.etag_em_cache() aceita as duas formas.
+"""
+import os
+import gzip
+
+from flask import Blueprint, request
+
+from metricas import medir_fase
+
+compressao = Blueprint('compressao', __name__)
+
+COMPRESSAO_MINIMO = int(os.environ.get('COMPRESSAO_MINIMO', 1024))
+COMPRESSAO_NIVEL = int(os.environ.get('COMPRESSAO_NIVEL', 6))
+
+TIPOS_COMPRIMIVEIS = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript',
+    'application/json', 'application/javascript',
+}
+
+
+def _comprimivel(response):
+    if response.status_code != 200 or response.direct_passthrough or response.is_streamed:
+        return False
+    if response.mimetype not in TIPOS_COMPRIMIVEIS or 'Content-Encoding' in response.headers:
+        return False
+    return 'gzip' in request.accept_encodings
+
+
+@compressao.after_app_request
+def comprimir(response):
+    if COMPRESSAO_MINIMO <= 0:
+        return response
+    response.vary.add('Accept-Encoding')
+    if not _comprimivel(response):
+        return response
+    corpo = response.get_data()
+    if len(corpo) < COMPRESSAO_MINIMO:
+        return response
+
+    with medir_fase('compress'):
+        response.set_data(gzip.compress(corpo, COMPRESSAO_NIVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, fraco = response.get_etag()
+    if etag and not fraco:
+        response.set_etag(f'{etag}-gzip')
+    return response
@@ -0,0 +1,166 @@
+"""Registro das consultas quentes, preparadas uma vez por conexão.
+
+As rotas rodam sempre o mesmo punhado de comandos: a versão da página, a
+listagem de cada filtro, as estatísticas e as alterações (inserir,
+concluir/reabrir, excluir, limpar concluídas, versão e aviso). Enviados como
+texto, cada um é analisado e planejado pelo Postgres a cada requisição.
+
+Cada comando é registrado aqui com um nome (registrar()) e o SQL no formato
+do psycopg2. Numa conexão do pool, depois de CONSULTAS_PREPARAR_APOS
+execuções como texto, o comando é preparado (PREPARE nome AS ..., com os
+parâmetros como $1, $2...) e dali em diante roda com EXECUTE nome (...).
+Conexão nova, reciclada pelo pool ou de fora dele (sem ConexaoPreparada)
+começa no texto puro, e comandos raros nem chegam a ser preparados.
+
+Se o servidor esqueceu os comandos preparados (DISCARD ALL ou um pgbouncer
+em modo transaction trocando a conexão), o EXECUTE falha com
+InvalidSqlStatementName: a conexão volta ao texto puro e, se o comando era
+o primeiro da transação, ele é refeito na hora; senão a exceção sobe, como
+qualquer falha no meio da transação. Atrás de um pooler assim, use
+CONSULTAS_PREPARADAS=0.
+
+stats() traz, por comando, as execuções como texto e preparadas, os
+PREPAREs e o tempo médio de cada modo (em /debug-db e /metrics).
+"""
+import os
+import re
+import time
+import threading
+
+from psycopg2 import errors, extensions
+
+CONSULTAS_PREPARADAS = os.environ.get('CONSULTAS_PREPARADAS', '1') != '0'
+# Execuções como texto numa conexão antes de preparar o comando nela
+CONSULTAS_PREPARAR_APOS = int(os.environ.get('CONSULTAS_PREPARAR_APOS', 2))
+
+# %(nome)s, %s e o %% literal, como o psycopg2 os entende
+_MARCADOR = re.compile(r'%\((\w+)\)s|%s|%%')
+
+
+class ConexaoPreparada(extensions.connection):
+    """Conexão do pool que lembra o que já preparou e quantas vezes rodou cada comando"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.preparadas = set()
+        self.execucoes = {}
+
+
+def _converter(sql):
+    """SQL do psycopg2 -> (SQL com $n, lista de marcadores na ordem dos $n)"""
+    nomes = []
+
+    def trocar(marcador):
+        if marcador.group(0) == '%%':
+            return '%'
+        nome = marcador.group(1)
+        if nome is not None and nome in nomes:
+            return f'${nomes.index(nome) + 1}'
+        nomes.append(nome)
+        return f'${len(nomes)}'
+
+    return _MARCADOR.sub(trocar, sql), nomes
+
+
+class Consulta:
+    """Um comando do registro: roda como texto ou via EXECUTE, conforme a conexão"""
+
+    def __init__(self, nome, sql):
+        self.nome = nome
+        self.sql = sql
+        convertido, marcadores = _converter(sql)
+        self.prepare = f'PREPARE {nome} AS {convertido}'
+        if not marcadores:
+            self.execute = f'EXECUTE {nome}'
+        elif marcadores[0] is None:
+            self.execute = f'EXECUTE {nome} ({", ".join(["%s"] * len(marcadores))})'
+        else:
+            self.execute = f'EXECUTE {nome} ({", ".join(f"%({m})s" for m in marcadores)})'
+        self._lock = threading.Lock()
+        self.texto = 0
+        self.preparada = 0
+        self.preparos = 0
+        self.recomecos = 0
+        self.tempo_texto = 0.0
+        self.tempo_preparada = 0.0
+
+    def executar(self, cur, params=None):
+        """Executa o comando no cursor, preparando-o na conexão quando vale a pena"""
+        conn = cur.connection
+        preparadas = getattr(conn, 'preparadas', None)
+        if not CONSULTAS_PREPARADAS or preparadas is None:
+            return self._texto(cur, params)
+        if self.nome not in preparadas:
+            vezes = conn.execucoes.get(self.nome, 0) + 1
+            conn.execucoes[self.nome] = vezes
+            if vezes <= CONSULTAS_PREPARAR_APOS:
+                return self._texto(cur, params)
+            # Comandos preparados não são desfeitos pelo ROLLBACK: basta uma vez
+            cur.execute(self.prepare)
+            preparadas.add(self.nome)
+            with self._lock:
+                self.preparos += 1
+
+        inicio_transacao = conn.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE
+        inicio = time.perf_counter()
+        try:
+            cur.execute(self.execute, params)
+        except errors.InvalidSqlStatementName:
+            preparadas.clear()
+            conn.execucoes.clear()
+            with self._lock:
+                self.recomecos += 1
+            if not inicio_transacao:
+                raise
+            conn.rollback()
+            return self._texto(cur, params)
+        duracao = time.perf_counter() - inicio
+        with self._lock:
+            self.preparada += 1
+            self.tempo_preparada += duracao
+
+    def _texto(self, cur, params):
+        inicio = time.perf_counter()
+        cur.execute(self.sql, params)
+        duracao = time.perf_counter() - inicio
+        with self._lock:
+            self.texto += 1
+            self.tempo_texto += duracao
+
+    def stats(self):
+        with self._lock:
+            return {
+                'plain': self.texto,
+                'prepared': self.preparada,
+                'prepares': self.preparos,
+                'resets': self.recomecos,
+                'plain_avg_ms': round(self.tempo_texto / self.texto * 1000, 3) if self.texto else 0.0,
+                'prepared_avg_ms': round(self.tempo_preparada / self.preparada * 1000, 3) if self.preparada else 0.0,
+            }
+
+
+_registro = {}
+_registro_lock = threading.Lock()
+
+
+def registrar(nome, sql):
+    """Registra (ou devolve, se já existe com o mesmo SQL) o comando `nome`"""
+    with _registro_lock:
+        consulta = _registro.get(nome)
+        if consulta is None:
+            consulta = _registro[nome] = Consulta(nome, sql)
+        elif consulta.sql != sql:
+            raise ValueError(f'consulta {nome} já registrada com outro SQL')
+        return consulta
+
+
+def stats():
+    """Contadores por comando (só os que já rodaram)"""
+    with _registro_lock:
+        consultas = list(_registro.values())
+    resultado = {'enabled': CONSULTAS_PREPARADAS, 'prepare_after': CONSULTAS_PREPARAR_APOS, 'statements': {}}
+    for consulta in consultas:
+        contadores = consulta.stats()
+        if contadores['plain'] or contadores['prepared']:
+            resultado['statements'][consulta.nome] = contadores
+    return resultado
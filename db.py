@@ -0,0 +1,421 @@
+import os
+import threading
+import time
+import logging
+import traceback
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+from metricas import CursorMedido, medir_fase
+from consultas import ConexaoPreparada
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Nenhuma conexão ficou disponível dentro do tempo de espera"""
+
+
+def get_database_url(variavel='DATABASE_URL'):
+    """Lê a DATABASE_URL do ambiente, ajustando o esquema se necessário"""
+    database_url = os.environ.get(variavel)
+    if database_url and database_url.startswith("postgres://"):
+        database_url = database_url.replace("postgres://", "postgresql://", 1)
+    return database_url
+
+
+def get_read_database_url():
+    """DATABASE_READ_URL: réplica opcional para leituras (ver leituras.py)"""
+    return get_database_url('DATABASE_READ_URL')
+
+
+class _PooledConnection:
+    """Metadados de uma conexão física mantida pelo pool"""
+    __slots__ = ('conn', 'created_at', 'last_used_at', 'uses',
+                 'checked_out_at', 'checkout_stack', 'leak_reported')
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used_at = now
+        self.uses = 0
+        self.checked_out_at = None
+        self.checkout_stack = None
+        self.leak_reported = False
+
+
+class ConnectionPool:
+    """Pool de conexões thread-safe com reciclagem e detecção de vazamentos.
+
+    - min_size/max_size: conexões mantidas abertas / limite de conexões físicas
+    - timeout: segundos esperando uma conexão livre antes de PoolTimeout
+    - max_uses/max_age: recicla a conexão após N checkouts ou N segundos de vida
+    - health_check_after: faz SELECT 1 no checkout se a conexão ficou ociosa
+      por mais que isso (0 = sempre)
+    - leak_timeout: checkouts mais longos que isso são registrados como
+      vazamento, com a pilha de quem pegou a conexão (0 = desligado)
+    """
+
+    def __init__(self, dsn, min_size=1, max_size=5, timeout=5.0,
+                 max_uses=1000, max_age=1800.0, health_check_after=10.0,
+                 leak_timeout=30.0, connect_timeout=5):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.health_check_after = health_check_after
+        self.leak_timeout = leak_timeout
+        self.connect_timeout = connect_timeout
+
+        self._cond = threading.Condition()
+        self._idle = []
+        self._in_use = {}
+        self._size = 0
+        self._closed = False
+        self._last_leak_check = 0.0
+
+        self._counters = {
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'checkouts': 0,
+            'checkout_timeouts': 0,
+            'health_check_failures': 0,
+            'recycled': 0,
+            'leaks_detected': 0,
+        }
+        self._wait_time_total = 0.0
+
+    # Conexões físicas
+
+    def _open(self):
+        conn = psycopg2.connect(self.dsn, connect_timeout=self.connect_timeout,
+                                application_name='todo-list-plus', cursor_factory=CursorMedido,
+                                connection_factory=ConexaoPreparada)
+        with self._cond:
+            self._counters['connections_opened'] += 1
+        return _PooledConnection(conn)
+
+    def _close(self, pc):
+        try:
+            pc.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._counters['connections_closed'] += 1
+
+    def _expired(self, pc, now):
+        if self.max_uses and pc.uses >= self.max_uses:
+            return True
+        if self.max_age and now - pc.created_at >= self.max_age:
+            return True
+        return False
+
+    def _healthy(self, pc, now):
+        conn = pc.conn
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if now - pc.last_used_at < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Conexão do pool falhou no health-check: {e}")
+            return False
+
+    def fill(self):
+        """Abre conexões até atingir min_size"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                pc = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append(pc)
+                self._cond.notify()
+
+    # Checkout / checkin
+
+    def acquire(self, timeout=None):
+        """Retira uma conexão do pool, abrindo uma nova se houver espaço.
+
+        `timeout` substitui o tempo de espera padrão do pool nesta chamada.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        pc = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Pool de conexões fechado")
+                self._check_leaks_locked(time.monotonic())
+                if self._idle:
+                    pc = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['checkout_timeouts'] += 1
+                    raise PoolTimeout(
+                        f"Nenhuma conexão livre após {timeout}s "
+                        f"({len(self._in_use)} em uso de {self.max_size})")
+                self._cond.wait(remaining)
+
+        try:
+            if pc is not None:
+                now = time.monotonic()
+                if self._expired(pc, now):
+                    self._close(pc)
+                    with self._cond:
+                        self._counters['recycled'] += 1
+                    pc = self._open()
+                elif not self._healthy(pc, now):
+                    self._close(pc)
+                    with self._cond:
+                        self._counters['health_check_failures'] += 1
+                    pc = self._open()
+            else:
+                pc = self._open()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        now = time.monotonic()
+        pc.uses += 1
+        pc.checked_out_at = now
+        pc.leak_reported = False
+        if self.leak_timeout:
+            pc.checkout_stack = traceback.extract_stack(limit=12)[:-1]
+        with self._cond:
+            self._in_use[id(pc.conn)] = pc
+            self._counters['checkouts'] += 1
+            self._wait_time_total += now - start
+        return pc.conn
+
+    def release(self, conn, discard=False):
+        """Devolve a conexão ao pool; descarta se estiver quebrada ou vencida"""
+        with self._cond:
+            pc = self._in_use.pop(id(conn), None)
+        if pc is None:
+            logger.warning("⚠️ Conexão devolvida não pertence ao pool")
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return
+
+        now = time.monotonic()
+        held = now - pc.checked_out_at
+        if self.leak_timeout and held > self.leak_timeout and not pc.leak_reported:
+            logger.warning(f"⚠️ Conexão ficou {held:.1f}s fora do pool")
+        pc.checked_out_at = None
+        pc.checkout_stack = None
+        pc.last_used_at = now
+
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+
+        expired = self._expired(pc, now)
+        if discard or conn.closed or self._closed or expired:
+            self._close(pc)
+            with self._cond:
+                self._size -= 1
+                if expired:
+                    self._counters['recycled'] += 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._idle.append(pc)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    # Diagnóstico
+
+    def _check_leaks_locked(self, now):
+        if not self.leak_timeout or now - self._last_leak_check < 1.0:
+            return
+        self._last_leak_check = now
+        for pc in self._in_use.values():
+            if pc.leak_reported or now - pc.checked_out_at <= self.leak_timeout:
+                continue
+            pc.leak_reported = True
+            self._counters['leaks_detected'] += 1
+            origem = ''.join(traceback.format_list(pc.checkout_stack or []))
+            logger.error(f"🚰 Possível vazamento de conexão: fora do pool há "
+                         f"{now - pc.checked_out_at:.1f}s. Checkout em:\n{origem}")
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            self._check_leaks_locked(now)
+            checkouts = self._counters['checkouts']
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'longest_checkout_s': round(max(
+                    (now - pc.checked_out_at for pc in self._in_use.values()),
+                    default=0.0), 3),
+                'avg_wait_ms': round(self._wait_time_total / checkouts * 1000, 3) if checkouts else 0.0,
+                **self._counters,
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for pc in idle:
+            self._close(pc)
+
+
+# Pools deste processo: 'primario' (DATABASE_URL) e 'replica' (DATABASE_READ_URL)
+_pools = {}
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _config_pool(prefixo, nome, padrao, tipo):
+    """DB_READ_POOL_* cai para o DB_POOL_* correspondente"""
+    valor = os.environ.get(f'{prefixo}_{nome}', os.environ.get(f'DB_POOL_{nome}', padrao))
+    return tipo(valor)
+
+
+def _obter_pool(chave, database_url, prefixo):
+    global _pools, _pool_pid
+    pid = os.getpid()
+    if _pool_pid == pid and chave in _pools:
+        return _pools[chave]
+    with _pool_lock:
+        if _pool_pid != pid:
+            _pools = {}
+            _pool_pid = pid
+        if chave not in _pools:
+            if not database_url:
+                return None
+            pool = ConnectionPool(
+                database_url,
+                min_size=_config_pool(prefixo, 'MIN', 1, int),
+                max_size=_config_pool(prefixo, 'MAX', 5, int),
+                timeout=_config_pool(prefixo, 'TIMEOUT', 5, float),
+                max_uses=_config_pool(prefixo, 'MAX_USES', 1000, int),
+                max_age=_config_pool(prefixo, 'MAX_AGE', 1800, float),
+                health_check_after=_config_pool(prefixo, 'HEALTH_CHECK_AFTER', 10, float),
+                leak_timeout=_config_pool(prefixo, 'LEAK_TIMEOUT', 30, float),
+                connect_timeout=_config_pool(prefixo, 'CONNECT_TIMEOUT', 5, int),
+            )
+            _pools[chave] = pool
+            try:
+                pool.fill()
+            except Exception as e:
+                logger.error(f"❌ Erro ao abrir conexões iniciais do pool ({chave}): {e}")
+    return _pools[chave]
+
+
+def get_pool():
+    """Retorna o pool deste processo, criando-o no primeiro uso.
+
+    O pool é criado por PID para que workers do gunicorn nunca herdem
+    conexões abertas pelo processo mestre.
+    """
+    return _obter_pool('primario', get_database_url(), 'DB_POOL')
+
+
+def get_read_pool():
+    """Pool da réplica de leitura deste processo, ou None sem DATABASE_READ_URL"""
+    return _obter_pool('replica', get_read_database_url(), 'DB_READ_POOL')
+
+
+@contextmanager
+def db_connection(timeout=None, replica=False):
+    """Empresta uma conexão do pool durante o bloco `with`.
+
+    Entrega None quando o banco não está disponível, para que as rotas
+    possam renderizar a mensagem de erro. A conexão sempre volta ao pool na
+    saída do bloco; transações não confirmadas são desfeitas. `timeout`
+    limita a espera por uma conexão livre (padrão: DB_POOL_TIMEOUT).
+
+    Com replica=True a conexão vem do pool da réplica; as rotas usam
+    leituras.db_leitura(), que decide quando a réplica serve.
+    """
+    pool = get_read_pool() if replica else get_pool()
+    if pool is None:
+        logger.error("DATABASE_READ_URL não encontrada" if replica else "DATABASE_URL não encontrada")
+        yield None
+        return
+    try:
+        with medir_fase('connect'):
+            conn = pool.acquire(timeout)
+    except Exception as e:
+        logger.error(f"❌ Erro ao conectar com {'a réplica' if replica else 'o banco'}: {e}")
+        yield None
+        return
+    discard = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        discard = True
+        raise
+    finally:
+        pool.release(conn, discard=discard)
+
+
+def fechar_pool():
+    """Fecha os pools deste processo (o mestre do gunicorn chama antes do fork)"""
+    global _pools, _pool_pid
+    with _pool_lock:
+        if _pool_pid == os.getpid():
+            for pool in _pools.values():
+                pool.close()
+        _pools = {}
+        _pool_pid = None
+
+
+def pool_stats():
+    pool = get_pool()
+    return pool.stats() if pool is not None else None
+
+
+def read_pool_stats():
+    pool = get_read_pool()
+    return pool.stats() if pool is not None else None
@@ -0,0 +1,258 @@
+"""Escritas das rotas de tarefas, com commit em grupo opcional.
+
+Cada alteração (adicionar, concluir, reabrir, excluir, limpar concluídas)
+é uma função de tarefas.py que recebe o cursor; executar_escrita() decide a
+transação. No caminho direto (padrão) cada requisição pega uma conexão e
+faz o próprio COMMIT, pagando um flush do WAL por escrita.
+
+Com COMMIT_EM_GRUPO=1, as escritas das threads de um worker entram numa
+fila e uma thread as grava juntas: espera até COMMIT_GRUPO_INTERVALO_MS
+milissegundos (ou COMMIT_GRUPO_MAX_OPERACOES operações), executa todas numa
+transação e faz um único COMMIT. Cada requisição continua esperando o COMMIT
+do seu grupo antes de responder, então o redirect só sai com a escrita
+durável. Cada operação roda entre SAVEPOINT e RELEASE: se uma falha, só ela
+é desfeita e a exceção vai para a requisição dela; as outras seguem.
+
+Se a conexão cai antes do COMMIT, nada foi gravado e as operações são
+refeitas uma a uma pelo caminho direto. Se cai durante o COMMIT, não dá
+para saber se gravou; todas recebem o erro em vez de arriscar duplicar.
+
+Se a requisição desiste de esperar (COMMIT_GRUPO_TIMEOUT), o resultado é
+desconhecido: a operação continua na fila e ainda pode ser gravada pelo
+grupo. Ela recebe EscritaIndisponivel como as demais, mas o log diz que a
+escrita pode ter acontecido.
+
+Falhar ao ler o LSN depois do COMMIT não desfaz nada: a escrita vale e só
+fica sem o LSN para o read-your-writes (leituras.py).
+"""
+import os
+import time
+import queue
+import logging
+import threading
+
+import psycopg2
+from psycopg2 import errors
+
+from db import db_connection, get_database_url
+from leituras import lsn_atual, registrar_escrita
+
+logger = logging.getLogger(__name__)
+
+COMMIT_EM_GRUPO = os.environ.get('COMMIT_EM_GRUPO', '0') == '1'
+COMMIT_GRUPO_INTERVALO_MS = float(os.environ.get('COMMIT_GRUPO_INTERVALO_MS', 2))
+COMMIT_GRUPO_MAX_OPERACOES = int(os.environ.get('COMMIT_GRUPO_MAX_OPERACOES', 64))
+# Quanto uma requisição espera o grupo dela antes de desistir
+COMMIT_GRUPO_TIMEOUT = float(os.environ.get('COMMIT_GRUPO_TIMEOUT', 30))
+
+
+class EscritaIndisponivel(Exception):
+    """Não foi possível gravar: sem conexão com o banco"""
+
+
+def _executar_direto(funcao, user_id, *args):
+    """Transação própria; retorna (resultado, LSN do COMMIT para leituras.py)"""
+    with db_connection() as conn:
+        if conn is None:
+            raise EscritaIndisponivel()
+        try:
+            with conn.cursor() as cur:
+                resultado = funcao(cur, user_id, *args)
+        except errors.InvalidSqlStatementName:
+            # O servidor esqueceu um comando preparado no meio da transação;
+            # consultas.py já voltou ao texto puro nesta conexão: refaz uma vez
+            conn.rollback()
+            with conn.cursor() as cur:
+                resultado = funcao(cur, user_id, *args)
+        conn.commit()
+        return resultado, lsn_atual(conn)
+
+
+class Operacao:
+    __slots__ = ('funcao', 'user_id', 'args', 'resultado', 'lsn', 'erro', 'pronta')
+
+    def __init__(self, funcao, user_id, args):
+        self.funcao = funcao
+        self.user_id = user_id
+        self.args = args
+        self.resultado = None
+        self.lsn = None
+        self.erro = None
+        self.pronta = threading.Event()
+
+
+class CommitEmGrupo:
+    """Fila de escritas deste processo, gravadas em grupo por uma thread"""
+
+    def __init__(self, intervalo=COMMIT_GRUPO_INTERVALO_MS / 1000, max_operacoes=COMMIT_GRUPO_MAX_OPERACOES):
+        self.intervalo = intervalo
+        self.max_operacoes = max(1, max_operacoes)
+        self._lock = threading.Lock()
+        self._fila = None
+        self._thread = None
+        self._pid = None
+        self.grupos = 0
+        self.operacoes = 0
+        self.falhas = 0
+        self.refeitas = 0
+        self.maior_grupo = 0
+
+    def _iniciar(self):
+        """Inicia a thread deste processo, se ainda não estiver rodando"""
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == pid and self._thread is not None:
+                return
+            # Após um fork, a fila e a thread do processo pai não servem aqui
+            self._fila = queue.Queue()
+            self._pid = pid
+            self._thread = threading.Thread(target=self._executar, name='commit-em-grupo', daemon=True)
+            self._thread.start()
+
+    def executar(self, funcao, user_id, *args):
+        """Enfileira `funcao(cur, user_id, *args)`, espera o COMMIT do grupo e retorna (resultado, LSN)"""
+        self._iniciar()
+        operacao = Operacao(funcao, user_id, args)
+        self._fila.put(operacao)
+        if not operacao.pronta.wait(COMMIT_GRUPO_TIMEOUT):
+            # A operação segue na fila: o grupo dela ainda pode gravá-la
+            logger.error(f"❌ Escrita do usuário {user_id[:8]} sem resposta em {COMMIT_GRUPO_TIMEOUT:.0f}s; "
+                         "resultado desconhecido, pode ter sido gravada")
+            raise EscritaIndisponivel()
+        if operacao.erro is not None:
+            raise operacao.erro
+        return operacao.resultado, operacao.lsn
+
+    def _coletar(self):
+        """Bloqueia até a primeira operação e junta as que chegarem no intervalo"""
+        lote = [self._fila.get()]
+        prazo = time.monotonic() + self.intervalo
+        while len(lote) < self.max_operacoes:
+            restante = prazo - time.monotonic()
+            try:
+                lote.append(self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _executar(self):
+        while True:
+            lote = self._coletar()
+            try:
+                self._gravar(lote)
+            except Exception as e:
+                logger.error(f"❌ Erro inesperado no commit em grupo: {e}")
+                for operacao in lote:
+                    if operacao.erro is None:
+                        operacao.erro = e
+            finally:
+                for operacao in lote:
+                    operacao.pronta.set()
+
+    def _aplicar(self, cur, operacao, refeita=False):
+        cur.execute('SAVEPOINT operacao')
+        try:
+            operacao.resultado = operacao.funcao(cur, operacao.user_id, *operacao.args)
+        except errors.InvalidSqlStatementName as e:
+            # Vem como OperationalError, mas a conexão está boa: o servidor
+            # esqueceu os comandos preparados e consultas.py já voltou ao
+            # texto puro; só esta operação é refeita
+            cur.execute('ROLLBACK TO SAVEPOINT operacao')
+            if refeita:
+                operacao.erro = e
+            else:
+                self._aplicar(cur, operacao, refeita=True)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # Conexão perdida: o grupo inteiro é refeito
+            raise
+        except Exception as e:
+            cur.execute('ROLLBACK TO SAVEPOINT operacao')
+            operacao.erro = e
+        else:
+            cur.execute('RELEASE SAVEPOINT operacao')
+
+    def _gravar(self, lote):
+        # Mesma ordem de usuários em todos os processos: dois grupos
+        # concorrentes travam versoes_conteudo na mesma ordem e não entram
+        # em deadlock (sort estável, a ordem de cada usuário é mantida)
+        ordenado = sorted(lote, key=lambda operacao: operacao.user_id)
+        commit_enviado = False
+        try:
+            with db_connection() as conn:
+                if conn is None:
+                    for operacao in lote:
+                        operacao.erro = EscritaIndisponivel()
+                    self._contar(lote)
+                    return
+                with conn.cursor() as cur:
+                    for operacao in ordenado:
+                        self._aplicar(cur, operacao)
+                commit_enviado = True
+                conn.commit()
+                # lsn_atual() não levanta: depois do COMMIT nenhuma operação pode virar erro
+                lsn = lsn_atual(conn)
+                for operacao in lote:
+                    operacao.lsn = lsn
+        except Exception as e:
+            if commit_enviado:
+                logger.error(f"❌ COMMIT de um grupo de {len(lote)} escritas falhou: {e}")
+                for operacao in lote:
+                    operacao.erro = e
+            else:
+                logger.warning(f"⚠️ Grupo de {len(lote)} escritas desfeito ({e}); gravando uma a uma")
+                self._refazer(ordenado)
+        self._contar(lote)
+
+    def _refazer(self, lote):
+        for operacao in lote:
+            operacao.resultado, operacao.lsn, operacao.erro = None, None, None
+            try:
+                operacao.resultado, operacao.lsn = _executar_direto(operacao.funcao, operacao.user_id, *operacao.args)
+            except Exception as e:
+                operacao.erro = e
+        with self._lock:
+            self.refeitas += len(lote)
+
+    def _contar(self, lote):
+        with self._lock:
+            self.grupos += 1
+            self.operacoes += len(lote)
+            self.falhas += sum(1 for operacao in lote if operacao.erro is not None)
+            self.maior_grupo = max(self.maior_grupo, len(lote))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': COMMIT_EM_GRUPO,
+                'interval_ms': self.intervalo * 1000,
+                'max_operations': self.max_operacoes,
+                'queued': self._fila.qsize() if self._fila is not None and self._pid == os.getpid() else 0,
+                'groups': self.grupos,
+                'operations': self.operacoes,
+                'avg_group_size': round(self.operacoes / self.grupos, 2) if self.grupos else 0,
+                'max_group_size': self.maior_grupo,
+                'failed': self.falhas,
+                'retried_individually': self.refeitas,
+            }
+
+
+commit_em_grupo = CommitEmGrupo()
+
+
+def executar_escrita(funcao, user_id, *args):
+    """Executa `funcao(cur, user_id, *args)` numa transação confirmada e retorna seu resultado.
+
+    Levanta EscritaIndisponivel sem conexão com o banco e repassa a exceção
+    da própria operação. Com COMMIT_EM_GRUPO, a transação é compartilhada
+    com as escritas concorrentes deste processo; se o grupo não responde em
+    COMMIT_GRUPO_TIMEOUT, também levanta EscritaIndisponivel, mas aí a
+    escrita pode ter sido gravada.
+    """
+    if COMMIT_EM_GRUPO and get_database_url():
+        resultado, lsn = commit_em_grupo.executar(funcao, user_id, *args)
+    else:
+        resultado, lsn = _executar_direto(funcao, user_id, *args)
+    registrar_escrita(lsn)
+    return resultado
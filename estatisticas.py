@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+
+from consultas import registrar
+
+# Uma única ida ao banco: o conjunto vazio () dá o total geral e os outros
+# dois conjuntos dão as quebras por categoria e por prioridade. As tarefas
+# arquivadas (todas concluídas) entram pelas contagens de
+# contagem_arquivadas, sem ler o arquivo linha a linha.
+SQL_ESTATISTICAS = '''
+    SELECT GROUPING(categoria), GROUPING(prioridade), categoria, prioridade,
+           coalesce(SUM(total), 0)::int, coalesce(SUM(concluidas), 0)::int
+    FROM (
+        SELECT coalesce(categoria, 'Geral') AS categoria, coalesce(prioridade, 'Média') AS prioridade,
+               1 AS total, concluida::int AS concluidas
+        FROM tarefas
+        WHERE user_id = %(user_id)s
+        UNION ALL
+        SELECT categoria, prioridade, total, total
+        FROM contagem_arquivadas
+        WHERE user_id = %(user_id)s
+    ) t
+    GROUP BY GROUPING SETS ((), (categoria), (prioridade))
+'''
+ESTATISTICAS = registrar('estatisticas', SQL_ESTATISTICAS)
+
+# Memo opcional por usuário (segundos); 0 desliga
+MEMO_TTL = float(os.environ.get('ESTATISTICAS_MEMO_TTL', 0))
+MEMO_MAX_USUARIOS = 10000
+
+_memo = {}
+_memo_lock = threading.Lock()
+
+
+def _contagem(total, concluidas):
+    return {'total': total, 'concluidas': concluidas, 'pendentes': total - concluidas}
+
+
+def calcular_estatisticas(conn, user_id):
+    """Calcula total/concluídas/pendentes e as quebras por categoria e prioridade"""
+    with conn.cursor() as cur:
+        ESTATISTICAS.executar(cur, {'user_id': user_id})
+        rows = cur.fetchall()
+
+    estatisticas = {**_contagem(0, 0), 'por_categoria': {}, 'por_prioridade': {}}
+    for sem_categoria, sem_prioridade, categoria, prioridade, total, concluidas in rows:
+        if sem_categoria and sem_prioridade:
+            estatisticas.update(_contagem(total, concluidas))
+        elif sem_prioridade:
+            estatisticas['por_categoria'][categoria or 'Geral'] = _contagem(total, concluidas)
+        else:
+            estatisticas['por_prioridade'][prioridade or 'Média'] = _contagem(total, concluidas)
+    return estatisticas
+
+
+def obter_estatisticas(conn, user_id):
+    """Estatísticas do usuário, usando o memo quando ESTATISTICAS_MEMO_TTL > 0"""
+    if MEMO_TTL <= 0:
+        return calcular_estatisticas(conn, user_id)
+
+    agora = time.monotonic()
+    with _memo_lock:
+        item = _memo.get(user_id)
+        if item is not None and item[0] > agora:
+            return item[1]
+
+    estatisticas = calcular_estatisticas(conn, user_id)
+    with _memo_lock:
+        if len(_memo) >= MEMO_MAX_USUARIOS:
+            for chave in [k for k, (expira, _) in _memo.items() if expira <= agora]:
+                del _memo[chave]
+            if len(_memo) >= MEMO_MAX_USUARIOS:
+                _memo.clear()
+        _memo[user_id] = (agora + MEMO_TTL, estatisticas)
+    return estatisticas
+
+
+def invalidar_estatisticas(user_id):
+    """Descarta o memo do usuário; chamado pelas rotas que alteram tarefas"""
+    with _memo_lock:
+        _memo.pop(user_id, None)
+
+
+def limpar_estatisticas():
+    """Descarta o memo de todos os usuários"""
+    with _memo_lock:
+        _memo.clear()
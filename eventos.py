@@ -0,0 +1,224 @@
+"""Atualizações ao vivo da lista de tarefas por Server-Sent Events.
+
+Cada aba aberta mantém um EventSource em /events. Os avisos de alteração
+que chegam pelo LISTEN/NOTIFY (ver notificacoes.py) são repassados pelo
+Difusor às filas das conexões daquele usuário neste processo; o gerador de
+cada conexão busca as tarefas alteradas, renderiza o fragmento
+_tarefa.html e envia só o que mudou, junto com as contagens.
+
+Eventos enviados ao navegador:
+- tarefa: {"id", "concluida", "html"} para tarefa criada ou alterada;
+- removida: {"ids"} para tarefas excluídas;
+- limpas: tarefas concluídas foram excluídas em lote;
+- estatisticas: {"total", "concluidas", "pendentes"};
+- recarregar: avisos podem ter se perdido, a página deve ser recarregada;
+- ocupado: o processo já está no limite de conexões; o stream fecha e o
+  EventSource tenta de novo depois de EVENTOS_RETRY_OCUPADO segundos.
+
+Cada conexão ocupa uma thread do worker (gunicorn gthread), então o número
+de conexões por processo é limitado e cada uma é encerrada depois de
+EVENTOS_DURACAO_MAXIMA segundos; o EventSource reconecta sozinho.
+"""
+import os
+import json
+import time
+import queue
+import logging
+import threading
+
+from flask import Blueprint, Response, request, render_template, stream_with_context
+
+from db import db_connection
+from notificacoes import ouvinte
+from estatisticas import obter_estatisticas
+from tarefas import consultar_tarefas_por_id
+
+logger = logging.getLogger(__name__)
+
+eventos = Blueprint('eventos', __name__)
+
+# Metade das threads do worker (gunicorn.conf.py): o resto fica para as requisições comuns
+EVENTOS_MAX_CONEXOES = int(os.environ.get('EVENTOS_MAX_CONEXOES', int(os.environ.get('GUNICORN_THREADS', 16)) // 2))
+EVENTOS_DURACAO_MAXIMA = float(os.environ.get('EVENTOS_DURACAO_MAXIMA', 300))
+EVENTOS_HEARTBEAT = float(os.environ.get('EVENTOS_HEARTBEAT', 15))
+TAMANHO_FILA = 100
+# Quando o limite de conexões foi atingido, em quanto tempo o navegador tenta de novo
+EVENTOS_RETRY_OCUPADO = float(os.environ.get('EVENTOS_RETRY_OCUPADO', 30))
+
+# Marcador posto na fila quando avisos se perderam
+RECARREGAR = {'acao': 'recarregar'}
+
+
+class Difusor:
+    """Distribui os avisos de alteração às conexões SSE abertas neste processo"""
+
+    def __init__(self, max_conexoes=EVENTOS_MAX_CONEXOES):
+        self.max_conexoes = max_conexoes
+        self._lock = threading.Lock()
+        self._filas = {}
+        # Filas abertas antes de o ouvinte conectar: o primeiro None é só o
+        # aviso de conexão, não de avisos perdidos
+        self._antes_do_ouvinte = set()
+        self._conexoes = 0
+        self.eventos_enviados = 0
+        self.recusadas = 0
+        self.transbordos = 0
+        ouvinte.assinar(self._repassar)
+
+    def conectar(self, user_id):
+        """Registra uma conexão e retorna sua fila, ou None se o limite foi atingido"""
+        with self._lock:
+            if self._conexoes >= self.max_conexoes:
+                self.recusadas += 1
+                return None
+            fila = queue.Queue(maxsize=TAMANHO_FILA)
+            self._filas.setdefault(user_id, set()).add(fila)
+            if not ouvinte.conectado:
+                self._antes_do_ouvinte.add(fila)
+            self._conexoes += 1
+        ouvinte.iniciar()
+        return fila
+
+    def desconectar(self, user_id, fila):
+        with self._lock:
+            filas = self._filas.get(user_id)
+            if filas is None or fila not in filas:
+                return
+            filas.discard(fila)
+            self._antes_do_ouvinte.discard(fila)
+            if not filas:
+                del self._filas[user_id]
+            self._conexoes -= 1
+
+    def contar_enviados(self, quantidade):
+        with self._lock:
+            self.eventos_enviados += quantidade
+
+    def _entregar(self, fila, evento):
+        try:
+            fila.put_nowait(evento)
+        except queue.Full:
+            # Cliente lento: descarta o acumulado e pede que recarregue
+            self.transbordos += 1
+            while True:
+                try:
+                    fila.get_nowait()
+                except queue.Empty:
+                    break
+            fila.put_nowait(RECARREGAR)
+
+    def _repassar(self, evento):
+        with self._lock:
+            if evento is None:
+                # Ouvinte (re)conectou ou caiu: o que as abas mostram pode estar desatualizado
+                destinos = [(fila, RECARREGAR) for filas in self._filas.values() for fila in filas
+                            if fila not in self._antes_do_ouvinte]
+                self._antes_do_ouvinte.clear()
+            else:
+                destinos = [(fila, evento) for fila in self._filas.get(evento.get('user_id'), ())]
+        for fila, item in destinos:
+            self._entregar(fila, item)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'connections': self._conexoes,
+                'users': len(self._filas),
+                'max_connections': self.max_conexoes,
+                'events_sent': self.eventos_enviados,
+                'rejected': self.recusadas,
+                'overflows': self.transbordos,
+            }
+
+
+difusor = Difusor()
+
+
+def _sse(evento, dados=None):
+    return f'event: {evento}\ndata: {json.dumps(dados if dados is not None else {})}\n\n'
+
+
+def renderizar_tarefa(tarefa):
+    """Fragmento HTML de uma tarefa, o mesmo usado na listagem de index.html"""
+    return render_template('_tarefa.html', tarefa=tarefa)
+
+
+def _mensagens(user_id, evento):
+    """Converte um aviso de alteração nas mensagens SSE para o navegador.
+
+    Monta tudo antes de devolver, para não segurar a conexão do pool
+    enquanto escreve para um cliente lento.
+    """
+    acao = evento.get('acao')
+    ids = evento.get('ids')
+    if acao == 'recarregar' or (acao != 'limpas' and not ids):
+        # Aviso sem detalhes (ex.: lote grande da API): não dá para aplicar um delta
+        return [_sse('recarregar')]
+
+    mensagens = []
+    with db_connection() as conn:
+        if conn is None:
+            return [_sse('recarregar')]
+        if acao == 'removida':
+            mensagens.append(_sse('removida', {'ids': ids}))
+        elif acao == 'limpas':
+            mensagens.append(_sse('limpas'))
+        else:
+            tarefas = consultar_tarefas_por_id(conn, user_id, ids)
+            for tarefa in tarefas:
+                mensagens.append(_sse('tarefa', {'id': tarefa.id, 'concluida': tarefa.concluida,
+                                                 'html': renderizar_tarefa(tarefa)}))
+            # Alteradas e depois excluídas antes de chegarmos aqui
+            encontrados = {tarefa.id for tarefa in tarefas}
+            sumidos = [id_ for id_ in ids if id_ not in encontrados]
+            if sumidos:
+                mensagens.append(_sse('removida', {'ids': sumidos}))
+        estatisticas = obter_estatisticas(conn, user_id)
+        conn.rollback()
+    mensagens.append(_sse('estatisticas', {chave: estatisticas[chave] for chave in ('total', 'concluidas', 'pendentes')}))
+    return mensagens
+
+
+def _fluxo(user_id, fila):
+    try:
+        # Intervalo de reconexão do EventSource, em milissegundos
+        yield 'retry: 3000\n\n'
+        fim = time.monotonic() + EVENTOS_DURACAO_MAXIMA
+        while time.monotonic() < fim:
+            try:
+                evento = fila.get(timeout=min(EVENTOS_HEARTBEAT, max(fim - time.monotonic(), 0.1)))
+            except queue.Empty:
+                # Comentário SSE: mantém proxies abertos e detecta clientes que sumiram
+                yield ': ping\n\n'
+                continue
+            mensagens = _mensagens(user_id, evento)
+            difusor.contar_enviados(len(mensagens))
+            for mensagem in mensagens:
+                yield mensagem
+    except Exception as e:
+        logger.error(f"❌ Erro no fluxo de eventos do usuário {user_id[:8]}: {e}")
+    finally:
+        difusor.desconectar(user_id, fila)
+
+
+@eventos.route('/events')
+def fluxo_de_eventos():
+    user_id = request.cookies.get('user_id')
+    if not user_id:
+        # 204 faz o EventSource parar de tentar
+        return Response(status=204)
+    fila = difusor.conectar(user_id)
+    if fila is None:
+        # Com um status diferente de 200 o EventSource desiste para sempre:
+        # responde 200 com o intervalo de nova tentativa e fecha. Enquanto
+        # isso a página funciona sem SSE (recarrega depois de cada ação)
+        corpo = f'retry: {int(EVENTOS_RETRY_OCUPADO * 1000)}\n\n' + _sse('ocupado')
+        return Response(corpo, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    response = Response(stream_with_context(_fluxo(user_id, fila)), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # Proxies com buffer (nginx) seguram o stream sem isto
+        'X-Accel-Buffering': 'no',
+    })
+    # Se o cliente sair antes do primeiro byte, o finally do gerador não roda
+    response.call_on_close(lambda: difusor.desconectar(user_id, fila))
+    return response
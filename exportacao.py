@@ -0,0 +1,267 @@
+"""Exportação em streaming (NDJSON/CSV) e importação via COPY das tarefas.
+
+A exportação lê com um cursor nomeado (server-side) em lotes e envia cada
+lote assim que chega, então a memória não cresce com o tamanho da lista. A
+importação valida as linhas enquanto lê o upload e as entrega direto ao
+COPY FROM STDIN, sem montar a lista inteira em memória.
+"""
+import io
+import csv
+import json
+import logging
+from contextlib import ExitStack
+from datetime import date, datetime
+
+import psycopg2
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+
+from db import db_connection
+from notificacoes import notificar
+from leituras import registrar_commit
+from tarefas import CATEGORIAS, PRIORIDADES, TODAS, invalidar_caches
+
+logger = logging.getLogger(__name__)
+
+exportacao = Blueprint('exportacao', __name__)
+
+CAMPOS_EXPORTADOS = ('id', 'descricao', 'categoria', 'prioridade', 'prazo', 'concluida', 'data_criacao')
+CAMPOS_IMPORTADOS = ('descricao', 'categoria', 'prioridade', 'prazo', 'concluida', 'data_criacao')
+LINHAS_POR_LOTE = 2000
+MAX_ERROS_REPORTADOS = 50
+
+VERDADEIROS = {'true', 't', '1', 'sim', 's', 'yes', 'y'}
+FALSOS = {'false', 'f', '0', 'não', 'nao', 'n', 'no', ''}
+
+
+def _valor_json(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return valor
+
+
+def _gerar_exportacao(pilha, conn, user_id, formato):
+    """Gera o arquivo na conexão já emprestada por exportar(); devolve-a ao pool no fim"""
+    try:
+        # Cursor nomeado: o Postgres mantém o resultado e envia itersize linhas por vez
+        with conn.cursor(name='exportacao_tarefas') as cur:
+            cur.itersize = LINHAS_POR_LOTE
+            cur.execute(f"SELECT {', '.join(CAMPOS_EXPORTADOS)} FROM {TODAS} "
+                        "WHERE user_id = %s ORDER BY id", (user_id,))
+
+            buffer = io.StringIO()
+            escritor = csv.writer(buffer) if formato == 'csv' else None
+            if escritor:
+                escritor.writerow(CAMPOS_EXPORTADOS)
+
+            linhas = 0
+            for row in cur:
+                if escritor:
+                    escritor.writerow(_valor_json(v) for v in row)
+                else:
+                    buffer.write(json.dumps(dict(zip(CAMPOS_EXPORTADOS, map(_valor_json, row))),
+                                            ensure_ascii=False))
+                    buffer.write('\n')
+                linhas += 1
+                if linhas % LINHAS_POR_LOTE == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+        conn.rollback()
+    finally:
+        pilha.close()
+    logger.info("📤 Exportadas %d tarefas (%s) para user_id %s", linhas, formato, user_id[:8])
+
+
+@exportacao.route('/export')
+def exportar():
+    user_id = request.cookies.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'usuário não identificado'}), 401
+    formato = request.args.get('format', 'ndjson')
+    if formato not in ('ndjson', 'csv'):
+        return jsonify({'error': f'formato inválido: {formato!r}'}), 400
+
+    # A conexão vem antes da resposta: depois do 200 não há como avisar o
+    # cliente, que receberia um arquivo truncado
+    pilha = ExitStack()
+    conn = pilha.enter_context(db_connection())
+    if conn is None:
+        pilha.close()
+        return jsonify({'error': 'banco de dados indisponível'}), 503
+
+    mimetype = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(_gerar_exportacao(pilha, conn, user_id, formato)), mimetype=mimetype)
+    # Se o gerador nunca começar (cliente desconectou antes), o finally dele
+    # não roda; fechar a pilha de novo depois não faz nada
+    response.call_on_close(pilha.close)
+    response.headers['Content-Disposition'] = f'attachment; filename=tarefas.{formato}'
+    return response
+
+
+class ErroLinha(ValueError):
+    pass
+
+
+def _validar_linha(dados, agora):
+    """Valida uma linha importada e retorna a tupla na ordem de CAMPOS_IMPORTADOS"""
+    descricao = (dados.get('descricao') or '').strip()
+    if not descricao:
+        raise ErroLinha('descricao vazia')
+
+    categoria = dados.get('categoria') or 'Geral'
+    if categoria not in CATEGORIAS:
+        raise ErroLinha(f'categoria inválida: {categoria!r}')
+
+    prioridade = dados.get('prioridade') or 'Média'
+    if prioridade not in PRIORIDADES:
+        raise ErroLinha(f'prioridade inválida: {prioridade!r}')
+
+    prazo = dados.get('prazo') or None
+    if prazo is not None:
+        try:
+            prazo = date.fromisoformat(str(prazo)).isoformat()
+        except ValueError:
+            raise ErroLinha(f'prazo inválido (use AAAA-MM-DD): {prazo!r}')
+
+    concluida = dados.get('concluida', False)
+    if not isinstance(concluida, bool):
+        texto = str(concluida if concluida is not None else '').strip().lower()
+        if texto in VERDADEIROS:
+            concluida = True
+        elif texto in FALSOS:
+            concluida = False
+        else:
+            raise ErroLinha(f'concluida inválida: {concluida!r}')
+
+    data_criacao = dados.get('data_criacao') or None
+    if data_criacao is None:
+        data_criacao = agora
+    else:
+        try:
+            data_criacao = datetime.fromisoformat(str(data_criacao).replace('Z', '+00:00')).isoformat()
+        except ValueError:
+            raise ErroLinha(f'data_criacao inválida: {data_criacao!r}')
+
+    return descricao, categoria, prioridade, prazo, 't' if concluida else 'f', data_criacao
+
+
+def _ler_registros(stream, formato):
+    """Gera (número da linha, dicionário) a partir do upload, sem carregá-lo inteiro"""
+    texto = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if formato == 'csv':
+        leitor = csv.DictReader(texto)
+        for registro in leitor:
+            yield leitor.line_num, registro
+    else:
+        for numero, linha in enumerate(texto, start=1):
+            if not linha.strip():
+                continue
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                yield numero, None
+                continue
+            yield numero, registro
+
+
+class _FonteCopy:
+    """Arquivo somente-leitura que o COPY consome, gerando CSV sob demanda"""
+
+    def __init__(self, user_id, registros):
+        self.user_id = user_id
+        self.registros = registros
+        self.agora = datetime.now().isoformat()
+        self.importadas = 0
+        self.invalidas = 0
+        self.erros = []
+        self._buffer = io.StringIO()
+        self._escritor = csv.writer(self._buffer)
+        self._pendente = b''
+        self._fim = False
+        self.falha = None
+
+    def _encher(self, minimo):
+        while len(self._pendente) < minimo and not self._fim:
+            for numero, registro in self.registros:
+                try:
+                    if not isinstance(registro, dict):
+                        raise ErroLinha('linha não é um objeto JSON')
+                    valores = _validar_linha(registro, self.agora)
+                except ErroLinha as e:
+                    self.invalidas += 1
+                    if len(self.erros) < MAX_ERROS_REPORTADOS:
+                        self.erros.append({'line': numero, 'error': str(e)})
+                    continue
+                self._escritor.writerow((self.user_id, *valores))
+                self.importadas += 1
+                if self._buffer.tell() >= minimo:
+                    break
+            else:
+                self._fim = True
+            self._pendente += self._buffer.getvalue().encode('utf-8')
+            self._buffer.seek(0)
+            self._buffer.truncate()
+
+    def read(self, tamanho=-1):
+        tamanho = tamanho if tamanho and tamanho > 0 else 65536
+        try:
+            self._encher(tamanho)
+        except (UnicodeDecodeError, csv.Error) as e:
+            # O psycopg2 transforma a exceção em QueryCanceled; guardamos a original
+            self.falha = e
+            raise
+        pedaco, self._pendente = self._pendente[:tamanho], self._pendente[tamanho:]
+        return pedaco
+
+
+@exportacao.route('/import', methods=['POST'])
+def importar():
+    user_id = request.cookies.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'usuário não identificado'}), 401
+
+    arquivo = request.files.get('arquivo')
+    if arquivo is not None:
+        stream = arquivo.stream
+        nome = arquivo.filename or ''
+    else:
+        stream = request.stream
+        nome = ''
+    formato = request.args.get('format') or ('ndjson' if nome.endswith(('.ndjson', '.jsonl')) else 'csv')
+    if formato not in ('ndjson', 'csv'):
+        return jsonify({'error': f'formato inválido: {formato!r}'}), 400
+
+    fonte = _FonteCopy(user_id, _ler_registros(stream, formato))
+    with db_connection() as conn:
+        if conn is None:
+            return jsonify({'error': 'banco de dados indisponível'}), 503
+        try:
+            with conn.cursor() as cur:
+                cur.copy_expert(
+                    f"COPY tarefas (user_id, {', '.join(CAMPOS_IMPORTADOS)}) FROM STDIN WITH (FORMAT csv)",
+                    fonte, size=65536
+                )
+                if fonte.importadas:
+                    notificar(cur, user_id)
+                conn.commit()
+        except psycopg2.Error:
+            conn.rollback()
+            if isinstance(fonte.falha, UnicodeDecodeError):
+                return jsonify({'error': 'arquivo deve estar em UTF-8'}), 400
+            if fonte.falha is not None:
+                return jsonify({'error': f'CSV inválido: {fonte.falha}'}), 400
+            raise
+        # Fora do try: depois do COMMIT a importação não pode mais virar erro
+        if fonte.importadas:
+            registrar_commit(conn)
+    if fonte.importadas:
+        invalidar_caches(user_id)
+
+    logger.info("📥 Importadas %d tarefas (%d inválidas) para user_id %s", fonte.importadas, fonte.invalidas, user_id[:8])
+    return jsonify({
+        'imported': fonte.importadas,
+        'invalid': fonte.invalidas,
+        'errors': fonte.erros,
+    }), 200
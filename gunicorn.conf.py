@@ -0,0 +1,41 @@
+"""Configuração do gunicorn (usada pelo Dockerfile).
+
+Pensada para máquinas que escalam a zero: o app é carregado uma vez no
+mestre (preload_app), com templates já compilados, e os workers nascem por
+fork já aquecidos em vez de cada um importar tudo de novo.
+
+Tudo é ajustável por ambiente, para comparar configurações com
+benchmarks/bench_carga.py (--worker-class, --workers, --threads):
+WEB_CONCURRENCY, GUNICORN_WORKER_CLASS, GUNICORN_THREADS, GUNICORN_BACKLOG,
+GUNICORN_TIMEOUT e GUNICORN_KEEPALIVE.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+# gthread: cada conexão de /events (SSE, ver eventos.py) ocupa uma thread
+# enquanto está aberta, e o limite de conexões SSE por processo
+# (EVENTOS_MAX_CONEXOES) é metade das threads por padrão. Com sync, uma
+# requisição por worker e o SSE fica recusado.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 16)) if worker_class == 'gthread' else 1
+# admissao.py e eventos.py dimensionam seus limites pelas threads do worker
+os.environ['GUNICORN_THREADS'] = str(threads)
+
+# Fila curta no listen(): em pico, o excesso espera no proxy do Fly (que pode
+# acordar outra máquina) em vez de num backlog enorme deste processo
+backlog = int(os.environ.get('GUNICORN_BACKLOG', 64))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Heartbeat dos workers em memória, não no disco do container
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+def when_ready(server):
+    # Roda no mestre antes do fork: conexões abertas durante o preload
+    # (init_db) não podem ser herdadas pelos workers
+    from db import fechar_pool
+    fechar_pool()
@@ -0,0 +1,260 @@
+"""Leituras na réplica (DATABASE_READ_URL) com read-your-writes.
+
+Sem DATABASE_READ_URL tudo vai para o primário, como sempre. Com ela, as
+páginas que só leem (/, os filtros, /meu-perfil, /debug-db e o diagnóstico
+em cache de /health) usam db_leitura(), que empresta uma conexão da réplica
+quando ela está em dia e do primário quando não está:
+
+- depois de uma escrita, executar_escrita() (escritas.py) e as rotas da API
+  registram o LSN do COMMIT no primário, que vai para o cookie `lsn`. Nas
+  próximas leituras desse usuário a réplica só serve se já reproduziu esse
+  ponto (pg_last_wal_replay_lsn); se não, espera até REPLICA_ESPERA_MAXIMA
+  segundos (padrão: não espera) e cai para o primário. Quando a réplica
+  alcança, o cookie é apagado;
+- se o atraso da réplica passa de REPLICA_ATRASO_MAXIMO segundos, todas as
+  leituras vão para o primário até a próxima verificação;
+- se a réplica não conecta ou uma consulta nela falha por conexão, ela fica
+  de fora por REPLICA_PAUSA_APOS_FALHA segundos.
+
+O LSN replicado e o atraso são consultados na própria conexão emprestada,
+no máximo a cada REPLICA_VERIFICAR_A_CADA segundos (ou quando o cookie
+pede um ponto que a última verificação ainda não tinha visto).
+
+g.leitura_na_replica diz se a última db_leitura() da requisição foi na
+réplica: o que veio de lá pode ser anterior a uma invalidação do cache de
+páginas (cache_tarefas.py) e não deve ser guardado nele. Isso desliga o
+cache para as leituras na réplica, que com ela em dia são quase todas: é a
+troca de ligar DATABASE_READ_URL (skipped_replica, nas métricas do cache,
+conta essas páginas).
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from flask import Blueprint, g, has_request_context, request
+
+from db import db_connection, get_read_database_url, read_pool_stats
+
+logger = logging.getLogger(__name__)
+
+leituras = Blueprint('leituras', __name__)
+
+REPLICA_ATRASO_MAXIMO = float(os.environ.get('REPLICA_ATRASO_MAXIMO', 5))
+REPLICA_VERIFICAR_A_CADA = float(os.environ.get('REPLICA_VERIFICAR_A_CADA', 1))
+REPLICA_ESPERA_MAXIMA = float(os.environ.get('REPLICA_ESPERA_MAXIMA', 0))
+REPLICA_PAUSA_APOS_FALHA = float(os.environ.get('REPLICA_PAUSA_APOS_FALHA', 10))
+# Timeout curto para uma réplica fora do ar não segurar a requisição
+REPLICA_TIMEOUT = float(os.environ.get('REPLICA_TIMEOUT', 0.5))
+
+COOKIE_LSN = 'lsn'
+# Bem mais que o atraso tolerado: depois disso a réplica já alcançou
+COOKIE_LSN_MAX_AGE = 300
+
+# Atraso de reprodução; zero quando tudo o que chegou já foi reproduzido
+# (com o primário parado, now() - último replay cresceria sem atraso real)
+SQL_ESTADO_REPLICA = '''
+    SELECT pg_last_wal_replay_lsn()::text,
+           CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END
+'''
+
+
+def lsn_para_int(texto):
+    """'16/B374D848' -> inteiro comparável; None se inválido"""
+    try:
+        alto, baixo = texto.split('/')
+        return (int(alto, 16) << 32) | int(baixo, 16)
+    except (AttributeError, ValueError):
+        return None
+
+
+class EstadoReplica:
+    """O que este processo sabe da réplica: LSN reproduzido, atraso e falhas"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lsn_reproduzido = None
+        self.atraso = 0.0
+        self.verificado_em = None
+        self.fora_ate = 0.0
+        self.ultima_falha = None
+        self.leituras_replica = 0
+        self.leituras_primario = {}
+
+    def contar(self, motivo=None):
+        """Conta uma leitura: na réplica (motivo None) ou no primário e por quê"""
+        with self._lock:
+            if motivo is None:
+                self.leituras_replica += 1
+            else:
+                self.leituras_primario[motivo] = self.leituras_primario.get(motivo, 0) + 1
+
+    def disponivel(self):
+        """Motivo para nem tentar a réplica agora, ou None"""
+        agora = time.monotonic()
+        with self._lock:
+            if agora < self.fora_ate:
+                return 'replica_down'
+            if (self.atraso > REPLICA_ATRASO_MAXIMO and self.verificado_em is not None
+                    and agora - self.verificado_em < REPLICA_VERIFICAR_A_CADA):
+                return 'replica_lagging'
+        return None
+
+    def falhou(self, erro):
+        with self._lock:
+            self.fora_ate = time.monotonic() + REPLICA_PAUSA_APOS_FALHA
+            self.ultima_falha = str(erro).strip()
+        logger.warning(f"⚠️ Réplica fora das leituras por {REPLICA_PAUSA_APOS_FALHA:.0f}s: {str(erro).strip()}")
+
+    def _verificar(self, conn):
+        with conn.cursor() as cur:
+            cur.execute(SQL_ESTADO_REPLICA)
+            lsn, atraso = cur.fetchone()
+        with self._lock:
+            # NULL fora de recuperação (réplica promovida): tem tudo
+            self.lsn_reproduzido = lsn_para_int(lsn) if lsn else float('inf')
+            self.atraso = float(atraso or 0)
+            self.verificado_em = time.monotonic()
+            return self.lsn_reproduzido, self.atraso
+
+    def pronta(self, conn, lsn_minimo):
+        """Verifica (se preciso) a réplica nesta conexão; retorna o motivo para não usá-la, ou None"""
+        with self._lock:
+            reproduzido, atraso, verificado_em = self.lsn_reproduzido, self.atraso, self.verificado_em
+        if (verificado_em is None or time.monotonic() - verificado_em >= REPLICA_VERIFICAR_A_CADA
+                or (lsn_minimo is not None and reproduzido < lsn_minimo)):
+            reproduzido, atraso = self._verificar(conn)
+        if atraso > REPLICA_ATRASO_MAXIMO:
+            return 'replica_lagging'
+        if lsn_minimo is None or reproduzido >= lsn_minimo:
+            return None
+        limite = time.monotonic() + REPLICA_ESPERA_MAXIMA
+        while time.monotonic() < limite:
+            time.sleep(0.005)
+            reproduzido, _ = self._verificar(conn)
+            if reproduzido >= lsn_minimo:
+                return None
+        return 'behind_user_write'
+
+    def stats(self):
+        pool = read_pool_stats()
+        with self._lock:
+            agora = time.monotonic()
+            return {
+                'configured': bool(get_read_database_url()),
+                'replay_lag_s': round(self.atraso, 3),
+                'checked_s_ago': round(agora - self.verificado_em, 1) if self.verificado_em is not None else None,
+                'down_for_s': round(max(self.fora_ate - agora, 0), 1),
+                'last_error': self.ultima_falha,
+                'replica_reads': self.leituras_replica,
+                'primary_reads': dict(self.leituras_primario),
+                'pool': pool,
+            }
+
+
+estado = EstadoReplica()
+
+
+def _lsn_minimo():
+    """Maior LSN que o usuário desta requisição já escreveu, ou None"""
+    if not has_request_context():
+        return None
+    lsns = [lsn_para_int(request.cookies.get(COOKIE_LSN)), g.get('lsn_escrita')]
+    lsns = [lsn for lsn in lsns if lsn is not None]
+    return max(lsns) if lsns else None
+
+
+@contextmanager
+def db_leitura(timeout=None):
+    """Como db.db_connection(), mas na réplica quando ela serve para esta requisição"""
+    if has_request_context():
+        g.leitura_na_replica = False
+    if not get_read_database_url():
+        with db_connection(timeout) as conn:
+            yield conn
+        return
+
+    motivo = estado.disponivel()
+    if motivo is None:
+        lsn_minimo = _lsn_minimo()
+        na_replica = False
+        try:
+            with db_connection(REPLICA_TIMEOUT if timeout is None else min(timeout, REPLICA_TIMEOUT),
+                               replica=True) as conn:
+                if conn is None:
+                    estado.falhou('sem conexão com a réplica')
+                    motivo = 'replica_down'
+                else:
+                    motivo = estado.pronta(conn, lsn_minimo)
+                    if motivo is None:
+                        na_replica = True
+                        estado.contar()
+                        if has_request_context():
+                            g.leitura_na_replica = True
+                            if lsn_minimo is not None:
+                                g.lsn_alcancado = True
+                        yield conn
+                        return
+                    # Sai da transação da verificação antes de devolver a conexão
+                    conn.rollback()
+        except psycopg2.Error as e:
+            if na_replica:
+                # Erro na consulta da própria rota: só a conexão perdida tira a réplica
+                if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+                    estado.falhou(e)
+                raise
+            estado.falhou(e)
+            motivo = 'replica_down'
+
+    estado.contar(motivo)
+    with db_connection(timeout) as conn:
+        yield conn
+
+
+def lsn_atual(conn):
+    """LSN do primário logo após um COMMIT nesta conexão; None sem réplica configurada.
+
+    Não levanta: a transação já foi gravada, e uma falha aqui só tira o
+    read-your-writes desta escrita. Virar erro faria o cliente repetir (e
+    duplicar) algo que já está no banco.
+    """
+    if not get_read_database_url():
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT pg_current_wal_lsn()::text')
+            lsn = cur.fetchone()[0]
+        conn.rollback()
+    except Exception as e:
+        logger.warning(f"⚠️ Escrita gravada, mas sem LSN para as leituras na réplica: {e}")
+        return None
+    return lsn
+
+
+def registrar_escrita(lsn):
+    """Guarda o LSN de uma escrita desta requisição para o cookie da resposta"""
+    valor = lsn_para_int(lsn)
+    if valor is None or not has_request_context():
+        return
+    if valor > (g.get('lsn_escrita') or 0):
+        g.lsn_escrita = valor
+        g.lsn_escrita_texto = lsn
+
+
+def registrar_commit(conn):
+    """Atalho para as rotas que fazem o próprio COMMIT (API, importação)"""
+    registrar_escrita(lsn_atual(conn))
+
+
+@leituras.after_app_request
+def _cookie_lsn(response):
+    lsn = g.get('lsn_escrita_texto')
+    if lsn:
+        response.set_cookie(COOKIE_LSN, lsn, max_age=COOKIE_LSN_MAX_AGE, httponly=True, samesite='Lax')
+    elif g.get('lsn_alcancado') and COOKIE_LSN in request.cookies:
+        response.delete_cookie(COOKIE_LSN, httponly=True, samesite='Lax')
+    return response
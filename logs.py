@@ -0,0 +1,332 @@
+"""Logs estruturados (JSON) gravados fora da thread da requisição.
+
+configurar() instala na raiz um handler que só põe o registro numa fila;
+uma thread por processo tira da fila, formata e escreve no stderr (como o
+basicConfig de antes) em lotes, juntando o que chega em LOG_ESPERA_LOTE_MS,
+com um write e um flush por lote. A requisição não espera o stderr (nem o
+coletor de logs do outro lado do pipe) e a mensagem só é montada na thread
+de escrita: por isso as rotas logam com argumentos (logger.info('... %s',
+valor)) em vez de f-strings, e os argumentos devem ser valores imutáveis.
+
+Cada linha é um objeto JSON com ts, level, logger, msg, o request_id da
+requisição (o X-Request-Id recebido, ou um gerado e devolvido no mesmo
+cabeçalho) e os campos passados em `extra`. LOG_FORMATO=texto volta ao
+formato antigo, mais legível no terminal.
+
+INFO e DEBUG passam por dois filtros, na thread que loga e antes de
+qualquer formatação:
+- LOG_AMOSTRAGEM: fração das requisições cujos logs são mantidos. O sorteio
+  é pelo request_id, então uma requisição mantém todas as linhas ou nenhuma;
+- LOG_LIMITE_POR_SEGUNDO: limite por mensagem (logger + modelo da
+  mensagem) em cada processo; a próxima linha que passa leva `suppressed`
+  com quantas foram descartadas.
+WARNING e acima sempre passam. Com a fila cheia (LOG_FILA_MAX), INFO é
+descartado e WARNING/ERROR esperam até 1s por espaço.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import zlib
+import queue
+import random
+import atexit
+import logging
+import threading
+
+from flask import Blueprint, g, has_request_context, request
+
+logs = Blueprint('logs', __name__)
+
+LOG_NIVEL = os.environ.get('LOG_NIVEL', 'INFO').upper()
+LOG_FORMATO = os.environ.get('LOG_FORMATO', 'json')
+LOG_ASSINCRONO = os.environ.get('LOG_ASSINCRONO', '1') != '0'
+LOG_AMOSTRAGEM = float(os.environ.get('LOG_AMOSTRAGEM', 1))
+LOG_LIMITE_POR_SEGUNDO = float(os.environ.get('LOG_LIMITE_POR_SEGUNDO', 50))
+LOG_FILA_MAX = int(os.environ.get('LOG_FILA_MAX', 10000))
+
+CABECALHO_REQUISICAO = 'X-Request-Id'
+FORMATO_TEXTO = '%(asctime)s - %(levelname)s - %(message)s'
+# Registros escritos por vez (um write e um flush por lote)
+LOTE_ESCRITA = 256
+# Quanto a thread de escrita espera, depois do primeiro registro, para juntar o lote
+LOG_ESPERA_LOTE = float(os.environ.get('LOG_ESPERA_LOTE_MS', 20)) / 1000
+# Modelos de mensagem distintos acompanhados pelo limite por segundo
+MAX_MODELOS = 10000
+
+# Atributos de todo LogRecord; o resto veio de `extra` e vai para o JSON
+_ATRIBUTOS_PADRAO = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+def id_requisicao():
+    """Id da requisição corrente (None fora de uma requisição)"""
+    if not has_request_context():
+        return None
+    id_ = g.get('request_id')
+    if id_ is None:
+        recebido = request.headers.get(CABECALHO_REQUISICAO) or request.headers.get('Fly-Request-Id')
+        id_ = g.request_id = recebido[:64] if recebido else uuid.uuid4().hex[:16]
+    return id_
+
+
+class FormatoJson(logging.Formatter):
+    """Uma linha JSON por registro"""
+
+    def format(self, record):
+        dados = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            dados['request_id'] = request_id
+        for chave, valor in vars(record).items():
+            if chave not in _ATRIBUTOS_PADRAO:
+                dados[chave] = valor
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            dados['exc'] = record.exc_text
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class Amostragem(logging.Filter):
+    """Marca o request_id e descarta INFO/DEBUG por amostragem e limite por segundo"""
+
+    def __init__(self, fracao=LOG_AMOSTRAGEM, limite_por_segundo=LOG_LIMITE_POR_SEGUNDO):
+        super().__init__()
+        self.fracao = fracao
+        self.limite = limite_por_segundo
+        self._lock = threading.Lock()
+        self._baldes = {}
+        self.descartados_amostragem = 0
+        self.descartados_limite = 0
+
+    def filter(self, record):
+        record.request_id = id_requisicao()
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.fracao < 1:
+            if record.request_id:
+                sorteio = zlib.crc32(record.request_id.encode()) % 10000 / 10000
+            else:
+                sorteio = random.random()
+            if sorteio >= self.fracao:
+                with self._lock:
+                    self.descartados_amostragem += 1
+                return False
+        if self.limite > 0:
+            chave = (record.name, record.msg)
+            agora = time.monotonic()
+            with self._lock:
+                balde = self._baldes.get(chave)
+                if balde is None:
+                    if len(self._baldes) >= MAX_MODELOS:
+                        self._baldes.clear()
+                    # [fichas, última recarga, descartadas desde a última que passou]
+                    balde = self._baldes[chave] = [self.limite, agora, 0]
+                balde[0] = min(self.limite, balde[0] + (agora - balde[1]) * self.limite)
+                balde[1] = agora
+                if balde[0] < 1:
+                    balde[2] += 1
+                    self.descartados_limite += 1
+                    return False
+                balde[0] -= 1
+                suprimidas, balde[2] = balde[2], 0
+            if suprimidas:
+                record.suppressed = suprimidas
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sample_rate': self.fracao,
+                'rate_limit_per_s': self.limite,
+                'dropped_sampled': self.descartados_amostragem,
+                'dropped_rate_limited': self.descartados_limite,
+            }
+
+
+class EscritorLogs:
+    """Fila e thread deste processo que formatam e escrevem os registros"""
+
+    def __init__(self, formatador, stream=None, max_fila=LOG_FILA_MAX):
+        self.formatador = formatador
+        # None: o sys.stderr do momento da escrita
+        self.stream = stream
+        self.max_fila = max_fila
+        self._lock = threading.Lock()
+        self._fila = None
+        self._thread = None
+        self._pid = None
+        self.escritos = 0
+        self.lotes = 0
+        self.descartados_fila = 0
+        self.erros = 0
+
+    def iniciar(self):
+        """Inicia a thread deste processo, se ainda não estiver rodando"""
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == pid and self._thread is not None:
+                return
+            # Após o fork, a fila do mestre (e o que estava nela) fica com ele
+            self._fila = queue.Queue(self.max_fila)
+            self._pid = pid
+            self._thread = threading.Thread(target=self._executar, name='escritor-logs', daemon=True)
+            self._thread.start()
+
+    def enfileirar(self, record):
+        self.iniciar()
+        try:
+            self._fila.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if record.levelno >= logging.WARNING:
+            try:
+                self._fila.put(record, timeout=1)
+                return
+            except queue.Full:
+                pass
+        with self._lock:
+            self.descartados_fila += 1
+
+    def _executar(self):
+        fila = self._fila
+        while True:
+            registros = [fila.get()]
+            # Junta o que chegar em seguida: menos trocas de thread (e de GIL)
+            # com as requisições e um write por lote
+            if registros[0] is not None and LOG_ESPERA_LOTE > 0:
+                time.sleep(LOG_ESPERA_LOTE)
+            while len(registros) < LOTE_ESCRITA:
+                try:
+                    registros.append(fila.get_nowait())
+                except queue.Empty:
+                    break
+            fim = None in registros
+            self.escrever([registro for registro in registros if registro is not None])
+            if fim:
+                return
+
+    def escrever(self, registros):
+        linhas = []
+        erros = 0
+        for registro in registros:
+            try:
+                linhas.append(self.formatador.format(registro))
+            except Exception:
+                erros += 1
+        if linhas:
+            stream = self.stream or sys.stderr
+            try:
+                stream.write('\n'.join(linhas) + '\n')
+                stream.flush()
+            except Exception:
+                erros += len(linhas)
+                linhas = []
+        with self._lock:
+            self.escritos += len(linhas)
+            self.lotes += 1
+            self.erros += erros
+
+    def parar(self, timeout=2.0):
+        """Escreve o que está na fila e encerra a thread deste processo"""
+        with self._lock:
+            thread = self._thread if self._pid == os.getpid() else None
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            try:
+                self._fila.put(None, timeout=timeout)
+            except queue.Full:
+                return
+            thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._fila.qsize() if self._fila is not None and self._pid == os.getpid() else 0,
+                'written': self.escritos,
+                'batches': self.lotes,
+                'dropped_queue_full': self.descartados_fila,
+                'write_errors': self.erros,
+            }
+
+
+class FilaHandler(logging.Handler):
+    """Só enfileira: formatação e escrita ficam com o EscritorLogs"""
+
+    def __init__(self, escritor):
+        super().__init__()
+        self.escritor = escritor
+
+    def emit(self, record):
+        # O traceback é montado aqui: os frames mudam depois que a exceção passa
+        if record.exc_info:
+            record.exc_text = self.escritor.formatador.formatException(record.exc_info)
+            record.exc_info = None
+        self.escritor.enfileirar(record)
+
+
+_handler = None
+_amostragem = None
+_escritor = None
+
+
+def configurar(nivel=LOG_NIVEL, formato=LOG_FORMATO, assincrono=LOG_ASSINCRONO, amostragem=LOG_AMOSTRAGEM,
+               limite_por_segundo=LOG_LIMITE_POR_SEGUNDO, stream=None):
+    """Instala (ou troca) o handler do app na raiz; substitui o logging.basicConfig"""
+    global _handler, _amostragem, _escritor
+    raiz = logging.getLogger()
+    if _handler is not None:
+        raiz.removeHandler(_handler)
+    if _escritor is not None:
+        _escritor.parar()
+
+    formatador = FormatoJson() if formato == 'json' else logging.Formatter(FORMATO_TEXTO)
+    if assincrono:
+        _escritor = EscritorLogs(formatador, stream)
+        _handler = FilaHandler(_escritor)
+    else:
+        _escritor = None
+        _handler = logging.StreamHandler(stream or sys.stderr)
+        _handler.setFormatter(formatador)
+    _amostragem = Amostragem(amostragem, limite_por_segundo)
+    _handler.addFilter(_amostragem)
+    raiz.addHandler(_handler)
+    raiz.setLevel(nivel)
+    return _handler
+
+
+def parar():
+    if _escritor is not None:
+        _escritor.parar()
+
+
+atexit.register(parar)
+
+
+def stats():
+    resultado = {'async': _escritor is not None}
+    if _amostragem is not None:
+        resultado.update(_amostragem.stats())
+    if _escritor is not None:
+        resultado.update(_escritor.stats())
+    return resultado
+
+
+@logs.before_app_request
+def _marcar_requisicao():
+    id_requisicao()
+
+
+@logs.after_app_request
+def _devolver_id(response):
+    response.headers[CABECALHO_REQUISICAO] = id_requisicao()
+    return response
@@ -0,0 +1,253 @@
+"""Métricas de latência por rota e por fase, expostas em /metrics.
+
+Cada requisição mede o tempo total e o tempo gasto em cada fase (connect,
+query, format, weather, render, compress), além de quantos comandos SQL executou. Os
+valores vão para histogramas com buckets fixos, agregados em memória por
+processo, e /metrics os publica no formato texto do Prometheus junto com os
+contadores dos componentes registrados (pool, caches, ouvinte).
+
+O custo por requisição é de alguns perf_counter() e somas em dicionário; o
+texto só é montado quando /metrics é lido.
+"""
+import os
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Blueprint, Response, g, request, has_request_context, before_render_template, template_rendered
+from psycopg2 import extensions
+
+metricas = Blueprint('metricas', __name__)
+
+PREFIXO = 'todo_'
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Se definido, /metrics exige "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+DESCRICOES = {
+    'http_request_duration_seconds': ('histogram', 'Duração das requisições por rota'),
+    'http_requests_total': ('counter', 'Requisições por rota, método e status'),
+    'request_phase_duration_seconds': ('histogram', 'Tempo por fase da requisição (connect, query, format, weather, render, compress)'),
+    'db_queries_per_request': ('histogram', 'Comandos SQL executados por requisição'),
+    'db_queries_total': ('counter', 'Comandos SQL executados, dentro ou fora de requisições'),
+}
+
+
+class Histograma:
+    __slots__ = ('limites', 'contagens', 'soma')
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0.0
+
+    def observar(self, valor):
+        self.contagens[bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+
+
+class Registro:
+    """Histogramas e contadores rotulados, protegidos por um único lock"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas = {}
+        self._contadores = {}
+        self._coletores = []
+
+    def observar(self, nome, rotulos, valor, limites=BUCKETS_SEGUNDOS):
+        chave = (nome, rotulos)
+        with self._lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = Histograma(limites)
+            histograma.observar(valor)
+
+    def incrementar(self, nome, rotulos=(), valor=1):
+        chave = (nome, rotulos)
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def registrar_coletor(self, prefixo, funcao):
+        """Publica como gauges os valores numéricos do dicionário que `funcao` retorna"""
+        self._coletores.append((prefixo, funcao))
+
+    def exportar(self):
+        with self._lock:
+            histogramas = [(chave, list(h.contagens), h.soma, h.limites) for chave, h in self._histogramas.items()]
+            contadores = list(self._contadores.items())
+
+        linhas = []
+        vistos = set()
+
+        def cabecalho(nome):
+            if nome not in vistos:
+                vistos.add(nome)
+                tipo, descricao = DESCRICOES.get(nome, ('gauge', nome))
+                linhas.append(f'# HELP {PREFIXO}{nome} {descricao}')
+                linhas.append(f'# TYPE {PREFIXO}{nome} {tipo}')
+
+        for (nome, rotulos), contagens, soma, limites in sorted(histogramas, key=lambda h: h[0]):
+            cabecalho(nome)
+            acumulado = 0
+            for limite, contagem in zip(limites, contagens):
+                acumulado += contagem
+                linhas.append(f'{PREFIXO}{nome}_bucket{_rotulos(rotulos, le=_numero(limite))} {acumulado}')
+            acumulado += contagens[-1]
+            linhas.append(f'{PREFIXO}{nome}_bucket{_rotulos(rotulos, le="+Inf")} {acumulado}')
+            linhas.append(f'{PREFIXO}{nome}_sum{_rotulos(rotulos)} {_numero(soma)}')
+            linhas.append(f'{PREFIXO}{nome}_count{_rotulos(rotulos)} {acumulado}')
+
+        for (nome, rotulos), valor in sorted(contadores):
+            cabecalho(nome)
+            linhas.append(f'{PREFIXO}{nome}{_rotulos(rotulos)} {_numero(valor)}')
+
+        for prefixo, funcao in self._coletores:
+            try:
+                valores = funcao() or {}
+            except Exception:
+                continue
+            for nome, valor in _achatar(prefixo, valores):
+                cabecalho(nome)
+                linhas.append(f'{PREFIXO}{nome} {_numero(valor)}')
+
+        return '\n'.join(linhas) + '\n'
+
+
+def _achatar(prefixo, valores):
+    """Gera (nome, valor) numéricos de um dicionário, descendo nos dicionários aninhados"""
+    for chave, valor in valores.items():
+        nome = f'{prefixo}_{chave}'
+        if isinstance(valor, dict):
+            yield from _achatar(nome, valor)
+        elif isinstance(valor, bool):
+            yield nome, int(valor)
+        elif isinstance(valor, (int, float)):
+            yield nome, valor
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos(rotulos, **extras):
+    pares = list(rotulos) + list(extras.items())
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + '}'
+
+
+registro = Registro()
+registrar_coletor = registro.registrar_coletor
+
+
+class _Medicao:
+    """Tempos da requisição corrente, guardados em flask.g"""
+    __slots__ = ('inicio', 'fases', 'consultas', 'inicio_render')
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.fases = {}
+        self.consultas = 0
+        self.inicio_render = None
+
+    def somar(self, fase, duracao):
+        self.fases[fase] = self.fases.get(fase, 0.0) + duracao
+
+
+def _medicao():
+    if has_request_context():
+        return g.get('_medicao')
+    return None
+
+
+@contextmanager
+def medir_fase(fase):
+    """Soma o tempo do bloco na fase `fase` da requisição corrente (se houver)"""
+    medicao = _medicao()
+    if medicao is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicao.somar(fase, time.perf_counter() - inicio)
+
+
+class CursorMedido(extensions.cursor):
+    """Cursor que conta os comandos SQL e soma seu tempo na fase 'query'"""
+
+    def _medir(self, metodo, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return metodo(*args, **kwargs)
+        finally:
+            duracao = time.perf_counter() - inicio
+            registro.incrementar('db_queries_total')
+            medicao = _medicao()
+            if medicao is not None:
+                medicao.consultas += 1
+                medicao.somar('query', duracao)
+
+    def execute(self, query, vars=None):
+        return self._medir(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._medir(super().executemany, query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._medir(super().copy_expert, sql, file, size)
+
+
+@metricas.before_app_request
+def _iniciar_medicao():
+    g._medicao = _Medicao()
+
+
+@metricas.after_app_request
+def _registrar_medicao(response):
+    medicao = g.pop('_medicao', None)
+    if medicao is None:
+        return response
+    duracao = time.perf_counter() - medicao.inicio
+    rota = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    rotulos = (('route', rota), ('method', request.method))
+
+    registro.observar('http_request_duration_seconds', rotulos, duracao)
+    registro.incrementar('http_requests_total', rotulos + (('status', str(response.status_code)),))
+    registro.observar('db_queries_per_request', (('route', rota),), medicao.consultas, BUCKETS_CONSULTAS)
+    for fase, tempo in medicao.fases.items():
+        registro.observar('request_phase_duration_seconds', (('route', rota), ('phase', fase)), tempo)
+    return response
+
+
+def _antes_de_renderizar(sender, **extra):
+    medicao = _medicao()
+    if medicao is not None:
+        medicao.inicio_render = time.perf_counter()
+
+
+def _depois_de_renderizar(sender, **extra):
+    medicao = _medicao()
+    if medicao is not None and medicao.inicio_render is not None:
+        medicao.somar('render', time.perf_counter() - medicao.inicio_render)
+        medicao.inicio_render = None
+
+
+before_render_template.connect(_antes_de_renderizar)
+template_rendered.connect(_depois_de_renderizar)
+
+
+@metricas.route('/metrics')
+def exportar_metricas():
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return Response('não autorizado\n', status=401, mimetype='text/plain')
+    return Response(registro.exportar(), mimetype='text/plain; version=0.0.4; charset=utf-8')
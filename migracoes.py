@@ -0,0 +1,348 @@
+"""Migrações versionadas do esquema.
+
+Cada migração tem um número, uma descrição e um passo (SQL ou função que
+recebe o cursor). As aplicadas ficam registradas em schema_version. Com o
+esquema em dia, migrar() faz uma única consulta; caso contrário, pega um
+advisory lock para que só um worker aplique as migrações pendentes.
+
+Uso manual: python migracoes.py
+"""
+import os
+import logging
+from datetime import datetime
+
+import psycopg2
+from psycopg2 import errors
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+# Chave do pg_advisory_lock usado para serializar as migrações
+LOCK_MIGRACOES = 7432001
+
+
+def _m001_estrutura_inicial(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS tarefas (
+            id SERIAL PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            descricao TEXT NOT NULL,
+            categoria TEXT DEFAULT 'Geral',
+            prioridade TEXT DEFAULT 'Média',
+            prazo TEXT,
+            concluida BOOLEAN DEFAULT FALSE,
+            data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Bancos criados por versões antigas podem não ter todas as colunas
+    cur.execute("ALTER TABLE tarefas ADD COLUMN IF NOT EXISTS user_id TEXT NOT NULL DEFAULT 'default'")
+    cur.execute("ALTER TABLE tarefas ADD COLUMN IF NOT EXISTS categoria TEXT DEFAULT 'Geral'")
+    cur.execute("ALTER TABLE tarefas ADD COLUMN IF NOT EXISTS prioridade TEXT DEFAULT 'Média'")
+    cur.execute("ALTER TABLE tarefas ADD COLUMN IF NOT EXISTS prazo TEXT")
+
+
+def _m002_indices_por_usuario(cur):
+    # Listagem com filtro active/completed, contagens e clear_completed
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tarefas_usuario_concluida_id
+        ON tarefas (user_id, concluida, id DESC)
+    ''')
+    # Listagem sem filtro (ORDER BY id DESC) e exclusões por id + usuário
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tarefas_usuario_id
+        ON tarefas (user_id, id DESC)
+    ''')
+
+
+def _m003_busca_textual(cur):
+    # Coluna gerada: o Postgres mantém o tsvector em dia a cada INSERT/UPDATE.
+    # A descrição pesa mais (A) que a categoria (B) no ranking. O lexema
+    # 'u<md5 do user_id>' deixa o próprio GIN restringir a busca ao usuário:
+    # sem ele, um termo comum varre a lista de todos os usuários do índice.
+    cur.execute('''
+        ALTER TABLE tarefas ADD COLUMN IF NOT EXISTS busca tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('portuguese', coalesce(descricao, '')), 'A') ||
+            setweight(to_tsvector('portuguese', coalesce(categoria, '')), 'B') ||
+            setweight(array_to_tsvector(ARRAY['u' || md5(user_id)]), 'D')
+        ) STORED
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_tarefas_busca ON tarefas USING GIN (busca)')
+
+
+FORMATOS_PRAZO = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%d/%m/%y')
+LOTE_CONVERSAO_PRAZO = 5000
+
+
+def converter_prazo(texto):
+    """Converte um prazo em texto livre para date; None se vazio, ValueError se inválido"""
+    texto = (texto or '').strip()
+    if not texto:
+        return None
+    # Valores ISO com horário (2024-05-01T10:00) viram só a data
+    if len(texto) > 10 and texto[4:5] == '-' and texto[10] in 'T ':
+        texto = texto[:10]
+    for formato in FORMATOS_PRAZO:
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    raise ValueError(texto)
+
+
+def _converter_lote_prazo(cur, depois_de, limite=None):
+    """Preenche prazo_data para um lote de ids > depois_de; retorna o último id ou None"""
+    sql = ("SELECT id, prazo FROM tarefas WHERE id > %s AND prazo_data IS NULL "
+           "AND coalesce(btrim(prazo), '') <> '' ORDER BY id")
+    if limite:
+        sql += f' LIMIT {int(limite)}'
+    cur.execute(sql, (depois_de,))
+    rows = cur.fetchall()
+    if not rows:
+        return None
+
+    convertidos, invalidos = [], []
+    for id_, texto in rows:
+        try:
+            convertidos.append((id_, converter_prazo(texto)))
+        except ValueError:
+            invalidos.append((id_, texto))
+    if convertidos:
+        execute_values(cur, 'UPDATE tarefas SET prazo_data = v.prazo::date FROM (VALUES %s) AS v (id, prazo) '
+                            'WHERE tarefas.id = v.id', convertidos, page_size=len(convertidos))
+    if invalidos:
+        execute_values(cur, 'INSERT INTO prazos_nao_convertidos (tarefa_id, prazo_texto) VALUES %s '
+                            'ON CONFLICT (tarefa_id) DO NOTHING', invalidos, page_size=len(invalidos))
+    return rows[-1][0]
+
+
+def _m004_prazo_como_data(cur):
+    # prazo era TEXT livre; passa a ser DATE. A conversão roda em lotes com
+    # commit entre eles (o advisory lock de migrar() é de sessão), e os
+    # valores que não dá para interpretar ficam em prazos_nao_convertidos.
+    conn = cur.connection
+    cur.execute('ALTER TABLE tarefas ADD COLUMN IF NOT EXISTS prazo_data DATE')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS prazos_nao_convertidos (
+            tarefa_id INTEGER PRIMARY KEY,
+            prazo_texto TEXT NOT NULL,
+            registrado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+    ultimo_id, lotes = 0, 0
+    while ultimo_id is not None:
+        ultimo_id = _converter_lote_prazo(cur, ultimo_id, LOTE_CONVERSAO_PRAZO)
+        conn.commit()
+        lotes += 1
+        if lotes % 20 == 0:
+            logger.info(f"🔄 Conversão de prazos: {lotes} lotes, último id {ultimo_id}")
+
+    # Linhas gravadas durante a conversão são tratadas com a tabela bloqueada
+    cur.execute('LOCK TABLE tarefas IN SHARE ROW EXCLUSIVE MODE')
+    _converter_lote_prazo(cur, 0)
+    cur.execute('ALTER TABLE tarefas DROP COLUMN prazo')
+    cur.execute('ALTER TABLE tarefas RENAME COLUMN prazo_data TO prazo')
+
+    cur.execute('SELECT COUNT(*) FROM prazos_nao_convertidos')
+    nao_convertidos = cur.fetchone()[0]
+    if nao_convertidos:
+        cur.execute('SELECT tarefa_id, prazo_texto FROM prazos_nao_convertidos ORDER BY tarefa_id LIMIT 20')
+        exemplos = ', '.join(f'{id_}={texto!r}' for id_, texto in cur.fetchall())
+        logger.warning(f"⚠️ {nao_convertidos} prazos não puderam ser convertidos e ficaram vazios "
+                       f"(ver tabela prazos_nao_convertidos): {exemplos}")
+
+
+def _m005_indice_prazos_pendentes(cur):
+    # Filtros overdue/today/week: só tarefas pendentes com prazo, em ordem de prazo
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tarefas_prazo_pendentes
+        ON tarefas (user_id, prazo, id)
+        WHERE concluida = FALSE AND prazo IS NOT NULL
+    ''')
+
+
+def _m006_versoes_de_conteudo(cur):
+    # Versão do conteúdo de cada usuário, incrementada a cada alteração nas
+    # tarefas (ver versoes.py); alimenta o ETag das páginas
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS versoes_conteudo (
+            user_id TEXT PRIMARY KEY,
+            versao BIGINT NOT NULL DEFAULT 0,
+            alterado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+# Partições (hash de user_id) do arquivo de concluídas, decidido na migração 7;
+# 0 ou 1 cria uma tabela comum
+ARQUIVO_PARTICOES = int(os.environ.get('ARQUIVO_PARTICOES', 8))
+
+
+def _m007_arquivo_de_concluidas(cur):
+    # Momento da conclusão, mantido pelo próprio Postgres em qualquer caminho
+    # (rotas, API, COPY da importação); o arquivamento usa a idade dele
+    cur.execute('ALTER TABLE tarefas ADD COLUMN IF NOT EXISTS concluida_em TIMESTAMP')
+    cur.execute('''
+        CREATE OR REPLACE FUNCTION tarefas_marcar_concluida_em() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.concluida IS NOT TRUE THEN
+                NEW.concluida_em := NULL;
+            ELSIF TG_OP = 'INSERT' OR OLD.concluida IS NOT TRUE THEN
+                NEW.concluida_em := coalesce(NEW.concluida_em, CURRENT_TIMESTAMP);
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    cur.execute('DROP TRIGGER IF EXISTS tarefas_concluida_em ON tarefas')
+    cur.execute('''
+        CREATE TRIGGER tarefas_concluida_em BEFORE INSERT OR UPDATE OF concluida ON tarefas
+        FOR EACH ROW EXECUTE FUNCTION tarefas_marcar_concluida_em()
+    ''')
+    # Candidatas ao arquivamento; as concluídas antes desta migração não
+    # têm concluida_em e valem pela data de criação
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tarefas_concluidas_em
+        ON tarefas ((coalesce(concluida_em, data_criacao)))
+        WHERE concluida = TRUE
+    ''')
+
+    # Arquivo: só concluídas, com o id original (o da sequência de tarefas).
+    # A busca usa a mesma expressão da migração 3.
+    particionar = ARQUIVO_PARTICOES > 1
+    cur.execute(f'''
+        CREATE TABLE IF NOT EXISTS tarefas_arquivadas (
+            id INTEGER NOT NULL,
+            user_id TEXT NOT NULL,
+            descricao TEXT NOT NULL,
+            categoria TEXT,
+            prioridade TEXT,
+            prazo DATE,
+            concluida_em TIMESTAMP,
+            data_criacao TIMESTAMP,
+            arquivada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            busca tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('portuguese', coalesce(descricao, '')), 'A') ||
+                setweight(to_tsvector('portuguese', coalesce(categoria, '')), 'B') ||
+                setweight(array_to_tsvector(ARRAY['u' || md5(user_id)]), 'D')
+            ) STORED,
+            PRIMARY KEY (user_id, id)
+        ){' PARTITION BY HASH (user_id)' if particionar else ''}
+    ''')
+    if particionar:
+        for resto in range(ARQUIVO_PARTICOES):
+            cur.execute(f'''
+                CREATE TABLE IF NOT EXISTS tarefas_arquivadas_p{resto} PARTITION OF tarefas_arquivadas
+                FOR VALUES WITH (MODULUS {ARQUIVO_PARTICOES}, REMAINDER {resto})
+            ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_tarefas_arquivadas_busca ON tarefas_arquivadas USING GIN (busca)')
+
+    # Contagens do arquivo por usuário: as estatísticas somam estas linhas
+    # em vez de contar as arquivadas uma a uma
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS contagem_arquivadas (
+            user_id TEXT NOT NULL,
+            categoria TEXT NOT NULL,
+            prioridade TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY (user_id, categoria, prioridade)
+        )
+    ''')
+
+    # Leitura transparente (filtros all e completed, busca, exportação)
+    cur.execute('''
+        CREATE OR REPLACE VIEW tarefas_todas AS
+            SELECT id, user_id, descricao, categoria, prioridade, prazo, concluida, data_criacao, busca
+            FROM tarefas
+            UNION ALL
+            SELECT id, user_id, descricao, categoria, prioridade, prazo, TRUE, data_criacao, busca
+            FROM tarefas_arquivadas
+    ''')
+
+
+MIGRACOES = [
+    (1, 'estrutura inicial da tabela tarefas', _m001_estrutura_inicial),
+    (2, 'índices das consultas por usuário', _m002_indices_por_usuario),
+    (3, 'busca textual em português (tsvector + GIN)', _m003_busca_textual),
+    (4, 'prazo como DATE (conversão em lotes)', _m004_prazo_como_data),
+    (5, 'índice parcial de prazos pendentes', _m005_indice_prazos_pendentes),
+    (6, 'versão do conteúdo por usuário (ETag)', _m006_versoes_de_conteudo),
+    (7, 'arquivo de tarefas concluídas', _m007_arquivo_de_concluidas),
+]
+
+VERSAO_ATUAL = MIGRACOES[-1][0]
+
+
+def versao_do_banco(conn):
+    """Versão aplicada no banco, ou 0 se schema_version ainda não existe"""
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT MAX(versao) FROM schema_version')
+            versao = cur.fetchone()[0] or 0
+        conn.rollback()
+        return versao
+    except errors.UndefinedTable:
+        conn.rollback()
+        return 0
+
+
+def migrar(conn):
+    """Aplica as migrações pendentes e retorna a versão final do esquema"""
+    versao = versao_do_banco(conn)
+    if versao >= VERSAO_ATUAL:
+        logger.info(f"✅ Esquema do banco em dia (versão {versao})")
+        return versao
+
+    with conn.cursor() as cur:
+        cur.execute('SELECT pg_advisory_lock(%s)', (LOCK_MIGRACOES,))
+        conn.commit()
+        try:
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    versao INTEGER PRIMARY KEY,
+                    descricao TEXT NOT NULL,
+                    aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.commit()
+
+            # Outro worker pode ter migrado enquanto esperávamos o lock
+            versao = versao_do_banco(conn)
+            for numero, descricao, passo in MIGRACOES:
+                if numero <= versao:
+                    continue
+                logger.info(f"🔄 Aplicando migração {numero}: {descricao}")
+                try:
+                    if callable(passo):
+                        passo(cur)
+                    else:
+                        cur.execute(passo)
+                    cur.execute('INSERT INTO schema_version (versao, descricao) VALUES (%s, %s)',
+                                (numero, descricao))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    logger.error(f"❌ Migração {numero} falhou; esquema permanece na versão {versao}")
+                    raise
+                versao = numero
+        finally:
+            if not conn.closed:
+                conn.rollback()
+                cur.execute('SELECT pg_advisory_unlock(%s)', (LOCK_MIGRACOES,))
+                conn.commit()
+
+    logger.info(f"✅ Esquema do banco migrado para a versão {versao}")
+    return versao
+
+
+if __name__ == '__main__':
+    from db import get_database_url
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    conexao = psycopg2.connect(get_database_url())
+    try:
+        migrar(conexao)
+    finally:
+        conexao.close()
@@ -0,0 +1,158 @@
+"""Avisos de alteração de tarefas entre workers via LISTEN/NOTIFY.
+
+As rotas que alteram tarefas chamam notificar() dentro da transação; o
+Postgres só entrega o aviso depois do COMMIT, para todas as conexões que
+fizeram LISTEN no canal - inclusive em outros workers e outras máquinas.
+Cada processo mantém uma thread ouvinte com conexão própria (fora do pool)
+que repassa os avisos para as funções registradas com assinar().
+"""
+import os
+import json
+import select
+import threading
+import logging
+
+import psycopg2
+
+from db import get_database_url
+from versoes import incrementar_versao
+from consultas import registrar
+
+logger = logging.getLogger(__name__)
+
+CANAL = 'tarefas_alteradas'
+# O NOTIFY aceita payloads de até 8000 bytes
+MAX_PAYLOAD = 7900
+
+NOTIFICAR = registrar('notificar', 'SELECT pg_notify(%s, %s)')
+
+
+def notificar(cur, user_id, **dados):
+    """Agenda um aviso de alteração para ser entregue no COMMIT da transação.
+
+    `dados` descreve a alteração (ex.: acao='alterada', ids=[...]) para quem
+    aplica deltas, como o SSE de eventos.py. Se não couber no NOTIFY, vai só
+    o user_id e os assinantes tratam como alteração sem detalhes.
+
+    Também incrementa a versão de conteúdo do usuário (ETag, ver versoes.py).
+    """
+    versao = incrementar_versao(cur, user_id)
+    payload = json.dumps({'user_id': user_id, 'pid': os.getpid(), 'versao': versao, **dados})
+    if len(payload) > MAX_PAYLOAD:
+        payload = json.dumps({'user_id': user_id, 'pid': os.getpid(), 'versao': versao})
+    NOTIFICAR.executar(cur, (CANAL, payload))
+
+
+class Ouvinte:
+    """Thread que escuta o canal e repassa cada aviso aos assinantes.
+
+    Os assinantes recebem o dicionário do aviso. Quando a conexão cai, avisos
+    podem ter sido perdidos; nesse caso os assinantes recebem None e devem
+    tratar todos os dados locais como desatualizados.
+    """
+
+    def __init__(self, canal=CANAL, intervalo_reconexao=1.0, intervalo_maximo=30.0):
+        self.canal = canal
+        self.intervalo_reconexao = intervalo_reconexao
+        self.intervalo_maximo = intervalo_maximo
+        self._assinantes = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._parar = threading.Event()
+        self._conectado = threading.Event()
+        self.avisos_recebidos = 0
+        self.reconexoes = 0
+
+    @property
+    def conectado(self):
+        return self._conectado.is_set()
+
+    def assinar(self, callback):
+        with self._lock:
+            self._assinantes.append(callback)
+
+    def iniciar(self):
+        """Inicia a thread deste processo, se ainda não estiver rodando"""
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == pid and self._thread is not None:
+                return
+            if not get_database_url():
+                return
+            # Após um fork, a thread do processo pai não existe aqui
+            self._conectado.clear()
+            self._parar.clear()
+            self._pid = pid
+            self._thread = threading.Thread(target=self._executar, name='ouvinte-notify', daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+
+    def _repassar(self, evento):
+        with self._lock:
+            assinantes = list(self._assinantes)
+        for callback in assinantes:
+            try:
+                callback(evento)
+            except Exception as e:
+                logger.error(f"❌ Erro ao processar aviso de alteração: {e}")
+
+    def _executar(self):
+        espera = self.intervalo_reconexao
+        while not self._parar.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(get_database_url(), connect_timeout=5,
+                                        application_name='todo-list-plus-ouvinte',
+                                        keepalives=1, keepalives_idle=30)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f'LISTEN {self.canal}')
+                # Pode ter perdido avisos enquanto estava desconectado
+                self._repassar(None)
+                self._conectado.set()
+                espera = self.intervalo_reconexao
+                logger.info(f"👂 Escutando alterações no canal {self.canal}")
+
+                while not self._parar.is_set():
+                    if select.select([conn], [], [], 5.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        aviso = conn.notifies.pop(0)
+                        self.avisos_recebidos += 1
+                        try:
+                            evento = json.loads(aviso.payload)
+                        except ValueError:
+                            logger.warning(f"⚠️ Aviso inválido no canal {self.canal}: {aviso.payload!r}")
+                            continue
+                        self._repassar(evento)
+            except Exception as e:
+                if self._conectado.is_set():
+                    self.reconexoes += 1
+                self._conectado.clear()
+                self._repassar(None)
+                logger.error(f"❌ Ouvinte de alterações desconectado: {e}")
+                self._parar.wait(espera)
+                espera = min(espera * 2, self.intervalo_maximo)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+        self._conectado.clear()
+
+    def stats(self):
+        return {
+            'connected': self.conectado,
+            'notifications_received': self.avisos_recebidos,
+            'reconnects': self.reconexoes,
+        }
+
+
+ouvinte = Ouvinte()
@@ -0,0 +1,178 @@
+"""Health checks em níveis e diagnóstico do banco servido de cache.
+
+- /health/live: o processo está de pé; não toca no banco.
+- /health/ready: SELECT 1 com timeout curto; 503 se o banco não responde.
+- diagnostico_banco(): colunas, constraints, índices, tamanho estimado da
+  tabela (pg_class.reltuples, sem COUNT(*)) e versão do esquema. É
+  recalculado no máximo a cada DIAGNOSTICO_INTERVALO segundos, na réplica
+  de leitura se houver; no resto do tempo vem do cache, inclusive para
+  /health e /debug-db.
+"""
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+
+import psycopg2
+from flask import Blueprint, jsonify
+
+from db import db_connection
+from leituras import db_leitura
+from migracoes import VERSAO_ATUAL, versao_do_banco
+
+logger = logging.getLogger(__name__)
+
+saude = Blueprint('saude', __name__)
+
+PRONTIDAO_TIMEOUT = float(os.environ.get('PRONTIDAO_TIMEOUT', 1.0))
+DIAGNOSTICO_INTERVALO = float(os.environ.get('DIAGNOSTICO_INTERVALO', 60))
+
+_iniciado_em = time.monotonic()
+
+
+def verificar_banco(timeout=PRONTIDAO_TIMEOUT):
+    """SELECT 1 com espera pelo pool e statement_timeout limitados a `timeout`"""
+    inicio = time.perf_counter()
+    try:
+        with db_connection(timeout=timeout) as conn:
+            if conn is None:
+                return {'ok': False, 'error': 'sem conexão com o banco'}
+            with conn.cursor() as cur:
+                cur.execute('SET LOCAL statement_timeout = %s', (max(int(timeout * 1000), 1),))
+                cur.execute('SELECT 1')
+                cur.fetchone()
+            conn.rollback()
+    except psycopg2.Error as e:
+        return {'ok': False, 'error': str(e).strip()}
+    return {'ok': True, 'latency_ms': round((time.perf_counter() - inicio) * 1000, 2)}
+
+
+class Instantaneo:
+    """Valor caro recalculado no máximo a cada `intervalo` segundos.
+
+    Só uma thread recalcula por vez; as outras recebem o valor atual. Se o
+    cálculo falhar, o último valor bom continua sendo servido.
+    """
+
+    def __init__(self, calcular, intervalo):
+        self.calcular = calcular
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._calculando = threading.Lock()
+        self._valor = None
+        self._calculado_em = None
+
+    def _atual(self, agora):
+        if self._valor is not None and agora - self._calculado_em < self.intervalo:
+            return self._valor, agora - self._calculado_em
+        return None
+
+    def obter(self):
+        """Retorna (valor, idade em segundos); levanta a exceção se nunca calculou"""
+        with self._lock:
+            atual = self._atual(time.monotonic())
+        if atual is not None:
+            return atual
+
+        with self._calculando:
+            with self._lock:
+                atual = self._atual(time.monotonic())
+            if atual is not None:
+                return atual
+            try:
+                valor = self.calcular()
+            except Exception as e:
+                with self._lock:
+                    if self._valor is None:
+                        raise
+                    logger.warning(f"⚠️ Diagnóstico não atualizado, servindo o anterior: {e}")
+                    return self._valor, time.monotonic() - self._calculado_em
+            with self._lock:
+                self._valor = valor
+                self._calculado_em = time.monotonic()
+            return valor, 0.0
+
+
+def _calcular_diagnostico():
+    # Catálogo e estimativas: a réplica serve (ver leituras.py)
+    with db_leitura() as conn:
+        if conn is None:
+            raise RuntimeError('sem conexão com o banco')
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT column_name, data_type, is_nullable, column_default, ordinal_position
+                FROM information_schema.columns
+                WHERE table_name = 'tarefas'
+                ORDER BY ordinal_position
+            """)
+            colunas = cur.fetchall()
+            cur.execute("""
+                SELECT conname, contype, pg_get_constraintdef(oid)
+                FROM pg_constraint
+                WHERE conrelid = 'tarefas'::regclass
+            """)
+            constraints = cur.fetchall()
+            cur.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = 'tarefas' ORDER BY indexname")
+            indices = cur.fetchall()
+            # Estimativa do planner (atualizada por ANALYZE/autovacuum): não varre a tabela
+            cur.execute("""
+                SELECT reltuples::bigint, pg_total_relation_size(oid)
+                FROM pg_class WHERE oid = 'tarefas'::regclass
+            """)
+            linhas_estimadas, tamanho = cur.fetchone()
+        conn.rollback()
+        versao = versao_do_banco(conn)
+
+    return {
+        'columns': [{
+            'name': col[0],
+            'type': col[1],
+            'nullable': col[2],
+            'default': col[3],
+            'position': col[4]
+        } for col in colunas],
+        'constraints': [{
+            'name': con[0],
+            'type': con[1],
+            'definition': con[2]
+        } for con in constraints],
+        'indexes': [{'name': nome, 'definition': definicao} for nome, definicao in indices],
+        # -1 significa que a tabela ainda não foi analisada
+        'estimated_rows': linhas_estimadas if linhas_estimadas >= 0 else None,
+        'total_size_bytes': tamanho,
+        'schema_version': versao,
+        'schema_up_to_date': versao >= VERSAO_ATUAL,
+        'computed_at': datetime.now().isoformat(),
+    }
+
+
+_diagnostico = Instantaneo(_calcular_diagnostico, DIAGNOSTICO_INTERVALO)
+
+
+def diagnostico_banco():
+    """(diagnóstico, idade em segundos) do cache; None se nunca foi possível calcular"""
+    try:
+        return _diagnostico.obter()
+    except Exception as e:
+        logger.error(f"❌ Erro ao calcular diagnóstico do banco: {e}")
+        return None, None
+
+
+@saude.route('/health/live')
+def vivo():
+    return jsonify({
+        'status': 'alive',
+        'pid': os.getpid(),
+        'uptime_s': round(time.monotonic() - _iniciado_em, 1),
+    }), 200
+
+
+@saude.route('/health/ready')
+def pronto():
+    banco = verificar_banco()
+    return jsonify({
+        'status': 'ready' if banco['ok'] else 'unavailable',
+        'database': banco,
+        'timestamp': datetime.now().isoformat(),
+    }), (200 if banco['ok'] else 503)
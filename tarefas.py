@@ -0,0 +1,348 @@
+from collections import namedtuple
+from datetime import date, timedelta
+
+from notificacoes import ouvinte, notificar
+from estatisticas import invalidar_estatisticas, limpar_estatisticas
+from cache_tarefas import cache as cache_tarefas
+from metricas import medir_fase
+from consultas import registrar
+
+COLUNAS = 'id, descricao, categoria, prioridade, prazo, concluida, data_criacao'
+
+# Listagem HTML: as datas já vêm formatadas pelo Postgres (to_char) e o
+# destaque de atrasada é calculado na consulta. As cinco primeiras colunas
+# seguem COLUNAS, então cursor_da_linha() funciona com as duas formas de linha.
+COLUNAS_TAREFA = (
+    "id, descricao, categoria, prioridade, prazo, concluida IS TRUE, "
+    "to_char(data_criacao, 'DD/MM/YYYY HH24:MI'), to_char(prazo, 'DD/MM/YYYY'), "
+    "concluida IS NOT TRUE AND coalesce(prazo < %(hoje)s, FALSE)"
+)
+
+# Registro usado pelos templates, montado direto da tupla do cursor
+# (Tarefa._make) na ordem de COLUNAS_TAREFA: sem dicionário por linha.
+# prazo é o texto exibido; prazo_data, a data original.
+Tarefa = namedtuple('Tarefa', 'id descricao categoria prioridade prazo_data concluida data_criacao prazo atrasada')
+
+FILTROS = {
+    'all': '',
+    'active': ' AND concluida = FALSE',
+    'completed': ' AND concluida = TRUE',
+    # Filtros de prazo: só pendentes, servidos pelo índice parcial idx_tarefas_prazo_pendentes
+    'overdue': ' AND concluida = FALSE AND prazo < %(hoje)s',
+    'today': ' AND concluida = FALSE AND prazo = %(hoje)s',
+    'week': ' AND concluida = FALSE AND prazo BETWEEN %(hoje)s AND %(fim_semana)s',
+}
+# Estes listam em ordem de prazo (o mais próximo primeiro) em vez de id DESC
+FILTROS_PRAZO = ('overdue', 'today', 'week')
+
+# Concluídas antigas ficam em tarefas_arquivadas (ver arquivamento.py). Os
+# filtros que podem mostrá-las leem a view tarefas_todas (tarefas UNION ALL
+# arquivo); os de pendentes leem só a tabela quente.
+TODAS = 'tarefas_todas'
+FILTROS_COM_ARQUIVO = ('all', 'completed')
+
+
+def fonte(filtro='all'):
+    """Tabela ou view que atende o filtro"""
+    return TODAS if filtro in FILTROS_COM_ARQUIVO else 'tarefas'
+
+CATEGORIAS = ('Trabalho', 'Estudo', 'Casa', 'Saúde', 'Lazer', 'Geral')
+PRIORIDADES = ('Baixa', 'Média', 'Alta', 'Urgente')
+
+TAMANHO_PAGINA_PADRAO = 50
+TAMANHO_PAGINA_MAXIMO = 200
+
+
+def tamanho_pagina(valor):
+    """Converte o parâmetro ?limit= em um tamanho de página válido"""
+    try:
+        limite = int(valor)
+    except (TypeError, ValueError):
+        return TAMANHO_PAGINA_PADRAO
+    return max(1, min(limite, TAMANHO_PAGINA_MAXIMO))
+
+
+def cursor_pagina(valor, filtro='all'):
+    """Converte o parâmetro ?before= em cursor de keyset ou None.
+
+    Nos filtros de prazo o cursor é 'AAAA-MM-DD_id' (prazo e id da última
+    tarefa vista); nos demais, só o id.
+    """
+    if filtro in FILTROS_PRAZO:
+        try:
+            prazo, id_ = str(valor).split('_')
+            return date.fromisoformat(prazo), int(id_)
+        except (TypeError, ValueError):
+            return None
+    try:
+        cursor = int(valor)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor > 0 else None
+
+
+def cursor_da_linha(row, filtro='all'):
+    """Cursor (?before=) que continua a listagem depois de `row`"""
+    id_, prazo = row[0], row[4]
+    if filtro in FILTROS_PRAZO:
+        return f'{prazo.isoformat()}_{id_}'
+    return id_
+
+
+def prazo_informado(valor):
+    """Converte o prazo recebido (AAAA-MM-DD, vazio ou None) em date ou None.
+
+    Levanta ValueError se o valor não for uma data válida.
+    """
+    if valor is None or isinstance(valor, date):
+        return valor
+    valor = str(valor).strip()
+    return date.fromisoformat(valor) if valor else None
+
+
+def _parametros_data(hoje=None):
+    hoje = hoje or date.today()
+    return {'hoje': hoje, 'fim_semana': hoje + timedelta(days=6 - hoje.weekday())}
+
+
+def tarefa_json(row):
+    """Converte uma linha de COLUNAS no dicionário devolvido pela API e pelo /debug-db"""
+    id_, descricao, categoria, prioridade, prazo, concluida, data_criacao = row
+    return {
+        'id': id_,
+        'descricao': descricao,
+        'categoria': categoria,
+        'prioridade': prioridade,
+        'prazo': prazo.isoformat() if prazo else None,
+        'concluida': bool(concluida),
+        'data_criacao': data_criacao.isoformat() if data_criacao else None,
+    }
+
+
+def _sql_pagina(filtro, com_cursor, colunas):
+    sql = f'SELECT {colunas} FROM {fonte(filtro)} WHERE user_id = %(user_id)s{FILTROS[filtro]}'
+    if filtro in FILTROS_PRAZO:
+        if com_cursor:
+            sql += ' AND (prazo, id) > (%(cursor_prazo)s, %(cursor_id)s)'
+        sql += ' ORDER BY prazo, id'
+    else:
+        if com_cursor:
+            sql += ' AND id < %(cursor_id)s'
+        sql += ' ORDER BY id DESC'
+    return sql + ' LIMIT %(limite)s'
+
+
+# Uma consulta preparada (ver consultas.py) por filtro, primeira página ou
+# seguinte, e forma das linhas (templates ou API)
+CONSULTAS_PAGINA = {
+    (filtro, com_cursor, colunas): registrar(
+        f'pagina_{filtro}{"_cursor" if com_cursor else ""}{"_api" if colunas == COLUNAS else ""}',
+        _sql_pagina(filtro, com_cursor, colunas))
+    for filtro in FILTROS for com_cursor in (False, True) for colunas in (COLUNAS_TAREFA, COLUNAS)
+}
+
+
+def consultar_pagina(conn, user_id, filtro='all', antes_de=None, limite=TAMANHO_PAGINA_PADRAO, hoje=None,
+                     colunas=COLUNAS):
+    """Busca as linhas de uma página de tarefas.
+
+    A paginação é por keyset: `antes_de` é o cursor da última tarefa da
+    página anterior (ver cursor_pagina). A ordem é id DESC, ou prazo e id
+    nos filtros de prazo. `colunas` é COLUNAS (linhas cruas, para a API) ou
+    COLUNAS_TAREFA. Retorna (rows, tem_proxima).
+    """
+    filtro = filtro if filtro in FILTROS else 'all'
+    params = {'user_id': user_id, **_parametros_data(hoje)}
+    if antes_de is not None:
+        if filtro in FILTROS_PRAZO:
+            params['cursor_prazo'], params['cursor_id'] = antes_de
+        else:
+            params['cursor_id'] = antes_de
+    # Busca uma linha a mais só para saber se existe próxima página
+    params['limite'] = limite + 1
+
+    with conn.cursor() as cur:
+        consulta = CONSULTAS_PAGINA.get((filtro, antes_de is not None, colunas))
+        if consulta is not None:
+            consulta.executar(cur, params)
+        else:
+            cur.execute(_sql_pagina(filtro, antes_de is not None, colunas), params)
+        rows = cur.fetchall()
+    return rows[:limite], len(rows) > limite
+
+
+def listar_tarefas(conn, user_id, filtro='all', antes_de=None, limite=TAMANHO_PAGINA_PADRAO, hoje=None):
+    """Retorna (tarefas, proximo_cursor) já formatadas para os templates.
+
+    proximo_cursor é None na última página.
+    """
+    rows, tem_proxima = consultar_pagina(conn, user_id, filtro, antes_de, limite, hoje, COLUNAS_TAREFA)
+    with medir_fase('format'):
+        tarefas = list(map(Tarefa._make, rows))
+    proximo_cursor = cursor_da_linha(rows[-1], filtro) if tem_proxima else None
+    return tarefas, proximo_cursor
+
+def consultar_tarefas_por_id(conn, user_id, ids, hoje=None):
+    """Tarefas do usuário com os ids informados, como Tarefa (ordem não garantida)"""
+    with conn.cursor() as cur:
+        cur.execute(f'SELECT {COLUNAS_TAREFA} FROM {TODAS} WHERE user_id = %(user_id)s AND id = ANY(%(ids)s)',
+                    {'user_id': user_id, 'ids': list(ids), **_parametros_data(hoje)})
+        return list(map(Tarefa._make, cur.fetchall()))
+
+
+def consultar_busca(conn, user_id, termo, filtro='all', pagina=1, limite=TAMANHO_PAGINA_PADRAO, hoje=None,
+                    colunas=COLUNAS):
+    """Busca textual (português) em descrição e categoria, por relevância.
+
+    Aceita a sintaxe do websearch_to_tsquery ("frase exata", -excluir, or).
+    A paginação é por número de página, já que a ordem por relevância não
+    tem uma chave estável para keyset. Retorna (rows, tem_proxima).
+    """
+    # O lexema do usuário (ver migração 3) entra na consulta do índice; o
+    # user_id = %s continua valendo para o caso de colisão do md5. Termos só
+    # com stopwords geram consulta vazia, que não deve casar com tudo.
+    sql = (f"SELECT {colunas} FROM {fonte(filtro)}, websearch_to_tsquery('portuguese', %(termo)s) consulta "
+           f"WHERE user_id = %(user_id)s{FILTROS.get(filtro, '')} AND numnode(consulta) > 0 "
+           "AND busca @@ (consulta && ('u' || md5(%(user_id)s))::tsquery) "
+           "ORDER BY ts_rank(busca, consulta) DESC, id DESC LIMIT %(limite)s OFFSET %(deslocamento)s")
+    params = {'termo': termo, 'user_id': user_id, 'limite': limite + 1,
+              'deslocamento': (pagina - 1) * limite, **_parametros_data(hoje)}
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    return rows[:limite], len(rows) > limite
+
+
+def buscar_tarefas(conn, user_id, termo, filtro='all', pagina=1, limite=TAMANHO_PAGINA_PADRAO, hoje=None):
+    """Retorna (tarefas, tem_proxima) da busca, já formatadas para os templates"""
+    rows, tem_proxima = consultar_busca(conn, user_id, termo, filtro, pagina, limite, hoje, COLUNAS_TAREFA)
+    with medir_fase('format'):
+        return list(map(Tarefa._make, rows)), tem_proxima
+
+def numero_pagina(valor):
+    """Converte o parâmetro ?page= da busca em um número de página válido"""
+    try:
+        pagina = int(valor)
+    except (TypeError, ValueError):
+        return 1
+    return max(1, min(pagina, 1000))
+
+
+# Alterações feitas pelas rotas de app.py. Cada uma recebe o cursor e não
+# faz commit: quem chama decide a transação (ver escritas.py).
+
+# Colunas copiadas entre tarefas e tarefas_arquivadas (busca é gerada nas duas)
+COLUNAS_ARQUIVO = 'id, user_id, descricao, categoria, prioridade, prazo, concluida_em, data_criacao'
+# Tarefas excluídas por transação em clear_completed
+LOTE_LIMPEZA = 1000
+
+INSERIR = registrar('inserir_tarefa',
+                    'INSERT INTO tarefas (user_id, descricao, categoria, prioridade, prazo) '
+                    'VALUES (%s, %s, %s, %s, %s) RETURNING id')
+DEFINIR_CONCLUSAO = registrar('definir_conclusao', 'UPDATE tarefas SET concluida = %s WHERE id = %s AND user_id = %s')
+EXCLUIR = registrar('excluir_tarefa', 'DELETE FROM tarefas WHERE id = %s AND user_id = %s')
+EXCLUIR_CONCLUIDAS = registrar('excluir_concluidas',
+                               'DELETE FROM tarefas WHERE id IN ('
+                               'SELECT id FROM tarefas WHERE user_id = %s AND concluida = TRUE LIMIT %s)')
+
+
+def inserir_tarefa(cur, user_id, descricao, categoria, prioridade, prazo):
+    """Insere a tarefa e retorna seu id"""
+    INSERIR.executar(cur, (user_id, descricao, categoria, prioridade, prazo))
+    id_ = cur.fetchone()[0]
+    notificar(cur, user_id, acao='alterada', ids=[id_])
+    return id_
+
+
+def definir_conclusao(cur, user_id, task_id, concluida):
+    """Marca a tarefa como concluída ou pendente; False se ela não existe"""
+    DEFINIR_CONCLUSAO.executar(cur, (concluida, task_id, user_id))
+    if cur.rowcount == 0:
+        if concluida:
+            # Arquivada já está concluída: nada muda
+            cur.execute('SELECT 1 FROM tarefas_arquivadas WHERE user_id = %s AND id = %s', (user_id, task_id))
+            return cur.fetchone() is not None
+        if not restaurar_arquivadas(cur, user_id, [task_id]):
+            return False
+        DEFINIR_CONCLUSAO.executar(cur, (False, task_id, user_id))
+    notificar(cur, user_id, acao='alterada', ids=[task_id])
+    return True
+
+
+def excluir_tarefa(cur, user_id, task_id):
+    EXCLUIR.executar(cur, (task_id, user_id))
+    if cur.rowcount == 0:
+        excluir_arquivadas(cur, user_id, [task_id])
+    notificar(cur, user_id, acao='removida', ids=[task_id])
+
+
+def excluir_concluidas(cur, user_id, lote=None):
+    """Exclui até `lote` concluídas do usuário (quentes e arquivadas); retorna quantas.
+
+    A rota chama em transações separadas até voltar menos que `lote`, para
+    não segurar locks nem gerar um DELETE enorme de uma vez.
+    """
+    lote = lote or LOTE_LIMPEZA
+    EXCLUIR_CONCLUIDAS.executar(cur, (user_id, lote))
+    excluidas = cur.rowcount
+    if excluidas < lote:
+        excluidas += len(_tirar_do_arquivo(cur, user_id, 'LIMIT %(lote)s', {'lote': lote - excluidas}))
+    if excluidas:
+        notificar(cur, user_id, acao='limpas')
+    return excluidas
+
+
+def _tirar_do_arquivo(cur, user_id, condicao, params, restaurar=False):
+    """Remove do arquivo as tarefas do usuário que atendem `condicao`,
+    descontando contagem_arquivadas; com restaurar=True elas voltam para
+    tarefas (mesmo id, ainda concluídas). Retorna os ids."""
+    destino = (f'INSERT INTO tarefas ({COLUNAS_ARQUIVO}, concluida) '
+               f'SELECT {COLUNAS_ARQUIVO}, TRUE FROM removidas RETURNING id' if restaurar
+               else 'SELECT id FROM removidas')
+    cur.execute(f'''
+        WITH removidas AS (
+            DELETE FROM tarefas_arquivadas WHERE user_id = %(user_id)s AND id IN (
+                SELECT id FROM tarefas_arquivadas WHERE user_id = %(user_id)s {condicao})
+            RETURNING {COLUNAS_ARQUIVO}
+        ), descontadas AS (
+            UPDATE contagem_arquivadas c SET total = c.total - r.n
+            FROM (SELECT coalesce(categoria, 'Geral') AS categoria, coalesce(prioridade, 'Média') AS prioridade,
+                         count(*) AS n
+                  FROM removidas GROUP BY 1, 2) r
+            WHERE c.user_id = %(user_id)s AND c.categoria = r.categoria AND c.prioridade = r.prioridade
+        )
+        {destino}
+    ''', {'user_id': user_id, **params})
+    ids = [row[0] for row in cur.fetchall()]
+    if ids:
+        cur.execute('DELETE FROM contagem_arquivadas WHERE user_id = %s AND total <= 0', (user_id,))
+    return ids
+
+
+def restaurar_arquivadas(cur, user_id, ids):
+    """Traz de volta para tarefas as arquivadas entre `ids` (para alterá-las); retorna os ids"""
+    return _tirar_do_arquivo(cur, user_id, 'AND id = ANY(%(ids)s)', {'ids': list(ids)}, restaurar=True)
+
+
+def excluir_arquivadas(cur, user_id, ids):
+    """Exclui as arquivadas entre `ids`; retorna os ids"""
+    return _tirar_do_arquivo(cur, user_id, 'AND id = ANY(%(ids)s)', {'ids': list(ids)})
+
+
+def invalidar_caches(user_id):
+    """Descarta os dados em cache do usuário após uma alteração nas tarefas"""
+    invalidar_estatisticas(user_id)
+    cache_tarefas.invalidar(user_id)
+
+
+def _ao_alterar_tarefas(evento):
+    """Recebe os avisos de alteração enviados por qualquer worker"""
+    if evento is None:
+        # Avisos podem ter se perdido: nada do que está em cache é confiável
+        limpar_estatisticas()
+        cache_tarefas.limpar()
+    else:
+        invalidar_caches(evento['user_id'])
+
+
+ouvinte.assinar(_ao_alterar_tarefas)
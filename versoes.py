@@ -0,0 +1,87 @@
+"""Versão do conteúdo de cada usuário e ETag das páginas.
+
+Toda alteração nas tarefas passa por notificar() (notificacoes.py), que na
+mesma transação incrementa a versão do usuário em versoes_conteudo. As
+páginas que dependem só das tarefas do usuário (/, os filtros e
+/meu-perfil) usam essa versão, a data, a URL e a versão do próprio app
+para montar um ETag forte: se o navegador já tem aquela página, a resposta
+é 304 sem ler as tarefas nem renderizar o template.
+
+A versão é lida do banco a cada requisição (uma consulta por chave
+primária), e não de cache local: após uma alteração o redirect pode cair
+em outro worker antes de o aviso chegar lá, e um 304 com a página antiga
+esconderia a tarefa recém-criada.
+"""
+import os
+import hashlib
+import logging
+
+from flask import request
+
+from consultas import registrar
+
+logger = logging.getLogger(__name__)
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+
+
+INCREMENTAR_VERSAO = registrar('incrementar_versao', '''
+    INSERT INTO versoes_conteudo (user_id, versao) VALUES (%s, 1)
+    ON CONFLICT (user_id) DO UPDATE
+    SET versao = versoes_conteudo.versao + 1, alterado_em = CURRENT_TIMESTAMP
+    RETURNING versao
+''')
+VERSAO_CONTEUDO = registrar('versao_conteudo', 'SELECT versao FROM versoes_conteudo WHERE user_id = %s')
+
+
+def incrementar_versao(cur, user_id):
+    """Incrementa a versão do usuário dentro da transação corrente e a retorna"""
+    INCREMENTAR_VERSAO.executar(cur, (user_id,))
+    return cur.fetchone()[0]
+
+
+def versao_conteudo(conn, user_id):
+    """Versão atual do conteúdo do usuário (0 se ele nunca alterou nada)"""
+    with conn.cursor() as cur:
+        VERSAO_CONTEUDO.executar(cur, (user_id,))
+        row = cur.fetchone()
+    conn.rollback()
+    return row[0] if row else 0
+
+
+def _versao_do_app():
+    """Hash do código e dos templates: um deploy novo muda todos os ETags"""
+    resumo = hashlib.sha1(os.environ.get('FLY_IMAGE_REF', '').encode())
+    for pasta, extensao in ((RAIZ, '.py'), (os.path.join(RAIZ, 'templates'), '.html')):
+        try:
+            nomes = sorted(nome for nome in os.listdir(pasta) if nome.endswith(extensao))
+        except OSError:
+            continue
+        for nome in nomes:
+            with open(os.path.join(pasta, nome), 'rb') as arquivo:
+                resumo.update(nome.encode())
+                resumo.update(arquivo.read())
+    return resumo.hexdigest()[:12]
+
+
+VERSAO_APP = _versao_do_app()
+
+
+def etag_pagina(user_id, versao, *extras):
+    """ETag da página atual (caminho + query string) para o usuário nessa versão"""
+    chave = '|'.join(map(str, (VERSAO_APP, user_id, versao, request.full_path, *extras)))
+    return hashlib.sha1(chave.encode()).hexdigest()[:20]
+
+
+def etag_em_cache(etag):
+    """Forma do ETag que o navegador já tem desta página, ou None.
+
+    A representação comprimida leva o sufixo -gzip (ver compressao.py); as
+    duas formas valem, já que o conteúdo é o mesmo, e o 304 deve repetir a
+    que o navegador enviou.
+    """
+    enviados = request.if_none_match
+    for forma in (etag, f'{etag}-gzip'):
+        if forma in enviados:
+            return forma
+    return None